@@ -0,0 +1,30 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pacemaker alert agent notifying Masakari Host Monitor of cib changes.
+
+The recipient of the alert is the path of the socket hostmonitor listens
+on, see [host]cib_event_socket.
+"""
+
+import os
+
+from masakarimonitors.hostmonitor.host_handler import cib_events
+
+
+def main():
+    path = os.environ.get('CRM_alert_recipient') or \
+        cib_events.DEFAULT_SOCKET_PATH
+    cib_events.send_alert(path, os.environ)
+    # Pacemaker logs a failure of the agent, while a missed notification
+    # is caught up by the next poll of hostmonitor.
+    return 0
@@ -0,0 +1,273 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import threading
+
+import eventlet
+from eventlet import tpool
+import libvirt
+from oslo_log import log as oslo_logging
+
+from masakarimonitors.common import libvirt_event_loop
+import masakarimonitors.conf
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+# Seconds to wait before the first attempt to reconnect to libvirt.
+RECONNECT_INTERVAL = 1
+# Seconds between the checks of the connection, in case libvirt didn't call
+# the close callback.
+CONNECTION_CHECK_INTERVAL = 30
+
+
+def _connect_auth_cb(creds, user_data):
+    if len(creds) == 0:
+        return 0
+    raise Exception("Can not handle authentication request for %d "
+                    "credentials" % len(creds))
+
+
+class LibvirtEventBus(object):
+    """libvirt connection and event loop shared by the instance monitors.
+
+    The monitors subscribe their domain event callbacks by libvirt event
+    id. Every event id is registered once on the connection, and its
+    events are passed to the callbacks of all the subscribers, so that
+    the monitors run in one process share a single connection and event
+    loop. The connect hooks are called with the connection every time it
+    is opened, after the events are registered.
+
+    The connection is read-only unless a subscriber needs a read-write
+    one. It is reopened when libvirt reports it closed or it is not
+    alive, from 1 second after the loss, doubled after every failed
+    attempt up to ``[libvirt]reconnect_max_interval`` seconds.
+    """
+
+    def __init__(self):
+        self.handlers = collections.OrderedDict()
+        self.connect_hooks = []
+        self.read_only = True
+        self.connection = None
+        self.running = False
+        # This keeps track of what thread is running the event loop,
+        # (if it is run in a background thread)
+        self.event_loop_thread = None
+        # Set by libvirt when the connection is closed.
+        self.connection_closed = threading.Event()
+        # asyncio event loop, and event set on it to wake up the connection
+        # handling, with [libvirt]event_loop = asyncio.
+        self.event_loop = None
+        self.wakeup = None
+        self.wakeup_loop = None
+
+    def subscribe(self, handlers, on_connect=None, read_only=True):
+        """Subscribe to libvirt domain events.
+
+        :param handlers: dictionary of the callbacks by libvirt domain
+            event id, called with the arguments of the libvirt callbacks.
+        :param on_connect: function called with the connection every time
+            it is opened.
+        :param read_only: False if the subscriber needs a read-write
+            connection.
+        """
+        for event, callback in handlers.items():
+            self.handlers.setdefault(event, []).append(callback)
+        if on_connect is not None:
+            self.connect_hooks.append(on_connect)
+        self.read_only = self.read_only and read_only
+
+    def get_connection(self):
+        """Get the connection to libvirt, None while disconnected."""
+        return self.connection
+
+    def _fan_out(self, event):
+        callbacks = self.handlers[event]
+
+        def _callback(*args):
+            for callback in callbacks:
+                try:
+                    callback(*args)
+                except Exception:
+                    LOG.exception("Failed to handle libvirt event %s.", event)
+        return _callback
+
+    def _vir_event_loop_native_run(self):
+        # Directly run the event loop in the current thread
+        while True:
+            libvirt.virEventRunDefaultImpl()
+
+    def _vir_event_loop_native_start(self):
+        libvirt.virEventRegisterDefaultImpl()
+        self.event_loop_thread = threading.Thread(
+            target=self._vir_event_loop_native_run,
+            name="lib_virt_eventLoop")
+        self.event_loop_thread.daemon = True
+        self.event_loop_thread.start()
+
+    def _close_callback(self, conn, reason, opaque):
+        LOG.warning("Libvirt connection closed, reason %s.", reason)
+        self.connection_closed.set()
+        self._wake()
+
+    def _wake(self):
+        # The close callback and stop may come from any thread, including
+        # the executor connecting to libvirt.
+        if self.wakeup is not None:
+            self.wakeup_loop.call_soon_threadsafe(self.wakeup.set)
+
+    def run(self, uri):
+        """Connect to libvirt and dispatch the events until stopped."""
+        self.running = True
+        if CONF.libvirt.event_loop == libvirt_event_loop.ASYNCIO:
+            # Run the event loop and the connection handling on asyncio.
+            self.event_loop = libvirt_event_loop.AsyncioEventLoop(
+                "lib_virt_eventLoop")
+            self.event_loop.start()
+            self.event_loop.run(self._run_async(uri))
+            return
+
+        # Run a background thread with the event loop
+        self._vir_event_loop_native_start()
+
+        # Connect to libvirt - If be disconnected, reprocess.
+        reconnect_interval = RECONNECT_INTERVAL
+        while self.running:
+            try:
+                vc, callback_ids = self._connect(uri)
+            except libvirt.libvirtError as e:
+                LOG.warning("Failed to connect to libvirt, retrying in"
+                            " %(interval)s seconds: %(error)s",
+                            {'interval': reconnect_interval, 'error': e})
+                eventlet.greenthread.sleep(reconnect_interval)
+                reconnect_interval = min(
+                    reconnect_interval * 2,
+                    CONF.libvirt.reconnect_max_interval)
+                continue
+            reconnect_interval = RECONNECT_INTERVAL
+
+            # Connection monitoring. libvirt calls the close callback when
+            # the keepalive fails or libvirtd closes the connection, the
+            # connection is only checked in case it was missed.
+            while self.running and vc.isAlive() == 1:
+                if self._wait_closed(CONNECTION_CHECK_INTERVAL):
+                    break
+
+            self._disconnect(vc, callback_ids)
+            del vc
+            if self.running:
+                eventlet.greenthread.sleep(reconnect_interval)
+
+    def _wait_closed(self, timeout):
+        # The close callback is called from the event loop thread, so the
+        # event is waited for in a native thread, and the other greenthreads
+        # keep running meanwhile.
+        return tpool.execute(self.connection_closed.wait, timeout)
+
+    async def _run_async(self, uri):
+        # Same as the native connection handling, but waiting for the
+        # close callback or stop instead of polling the connection. The
+        # blocking libvirt calls and the connect hooks run in the default
+        # executor so that they do not stall the libvirtaio callbacks.
+        loop = asyncio.get_running_loop()
+        self.wakeup_loop = loop
+        self.wakeup = asyncio.Event()
+        reconnect_interval = RECONNECT_INTERVAL
+        while self.running:
+            try:
+                vc, callback_ids = await loop.run_in_executor(
+                    None, self._connect, uri)
+            except libvirt.libvirtError as e:
+                LOG.warning("Failed to connect to libvirt, retrying in"
+                            " %(interval)s seconds: %(error)s",
+                            {'interval': reconnect_interval, 'error': e})
+                await self._wait(reconnect_interval)
+                reconnect_interval = min(
+                    reconnect_interval * 2,
+                    CONF.libvirt.reconnect_max_interval)
+                continue
+            reconnect_interval = RECONNECT_INTERVAL
+
+            if self.running and not self.connection_closed.is_set():
+                await self._wait()
+
+            await loop.run_in_executor(
+                None, self._disconnect, vc, callback_ids)
+            del vc
+            if self.running:
+                await self._wait(reconnect_interval)
+
+    async def _wait(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    def _connect(self, uri):
+        auth = [[libvirt.VIR_CRED_AUTHNAME,
+                 libvirt.VIR_CRED_ECHOPROMPT,
+                 libvirt.VIR_CRED_REALM,
+                 libvirt.VIR_CRED_PASSPHRASE,
+                 libvirt.VIR_CRED_NOECHOPROMPT,
+                 libvirt.VIR_CRED_EXTERNAL],
+                _connect_auth_cb,
+                None]
+        flags = libvirt.VIR_CONNECT_RO if self.read_only else 0
+
+        vc = libvirt.openAuth(uri, auth, flags)
+        self.connection_closed.clear()
+        vc.registerCloseCallback(self._close_callback, None)
+
+        # Event callback settings
+        callback_ids = []
+        for event in self.handlers:
+            cid = vc.domainEventRegisterAny(None, event,
+                                            self._fan_out(event), None)
+            callback_ids.append(cid)
+
+        # The events are registered before the hooks look at the
+        # domains, so that no change is missed.
+        for hook in self.connect_hooks:
+            try:
+                hook(vc)
+            except libvirt.libvirtError as e:
+                LOG.warning("Failed to list the libvirt domains: %s", e)
+
+        vc.setKeepAlive(5, 3)
+        self.connection = vc
+        return vc, callback_ids
+
+    def _disconnect(self, vc, callback_ids):
+        # If connection between libvirtd was lost,
+        # clear callback connection.
+        LOG.warning("Libvirt Connection Closed Unexpectedly.")
+        self.connection = None
+        for cid in callback_ids:
+            try:
+                vc.domainEventDeregisterAny(cid)
+            except Exception:
+                LOG.debug("Failed to deregister libvirt event "
+                          "callback %s.", cid, exc_info=True)
+        try:
+            vc.unregisterCloseCallback()
+        except Exception:
+            LOG.debug("Failed to unregister libvirt close callback.",
+                      exc_info=True)
+        vc.close()
+
+    def stop(self):
+        self.running = False
+        self.connection_closed.set()
+        self._wake()
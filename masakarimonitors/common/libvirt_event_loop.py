@@ -0,0 +1,74 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+from eventlet import patcher
+from eventlet import tpool
+from oslo_log import log as oslo_logging
+
+LOG = oslo_logging.getLogger(__name__)
+
+NATIVE = 'native'
+ASYNCIO = 'asyncio'
+
+
+class AsyncioEventLoop(object):
+    """libvirt event loop run by an asyncio loop.
+
+    libvirt's event implementation is registered on an asyncio loop with
+    libvirtaio, and the loop runs in a native thread. The libvirt file
+    descriptors and timers are dispatched by the loop selector, so the
+    thread only wakes up when libvirt has something to do. The connection
+    handling of a monitor runs as a coroutine on the same loop, so that
+    the libvirt callbacks, the close callback and the reconnections share
+    a single thread, without polling the connection.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        """Register libvirt's event implementation and run the loop.
+
+        :raises ImportError: if libvirt-python doesn't provide libvirtaio.
+        """
+        import libvirtaio
+
+        self.loop = asyncio.new_event_loop()
+        libvirtaio.virEventRegisterAsyncIOImpl(loop=self.loop)
+        # A native thread even if threading is monkey patched, as the loop
+        # blocks in its selector.
+        self.thread = patcher.original('threading').Thread(
+            target=self._run, name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        LOG.info("Running the libvirt event loop on asyncio.")
+        self.loop.run_forever()
+
+    def run(self, coro):
+        """Run a coroutine on the loop and wait for its result.
+
+        The result is waited for in a native thread, so that the other
+        greenthreads keep running meanwhile.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return tpool.execute(future.result)
+
+    def call_soon(self, func, *args):
+        """Call a function on the loop from another thread."""
+        self.loop.call_soon_threadsafe(func, *args)
@@ -34,6 +34,126 @@ monitor_api_opts = [
                default='public',
                choices=('public', 'internal', 'admin'),
                help='Interface of endpoint.'),
+    cfg.BoolOpt('client_prewarm',
+                default=False,
+                help='''
+Authenticate and resolve the endpoint of the masakari-api when the monitor
+starts, and refresh the token before it expires, so that the first
+notification doesn't wait for Keystone. The time taken is logged, as the time
+taken by the first notification.
+'''),
+    cfg.IntOpt('api_retry_max_interval',
+               default=0,
+               min=0,
+               help='''
+Maximum interval in seconds between the retries of a notification. When set,
+the retry interval of the monitor doubles for each retry up to this maximum,
+with a random jitter, so that concurrent notifications don't retry in
+lock-step. With the default of 0, the retry interval is fixed.
+'''),
+    cfg.IntOpt('circuit_breaker_failures',
+               default=0,
+               min=0,
+               help='''
+Number of consecutive failed calls to the masakari-api after which the circuit
+breaker shared by the notifications of a monitor opens. While it is open, the
+notifications wait instead of calling the masakari-api, and a single probe
+call decides whether it closes. 0 disables the circuit breaker.
+'''),
+    cfg.IntOpt('circuit_breaker_timeout',
+               default=10,
+               min=1,
+               help='''
+Time in seconds the circuit breaker stays open before a probe call. It doubles
+every time the probe fails.
+'''),
+    cfg.IntOpt('circuit_breaker_max_timeout',
+               default=300,
+               min=1,
+               help='''
+Maximum time in seconds the circuit breaker stays open before a probe call.
+'''),
+    cfg.IntOpt('notification_workers',
+               default=0,
+               min=0,
+               help='''
+Number of threads sending the notifications in the background.
+
+With the default of 0, the notifications are sent synchronously, and a
+monitor stops monitoring while a notification is sent and retried. Otherwise
+they are queued, and the monitors keep monitoring while the masakari-api is
+slow or unreachable.
+'''),
+    cfg.IntOpt('notification_queue_size',
+               default=1000,
+               min=1,
+               help='''
+Maximum number of notifications queued or being retried when
+notification_workers is set. The notifications beyond are dropped.
+'''),
+    cfg.IntOpt('notification_stats_interval',
+               default=0,
+               min=0,
+               help='''
+Interval in seconds to log the depth of the notification queue, the age of its
+oldest notification, and the number of notifications sent, rejected, retried,
+failed and dropped. 0 disables it.
+'''),
+    cfg.FloatOpt('notification_coalesce_window',
+                 default=0,
+                 min=0,
+                 help='''
+Time in seconds the notifications about the same host, instance or process
+are held from the first one to be coalesced. Of the notifications held, only
+the most significant one and the last one are sent. 0 sends every
+notification at once.
+'''),
+    cfg.IntOpt('notification_duplicate_ttl',
+               default=0,
+               min=0,
+               help='''
+Time in seconds during which a notification identical, except for its
+generated time, to the last one the masakari-api answered about the same host,
+instance or process is dropped. 0 disables it.
+'''),
+    cfg.DictOpt('notification_rate_limits',
+                default={},
+                help='''
+Maximum rate in notifications per second at which the notifications of a type
+are sent, e.g. "VM:10,PROCESS:5". The notifications are delayed to not exceed
+it. It requires notification_workers, which also send the COMPUTE_HOST
+notifications before the PROCESS notifications and the PROCESS notifications
+before the VM notifications.
+'''),
+    cfg.IntOpt('notification_rate_burst',
+               default=10,
+               min=1,
+               help='''
+Number of notifications of a rate limited type which may be sent at once
+before they are delayed.
+'''),
+    cfg.StrOpt('notification_spool_dir',
+               help='''
+Directory of the spool recording the notifications before they are sent, in a
+sub directory named after the monitor. The notifications the masakari-api
+didn't answer, because the monitor stopped or the retries were exhausted, are
+sent again on the next start. By default, the notifications are not recorded.
+'''),
+    cfg.IntOpt('notification_spool_segment_size',
+               default=1048576,
+               min=4096,
+               help='''
+Size in bytes above which a new segment file of the notification spool is
+started. The segments whose notifications were all answered are deleted.
+'''),
+    cfg.FloatOpt('notification_spool_fsync_interval',
+                 default=0.1,
+                 min=0,
+                 help='''
+Maximum interval in seconds between the fsyncs of the notification spool. The
+notifications of the last interval may be lost on a crash of the host, but not
+on a crash of the monitor. 0 fsyncs every notification.
+'''),
 ]
 
 
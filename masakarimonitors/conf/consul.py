@@ -24,6 +24,12 @@ consul_opts = [
                help='Addr for local consul agent in storage datacenter.'),
     cfg.StrOpt('matrix_config_file',
                help='Config file for consul health action matrix.'),
+    cfg.StrOpt('lock_key',
+               default='masakari/hostmonitor/notifier',
+               help='Key of the lock held by the designated notifier when'
+                    ' [host]designated_notifier is enabled. The lock is'
+                    ' taken in the first consul cluster of the sequence'
+                    ' of the matrix config file.'),
 ]
 
 
@@ -20,7 +20,13 @@ monitor_host_opts = [
                help='Driver that hostmonitor uses for monitoring hosts.'),
     cfg.IntOpt('monitoring_interval',
                default=60,
-               help='Monitoring interval(in seconds) of node status.'),
+               help='''
+Monitoring interval(in seconds) of node status.
+
+The monitoring cycles start every ``monitoring_interval`` seconds whatever
+time they take. If a cycle takes longer, the cycles which should have
+started meanwhile are skipped and a warning is logged.
+'''),
     cfg.IntOpt('monitoring_samples',
                default=1,
                help='''
@@ -29,6 +35,102 @@ notification about the node status. If and only if ``monitoring_samples``
 consecutive reports have the same status, will the Masakari notification
 be sent.
 '''),
+    cfg.StrOpt('stabilisation_policy',
+               default='consecutive',
+               choices=('consecutive', 'phi_accrual'),
+               help='''
+Policy deciding the status of a host from its monitoring samples.
+
+Possible values:
+
+* consecutive: The status of a host changes when its latest
+  ``monitoring_samples`` samples are the same.
+* phi_accrual: In addition, the intervals at which a host is seen in its
+  current status are learnt, and the status changes as soon as the
+  suspicion level phi of the current status, computed from the time since
+  it was last seen, reaches ``phi_threshold``. A host seen in the same
+  status every monitoring cycle is then declared changed after two
+  samples, before ``monitoring_samples`` samples, while a host whose
+  samples often differ needs more evidence.
+'''),
+    cfg.FloatOpt('phi_threshold',
+                 default=8.0,
+                 min=0.1,
+                 help='Suspicion level phi at which the status of a host'
+                      ' changes with the phi_accrual stabilisation policy.'
+                      ' A phi of 8 means a 1e-8 probability that the'
+                      ' current status is wrongly suspected.'),
+    cfg.IntOpt('phi_window',
+               default=100,
+               min=3,
+               help='Number of the latest intervals per host learnt by the'
+                    ' phi_accrual stabilisation policy.'),
+    cfg.BoolOpt('designated_notifier',
+                default=False,
+                help='''
+Only let one hostmonitor of the cluster send the notifications and check
+the power status of the failed hosts. The other hostmonitors keep
+monitoring, and the status changes they observe are sent if one of them
+becomes the designated notifier before the host status changes back.
+
+The designated notifier is:
+
+* pacemaker driver: the hostmonitor of the DC. Every full member of the
+  cluster must run a hostmonitor.
+* kubernetes driver: the holder of the ``[kubernetes]lease_name`` Lease.
+* consul driver: the holder of the ``[consul]lock_key`` lock.
+'''),
+    cfg.IntOpt('designated_notifier_ttl',
+               default=180,
+               min=10,
+               max=86400,
+               help='Time(in seconds) after which the kubernetes Lease or'
+                    ' consul lock of a designated notifier which stopped'
+                    ' renewing it is taken over. It is renewed every'
+                    ' monitoring cycle, so it must be greater than'
+                    ' monitoring_interval.'),
+    cfg.FloatOpt('storm_guard_threshold',
+                 default=0.0,
+                 min=0.0,
+                 max=1.0,
+                 help='''
+Fraction of the monitored hosts above which the hosts going down are
+considered a notification storm, e.g. because this host is isolated or a
+whole rack failed, rather than hosts to evacuate. The failing hosts are
+the hosts which went down in a monitoring cycle and the hosts notified down
+within the last ``storm_guard_window`` seconds. During a storm, no down
+notification is sent, see ``storm_guard_action``, and a single error is
+logged. 0 disables the guard.
+'''),
+    cfg.IntOpt('storm_guard_window',
+               default=300,
+               min=0,
+               help='Time(in seconds) during which a host notified down'
+                    ' counts as failing for the notification storm guard.'),
+    cfg.IntOpt('storm_guard_min_hosts',
+               default=2,
+               min=1,
+               help='Minimum number of failing hosts for a notification'
+                    ' storm.'),
+    cfg.StrOpt('storm_guard_action',
+               default='hold',
+               choices=('hold', 'suppress'),
+               help='''
+What to do with the down notifications during a notification storm.
+
+Possible values:
+
+* hold: The notifications are sent in a later monitoring cycle, once the
+  failing hosts are below the threshold, if the hosts are still down.
+* suppress: The notifications are never sent.
+'''),
+    cfg.IntOpt('cycle_stats_interval',
+               default=0,
+               min=0,
+               help='Interval(in seconds) at which the number of monitoring'
+                    ' cycles, overruns and skipped cycles, and the 50th,'
+                    ' 90th and 99th percentiles of the cycle durations are'
+                    ' logged. 0 disables it.'),
     cfg.IntOpt('api_retry_max',
                default=12,
                help='Number of retries for send a notification in'
@@ -53,6 +155,64 @@ If ipmi RA is not set in pacemaker, this value should be set True.
                default=False,
                help='Only monitor pacemaker-remotes, ignore the status of'
                     ' full cluster members.'),
+    cfg.StrOpt('cluster_query_scope',
+               default='full',
+               choices=('full', 'minimal'),
+               help='''
+Scope of the pacemaker queries run every monitoring cycle.
+
+Possible values:
+
+* full: Query the whole cib with ``cibadmin --query`` or the whole cluster
+  state with ``crm_mon -X``.
+* minimal: Query only the cib tag and, when the cib changed, its status
+  section. The resources section needed for the ipmi check is queried only
+  when a host goes down and is cached until the cib configuration changes.
+  With ``restrict_to_remotes``, only the DC and nodes sections of the
+  ``crm_mon`` xml output are queried. This requires pacemaker 2.0.3 or
+  later.
+'''),
+    cfg.BoolOpt('log_cluster_query_stats',
+                default=False,
+                help='Log the number of bytes fetched by the pacemaker'
+                     ' queries and the time spent parsing them in every'
+                     ' monitoring cycle. With the single_pass probe mode,'
+                     ' the time taken by every probe of the cycle is logged'
+                     ' too.'),
+    cfg.StrOpt('probe_mode',
+               default='sequential',
+               choices=('sequential', 'single_pass'),
+               help='''
+How the pacemaker probes of a monitoring cycle are run.
+
+Possible values:
+
+* sequential: Check the pacemaker services with ``systemctl status``, the
+  corosync communication, the state of this host with ``crmadmin -S`` and
+  then the node states with ``cibadmin --query`` or ``crm_mon -X``, one
+  after another.
+* single_pass: Query the DC, the quorum and the node states at once with
+  ``crm_mon``, while the corosync communication is checked concurrently.
+  This host is considered stable when it is online, neither pending nor
+  unclean, and a DC is elected. The pacemaker services detected with
+  ``pacemaker_node_type = autodetect`` are cached for
+  ``pacemaker_service_cache_ttl`` seconds. The time taken by every probe
+  is recorded, see ``log_cluster_query_stats``.
+'''),
+    cfg.StrOpt('xml_parser_backend',
+               default='etree',
+               choices=('etree', 'lxml'),
+               help='''
+Backend used to parse the cib and crm_mon xml.
+
+Possible values:
+
+* etree: Build the whole xml tree with ``xml.etree.ElementTree``.
+* lxml: Stream-parse the xml with ``lxml.etree.iterparse``, keeping only
+  the attributes of the node states, the quorum and DC information and,
+  when present, the resources section. Elements are freed as soon as they
+  are parsed, which lowers the memory used on large clusters.
+'''),
     cfg.IntOpt('ipmi_timeout',
                default=5,
                help='Timeout value(in seconds) of the ipmitool command.'),
@@ -62,6 +222,71 @@ If ipmi RA is not set in pacemaker, this value should be set True.
     cfg.IntOpt('ipmi_retry_interval',
                default=10,
                help='Retry interval(in seconds) of the ipmitool command.'),
+    cfg.StrOpt('power_check_backend',
+               default='ipmitool',
+               choices=('ipmitool', 'redfish'),
+               help='''
+Backend used to check whether a host which went offline is powered off.
+
+Possible values:
+
+* ipmitool: Run the ``ipmitool power status`` command.
+* redfish: Query the ``PowerState`` of the system through the Redfish API
+  of the BMC. HTTP sessions and authentication tokens are kept per BMC
+  and reused across checks. The ``ipaddr`` param of the ipmi RA is used as
+  the address of the BMC, and may be an URL like
+  ``http://192.168.10.20:8000``.
+
+The ipmi RA params and the ``ipmi_timeout``, ``ipmi_retry_max`` and
+``ipmi_retry_interval`` options are used by both backends.
+'''),
+    cfg.StrOpt('redfish_verify',
+               default='True',
+               help='''
+Whether to verify the TLS certificate of the BMCs with the redfish power
+check backend.
+
+Either a boolean, or a path to a CA bundle used to verify the certificates.
+'''),
+    cfg.IntOpt('ipmi_check_workers',
+               default=10,
+               min=1,
+               help='''
+Maximum number of hosts whose power status is checked with ipmitool at the
+same time.
+
+When several hosts go offline in the same monitoring cycle, their power
+status is checked concurrently and the notification of each host is sent
+as soon as its check completes.
+'''),
+    cfg.IntOpt('ipmi_check_deadline',
+               default=0,
+               min=0,
+               help='''
+Maximum time(in seconds) spent checking the power status of a host,
+including the ipmitool command retries.
+
+If the check doesn't complete in time, the host status is notified as
+unknown. 0 means no deadline.
+
+The check runs in a native thread of the eventlet thread pool, which cannot
+be interrupted. When the deadline is exceeded, the command or request in
+progress keeps running, and holding its thread, until it returns or
+``ipmi_timeout`` expires. The number of threads of the pool is set by the
+``EVENTLET_THREADPOOL_SIZE`` environment variable, 20 by default, and
+should be greater than ``ipmi_check_workers``.
+'''),
+    cfg.IntOpt('ipmi_check_cache_ttl',
+               default=0,
+               min=0,
+               help='''
+Time(in seconds) during which the result of the power status check of a
+host is reused.
+
+This avoids running ipmitool again for hosts that flap. Only 'power off'
+results are cached, and they are discarded as soon as the host is seen
+online. 0 disables the cache.
+'''),
     cfg.IntOpt('stonith_wait',
                default=30,
                help='Standby time(in seconds) until activate STONITH.'),
@@ -69,6 +294,27 @@ If ipmi RA is not set in pacemaker, this value should be set True.
                default=5,
                help='Timeout value(in seconds) of the tcpdump command when'
                     ' monitors the corosync communication.'),
+    cfg.StrOpt('corosync_heartbeat_check',
+               default='tcpdump',
+               choices=('tcpdump', 'sniffer'),
+               help='''
+Method used to check whether the corosync communication is normal.
+
+Possible values:
+
+* tcpdump: Run tcpdump on each interface every monitoring cycle.
+* sniffer: Keep a passive listener on each interface and only compare the
+  time the last corosync packet was seen against
+  ``corosync_heartbeat_staleness``. This requires the CAP_NET_RAW
+  capability. If the listener cannot be started, hostmonitor falls back to
+  tcpdump.
+'''),
+    cfg.IntOpt('corosync_heartbeat_staleness',
+               default=5,
+               min=1,
+               help='Maximum age(in seconds) of the last corosync packet'
+                    ' seen by the sniffer for the corosync communication'
+                    ' to be considered normal.'),
     cfg.ListOpt('corosync_multicast_interfaces',
                 help='''
 The name of interface that corosync is using for mutual communication
@@ -100,6 +346,54 @@ stack) or Pacemaker Remote (the ``remote`` stack).
 
 The default (``autodetect``) ensures backward compatibility and means systemd
 is used to check the stack.
+'''),
+    cfg.StrOpt('monitoring_mode',
+               default='poll',
+               choices=('poll', 'event'),
+               help='''
+How the pacemaker based hostmonitor decides to check the cluster state.
+
+Possible values:
+
+* poll: Check the cluster state every ``monitoring_interval`` seconds.
+* event: Check the cluster state as soon as the
+  ``masakari-hostmonitor-alert`` pacemaker alert agent reports a node,
+  fencing or resource change, and every ``monitoring_interval`` seconds
+  while the status of a host is not stabilised. Otherwise the cluster
+  state is checked every ``cib_event_poll_interval`` seconds, in case a
+  notification was missed. Falls back to poll if ``cib_event_socket``
+  cannot be bound.
+'''),
+    cfg.StrOpt('cib_event_socket',
+               default='/run/masakarimonitors/hostmonitor-cib.sock',
+               help='Path of the UNIX socket on which the cib change'
+                    ' notifications of the masakari-hostmonitor-alert'
+                    ' pacemaker alert agent are received. It is the'
+                    ' recipient of the alert.'),
+    cfg.StrOpt('cib_event_socket_group',
+               default='haclient',
+               help='Group owning cib_event_socket, which must be the'
+                    ' group of the user running the pacemaker alert agents.'
+                    ' The socket is only writable by the owner and this'
+                    ' group, so that other users cannot send fake cib'
+                    ' change notifications. If empty, the group of the'
+                    ' hostmonitor is kept.'),
+    cfg.IntOpt('cib_event_poll_interval',
+               default=300,
+               min=1,
+               help='Interval(in seconds) of the checks of the cluster'
+                    ' state when no cib change is notified, with the event'
+                    ' monitoring_mode.'),
+    cfg.IntOpt('pacemaker_service_cache_ttl',
+               default=300,
+               min=0,
+               help='''
+Time(in seconds) for which the pacemaker services detected with
+``pacemaker_node_type = autodetect`` are reused by the single_pass probe
+mode.
+
+The services are detected again as soon as a probe fails. 0 detects them
+every monitoring cycle.
 '''),
 ]
 
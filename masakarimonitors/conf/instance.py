@@ -23,12 +23,50 @@ monitor_callback_opts = [
                default=10,
                help='Trial interval of time of the notification processing'
                     ' is error(in seconds).'),
+    cfg.IntOpt('workers',
+               default=4,
+               min=1,
+               help='Number of threads running the libvirt event callbacks.'
+                    ' The events of a domain are always run by the same'
+                    ' thread, in order.'),
+    cfg.IntOpt('queue_size',
+               default=250,
+               min=1,
+               help='Maximum number of libvirt events queued for each'
+                    ' callback thread. The events beyond are dropped.'),
+    cfg.IntOpt('stats_interval',
+               default=0,
+               min=0,
+               help='Interval in seconds to log the number of libvirt events'
+                    ' queued, processed and dropped, and the longest time'
+                    ' an event was queued. 0 disables it.'),
 ]
 
 libvirt_opts = [
     cfg.StrOpt('connection_uri',
                default='qemu:///system',
-               help='Override the default libvirt URI.')
+               help='Override the default libvirt URI.'),
+    cfg.StrOpt('event_filter_file',
+               help='Path of a yaml file listing the libvirt events which'
+                    ' are notified, as in libvirt_event_filter.yaml.sample.'
+                    ' Only the libvirt events listed are registered. By'
+                    ' default, the built-in list of events is used.'),
+    cfg.StrOpt('event_loop',
+               default='native',
+               choices=['native', 'asyncio'],
+               help='Implementation of the libvirt event loop of the'
+                    ' instance monitors. native runs libvirt\'s default'
+                    ' event loop in a thread, and checks the connection'
+                    ' every second. asyncio runs libvirt\'s event loop on'
+                    ' an asyncio loop with libvirtaio, together with the'
+                    ' connection handling, which waits for libvirt to'
+                    ' report the connection closed instead.'),
+    cfg.IntOpt('reconnect_max_interval',
+               default=60,
+               min=1,
+               help='Maximum interval in seconds between the attempts to'
+                    ' reconnect to libvirt. The interval starts at 1 second'
+                    ' and doubles after every failed attempt.'),
 ]
 
 
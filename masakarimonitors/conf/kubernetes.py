@@ -24,6 +24,14 @@ Example value:
 
 monitoring_node_labels = "monitoring=true,compute-node=enabled,..."
 '''),
+    cfg.StrOpt('lease_name',
+               default='masakari-hostmonitor',
+               help='Name of the Lease held by the designated notifier when'
+                    ' [host]designated_notifier is enabled.'),
+    cfg.StrOpt('lease_namespace',
+               default='default',
+               help='Namespace of the Lease held by the designated'
+                    ' notifier.'),
 ]
 
 
@@ -0,0 +1,170 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import random
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+
+import masakarimonitors.conf
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Circuit breaker shared by the notifiers of this process.
+_breaker = None
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker doesn't let a call through."""
+
+    def __init__(self):
+        super(CircuitOpenError, self).__init__(
+            "The circuit breaker of the masakari-api calls is open.")
+
+
+def backoff(interval, retry_count, max_interval):
+    """Get the time to wait before a retry.
+
+    :param interval: Time to wait before the first retry.
+    :param retry_count: Number of retries already made.
+    :param max_interval: Cap of the time to wait, 0 to always wait
+        interval.
+
+    :returns: interval doubled for each retry and capped to max_interval,
+        with a random jitter of up to half of it, so that the retries of
+        concurrent notifications are spread.
+    """
+    if not max_interval:
+        return interval
+    wait = min(max_interval, interval * 2 ** retry_count)
+    return wait / 2 + random.uniform(0, wait / 2)
+
+
+class CircuitBreaker(object):
+    """Circuit breaker of the calls to the masakari-api.
+
+    The circuit opens after ``failures`` consecutive failed calls, and the
+    calls then wait instead of reaching the masakari-api. Once ``timeout``
+    seconds passed, a single call is let through as a probe(half-open): the
+    circuit closes if it succeeds, and opens again for twice the time, up
+    to ``max_timeout`` seconds, if it fails.
+
+    The circuit breaker is shared by the notifiers of the process, which
+    may run in several native threads.
+    """
+
+    def __init__(self, failures, timeout, max_timeout):
+        self.failures = failures
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.state = CLOSED
+        self.failure_count = 0
+        self.open_timeout = timeout
+        self.opened_until = 0
+        # Notified when the state changes, to wake up the waiting calls.
+        self.condition = threading.Condition()
+        self.transitions = collections.Counter()
+
+    def _transition(self, state):
+        log = LOG.warning if state == OPEN else LOG.info
+        log("Circuit breaker of the masakari-api calls changed from"
+            " %(old)s to %(new)s.", {'old': self.state, 'new': state})
+        self.transitions[state] += 1
+        self.state = state
+        self.condition.notify_all()
+
+    def allow(self):
+        """Check whether a call may be made now.
+
+        The caller allowed in the open state after the timeout is the probe,
+        and must report its result.
+        """
+        with self.condition:
+            return self._allow()
+
+    def _allow(self):
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() >= self.opened_until:
+            self._transition(HALF_OPEN)
+            return True
+        return False
+
+    def wait(self, timeout=None):
+        """Wait until a call may be made.
+
+        :param timeout: Maximum time to wait in seconds, None to wait until
+            the circuit is closed or a probe may be sent.
+
+        :returns: True if the call may be made, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self._allow():
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    return False
+                wait = None
+                if self.state == OPEN:
+                    wait = self.opened_until - now
+                if deadline is not None:
+                    wait = deadline - now if wait is None else \
+                        min(wait, deadline - now)
+                self.condition.wait(wait)
+        return True
+
+    def success(self):
+        """Report a call answered by the masakari-api."""
+        with self.condition:
+            self.failure_count = 0
+            self.open_timeout = self.timeout
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def failure(self):
+        """Report a call which failed."""
+        with self.condition:
+            self.failure_count += 1
+            if self.state == HALF_OPEN:
+                self.open_timeout = min(self.open_timeout * 2,
+                                        self.max_timeout)
+            elif self.state == OPEN or self.failure_count < self.failures:
+                return
+            self.opened_until = time.monotonic() + self.open_timeout
+            self._transition(OPEN)
+
+    def get_stats(self):
+        """Get the state and the number of transitions to each state."""
+        with self.condition:
+            stats = {'state': self.state}
+            for state in (CLOSED, OPEN, HALF_OPEN):
+                stats[state] = self.transitions[state]
+        return stats
+
+
+def get_breaker():
+    """Get the circuit breaker of this process, None if it is disabled."""
+    global _breaker
+    if not CONF.api.circuit_breaker_failures:
+        return None
+    if _breaker is None:
+        _breaker = CircuitBreaker(CONF.api.circuit_breaker_failures,
+                                  CONF.api.circuit_breaker_timeout,
+                                  CONF.api.circuit_breaker_max_timeout)
+    return _breaker
@@ -0,0 +1,163 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+
+LOG = oslo_logging.getLogger(__name__)
+
+# Significance of the notifications by prefix of their libvirt domain event,
+# or of their event for the hosts and processes. The notifications not
+# listed have a significance of 0.
+SIGNIFICANCE = (
+    ('STOPPED', 3),
+    ('SHUTDOWN', 2),
+    ('SUSPENDED', 1),
+    ('IO_ERROR', 1),
+    ('WATCHDOG', 1),
+)
+
+
+def notification_key(event):
+    """Get the subject of a notification.
+
+    :returns: tuple of the type, hostname, instance uuid and process name
+        of the notification.
+    """
+    notification = event['notification']
+    payload = notification.get('payload') or {}
+    return (notification['type'], notification['hostname'],
+            payload.get('instance_uuid'), payload.get('process_name'))
+
+
+def significance(event):
+    payload = event['notification'].get('payload') or {}
+    detail = payload.get('vir_domain_event') or payload.get('event') or ''
+    for prefix, value in SIGNIFICANCE:
+        if detail.startswith(prefix):
+            return value
+    return 0
+
+
+def _signature(event):
+    # The notification without its generated time, whose payload was
+    # maybe replayed from json.
+    notification = event['notification']
+    return (notification['type'], notification['hostname'],
+            json.dumps(notification.get('payload'), sort_keys=True,
+                       default=str))
+
+
+class _PendingNotification(object):
+
+    def __init__(self, retry_max, retry_interval, event, entry):
+        self.retry_max = retry_max
+        self.retry_interval = retry_interval
+        self.event = event
+        self.entry = entry
+
+
+class NotificationCoalescer(object):
+    """Coalesce the notifications about the same subject.
+
+    The notifications about the same host, instance or process are held
+    for ``window`` seconds from the first one. Of the notifications held,
+    only the most significant one, e.g. STOPPED_FAILED rather than the
+    SUSPENDED_IOERROR libvirt reported before it, and the last one if it is
+    different, so that the final state is not lost, are sent. A
+    notification identical to the last one the masakari-api answered about
+    the same subject within ``duplicate_ttl`` seconds is dropped.
+
+    The notifications are added from several native threads, e.g. the
+    libvirt callback threads of the instancemonitor, and flushed by a
+    native timer thread.
+    """
+
+    def __init__(self, notifier, window, duplicate_ttl):
+        self.notifier = notifier
+        self.window = window
+        self.duplicate_ttl = duplicate_ttl
+        self.pending = {}
+        # Signature and time of the last notification answered by subject.
+        self.answered = {}
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+
+    def add(self, retry_max, retry_interval, event, entry=None):
+        """Hold a notification to be coalesced.
+
+        :param retry_max: Number of retries when the notification
+            processing is error.
+        :param retry_interval: Trial interval of time of the notification
+            processing is error.
+        :param event: dictionary of event that included in notification.
+        :param entry: SpoolEntry of the notification.
+        """
+        key = notification_key(event)
+        notification = _PendingNotification(retry_max, retry_interval,
+                                            event, entry)
+        with self.lock:
+            answered = self.answered.get(key)
+            duplicate = answered is not None and \
+                answered[0] == _signature(event) and \
+                time.monotonic() - answered[1] < self.duplicate_ttl
+            if duplicate:
+                self.stats['duplicate'] += 1
+            elif key in self.pending:
+                self.pending[key].append(notification)
+            else:
+                self.pending[key] = [notification]
+                timer = threading.Timer(self.window, self._flush, (key,))
+                timer.daemon = True
+                timer.start()
+        if duplicate:
+            LOG.info("Dropped a duplicate notification. %s", event)
+            self.notifier._acknowledge(entry)
+
+    def _flush(self, key):
+        with self.lock:
+            notifications = self.pending.pop(key)
+        last = len(notifications) - 1
+        best = max(range(len(notifications)),
+                   key=lambda i: (significance(notifications[i].event), i))
+        kept = [best]
+        if best != last and _signature(notifications[best].event) != \
+                _signature(notifications[last].event):
+            kept.append(last)
+
+        for i, notification in enumerate(notifications):
+            if i not in kept:
+                LOG.info("Coalesced a notification. %s", notification.event)
+                with self.lock:
+                    self.stats['coalesced'] += 1
+                self.notifier._acknowledge(notification.entry)
+        for i in kept:
+            notification = notifications[i]
+            self.notifier._deliver(notification.retry_max,
+                                   notification.retry_interval,
+                                   notification.event, notification.entry)
+
+    def record_answered(self, event):
+        """Record a notification answered by the masakari-api."""
+        if not self.duplicate_ttl:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.answered = dict(
+                (key, answered) for key, answered in self.answered.items()
+                if now - answered[1] < self.duplicate_ttl)
+            self.answered[notification_key(event)] = (_signature(event),
+                                                      now)
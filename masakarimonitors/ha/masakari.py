@@ -12,22 +12,158 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+
 import eventlet
 from keystoneauth1 import loading as ks_loading
 from openstack import connection
 from openstack import exceptions
 from oslo_log import log as oslo_logging
+from oslo_utils import timeutils
 
 import masakarimonitors.conf
+from masakarimonitors.ha import circuit_breaker
+from masakarimonitors.ha import coalescer
+from masakarimonitors.ha import rate_limiter
+from masakarimonitors.ha import spool
+from masakarimonitors.objects import event_constants as ec
 
 LOG = oslo_logging.getLogger(__name__)
 CONF = masakarimonitors.conf.CONF
 
+# Seconds before the expiry of the token when it is refreshed. keystoneauth
+# authenticates again when the token expires within 120 seconds.
+TOKEN_REFRESH_MARGIN = 60
+# Seconds between the attempts to prepare the client or refresh the token.
+CLIENT_RETRY_INTERVAL = 10
+
+# Prewarmer of the masakari-api client of this process, while it runs.
+_prewarmer = None
+
+
+def _make_client():
+    """Make a masakari-api client.
+
+    :returns: tuple of the client and its keystone session.
+    """
+    auth = ks_loading.load_auth_from_conf_options(CONF, 'api')
+    session = ks_loading.load_session_from_conf_options(CONF, 'api',
+                                                        auth=auth)
+    conn = connection.Connection(session=session,
+                                 interface=CONF.api.api_interface,
+                                 region_name=CONF.api.region)
+
+    return conn.instance_ha, session
+
+
+class ClientPrewarmer(object):
+    """Prepare the masakari-api client before the first notification.
+
+    A single native thread authenticates and resolves the endpoint of the
+    masakari-api when the monitor starts, so that the first notification
+    only pays the request itself, and then keeps the token refreshed before
+    it expires. The client is shared by the notifiers of the process.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.session = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run,
+                                       name="masakari_client_prewarm")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        start = time.monotonic()
+        while True:
+            try:
+                client, session = _make_client()
+                endpoint = client.get_endpoint()
+                break
+            except Exception as e:
+                LOG.warning("Failed to prepare the masakari-api client: %s",
+                            e)
+                if self.stopped.wait(CLIENT_RETRY_INTERVAL):
+                    return
+        self.client, self.session = client, session
+        LOG.info("masakari-api client prepared in %(time).3f seconds,"
+                 " endpoint %(endpoint)s.",
+                 {'time': time.monotonic() - start, 'endpoint': endpoint})
+
+        while True:
+            wait = CLIENT_RETRY_INTERVAL
+            try:
+                access = self.session.auth.get_access(self.session)
+                if access.expires:
+                    remaining = access.expires - timeutils.utcnow(
+                        with_timezone=True)
+                    wait = max(wait, remaining.total_seconds() -
+                               TOKEN_REFRESH_MARGIN)
+                else:
+                    # The token doesn't expire.
+                    return
+            except Exception as e:
+                LOG.warning("Failed to refresh the masakari-api token: %s", e)
+            if self.stopped.wait(wait):
+                return
+
+
+def start_prewarm():
+    """Start preparing the client, if [api]client_prewarm is set."""
+    global _prewarmer
+    if not CONF.api.client_prewarm or _prewarmer is not None:
+        return
+    _prewarmer = ClientPrewarmer()
+    _prewarmer.start()
+
+
+def stop_prewarm():
+    """Stop refreshing the token of the client."""
+    global _prewarmer
+    if _prewarmer is not None:
+        _prewarmer.stop()
+        _prewarmer = None
+
 
 class SendNotification(object):
 
     def __init__(self):
         self._masakari_client = None
+        self._session = None
+        self._first_notification = True
+        self.breaker = circuit_breaker.get_breaker()
+        self.dispatcher = None
+        if CONF.api.notification_workers:
+            self.dispatcher = NotificationDispatcher(
+                self, CONF.api.notification_workers,
+                CONF.api.notification_queue_size)
+        self.coalescer = None
+        if CONF.api.notification_coalesce_window or \
+                CONF.api.notification_duplicate_ttl:
+            self.coalescer = coalescer.NotificationCoalescer(
+                self, CONF.api.notification_coalesce_window,
+                CONF.api.notification_duplicate_ttl)
+        self.spool = None
+        if CONF.api.notification_spool_dir:
+            self.spool = spool.get_spool(
+                os.path.join(CONF.api.notification_spool_dir,
+                             os.path.basename(sys.argv[0])),
+                CONF.api.notification_spool_segment_size,
+                CONF.api.notification_spool_fsync_interval)
+            self._replay()
 
     @property
     def masakari_client(self):
@@ -36,19 +172,98 @@ class SendNotification(object):
         return self._masakari_client
 
     def _make_client(self):
-        auth = ks_loading.load_auth_from_conf_options(CONF, 'api')
-        session = ks_loading.load_session_from_conf_options(CONF, 'api',
-                                                            auth=auth)
-        conn = connection.Connection(session=session,
-                                     interface=CONF.api.api_interface,
-                                     region_name=CONF.api.region)
+        # The client prepared by the prewarmer is shared.
+        prewarmer = _prewarmer
+        if prewarmer is not None and prewarmer.client is not None:
+            self._session = prewarmer.session
+            return prewarmer.client
+        client, self._session = _make_client()
+        return client
+
+    def _create_notification(self, event):
+        """Make a single attempt to create a notification.
+
+        :param event: dictionary of event that included in notification.
+
+        :returns: True if the notification was created, False if the
+            masakari-api rejected it and it must not be retried.
+        :raises Exception: if the notification may be retried.
+        """
+        start = time.monotonic()
+        try:
+            response = self.masakari_client.create_notification(
+                type=event['notification']['type'],
+                hostname=event['notification']['hostname'],
+                generated_time=event['notification']['generated_time'],
+                payload=event['notification']['payload'])
+        except exceptions.HttpException as e:
+            if e.status_code in [400, 409]:
+                self._record_result(True, event)
+                LOG.info(e)
+                return False
+            self._record_result(False)
+            raise
+        except Exception:
+            self._record_result(False)
+            raise
 
-        return conn.instance_ha
+        self._record_result(True, event)
+        if self._first_notification:
+            self._first_notification = False
+            LOG.info("First notification sent in %.3f seconds.",
+                     time.monotonic() - start)
+        LOG.info("Response: %s", response)
+        return True
+
+    def _record_result(self, answered, event=None):
+        if answered and self.coalescer is not None:
+            self.coalescer.record_answered(event)
+        if self.breaker is None:
+            return
+        if answered:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+
+    def _replay(self):
+        pending, self.spool.pending = self.spool.pending, []
+        if not pending:
+            return
+        if self.dispatcher is not None:
+            for entry in pending:
+                self.dispatcher.dispatch(entry.retry_max,
+                                         entry.retry_interval,
+                                         entry.event, entry=entry)
+        else:
+            eventlet.spawn(self._replay_entries, pending)
+
+    def _replay_entries(self, entries):
+        for entry in entries:
+            LOG.info("Replay a notification. %s", entry.event)
+            self._send_notification(entry.retry_max, entry.retry_interval,
+                                    entry.event, entry=entry)
+
+    def _acknowledge(self, entry):
+        if entry is None:
+            return
+        try:
+            self.spool.ack(entry)
+        except OSError as e:
+            # The notification is replayed on the next start.
+            LOG.error("Failed to acknowledge a notification in the spool:"
+                      " %s", e)
 
     def send_notification(self, api_retry_max, api_retry_interval, event):
         """Send a notification.
 
-        This method sends a notification to the masakari-api.
+        This method sends a notification to the masakari-api. When
+        [api]notification_workers is set, the notification is queued to be
+        sent in the background and this method returns at once. When
+        [api]notification_spool_dir is set, the notification is recorded in
+        the spool first, and replayed on the next start unless the
+        masakari-api answered it. When [api]notification_coalesce_window is
+        set, the notification is held to be coalesced with the following
+        notifications about the same subject.
 
         :param api_retry_max: Number of retries when the notification
             processing is error.
@@ -57,32 +272,319 @@ class SendNotification(object):
         :param event: dictionary of event that included in notification.
         """
 
+        entry = None
+        if self.spool is not None:
+            try:
+                entry = self.spool.append(api_retry_max, api_retry_interval,
+                                          event)
+            except OSError as e:
+                # The notification is still sent, but not replayed on the
+                # next start.
+                LOG.error("Failed to record a notification in the spool:"
+                          " %s", e)
+
+        if self.coalescer is not None:
+            self.coalescer.add(api_retry_max, api_retry_interval, event,
+                               entry=entry)
+            return
+
+        self._deliver(api_retry_max, api_retry_interval, event, entry)
+
+    def _deliver(self, api_retry_max, api_retry_interval, event, entry):
+        if self.dispatcher is not None:
+            LOG.info("Queue a notification. %s", event)
+            self.dispatcher.dispatch(api_retry_max, api_retry_interval, event,
+                                     entry=entry)
+            return
+
         LOG.info("Send a notification. %s", event)
+        self._send_notification(api_retry_max, api_retry_interval, event,
+                                entry=entry)
 
+    def _send_notification(self, api_retry_max, api_retry_interval, event,
+                           entry=None):
         # Send a notification.
         retry_count = 0
         while True:
             try:
-                response = self.masakari_client.create_notification(
-                    type=event['notification']['type'],
-                    hostname=event['notification']['hostname'],
-                    generated_time=event['notification']['generated_time'],
-                    payload=event['notification']['payload'])
-
-                LOG.info("Response: %s", response)
-                break
+                if self.breaker is not None and not self.breaker.allow():
+                    raise circuit_breaker.CircuitOpenError()
+                self._create_notification(event)
 
             except Exception as e:
-                if isinstance(e, exceptions.HttpException):
-                    if e.status_code in [400, 409]:
-                        LOG.info(e)
-                        break
-
                 if retry_count < api_retry_max:
                     LOG.warning("Retry sending a notification. (%s)", e)
+                    eventlet.greenthread.sleep(circuit_breaker.backoff(
+                        api_retry_interval, retry_count,
+                        CONF.api.api_retry_max_interval))
                     retry_count = retry_count + 1
-                    eventlet.greenthread.sleep(api_retry_interval)
                 else:
                     LOG.exception("Exception caught: %s", e)
-                    self._masakari_client = None
+                    if not isinstance(e, circuit_breaker.CircuitOpenError):
+                        self._masakari_client = None
                     break
+
+            else:
+                self._acknowledge(entry)
+                break
+
+
+class _QueuedNotification(object):
+    """A queued notification and its retry state."""
+
+    def __init__(self, event, retry_max, retry_interval, entry=None):
+        self.event = event
+        self.entry = entry
+        self.retry_max = retry_max
+        self.retry_interval = retry_interval
+        self.retry_count = 0
+        self.queued_time = time.monotonic()
+        self.type = event['notification']['type']
+        self.priority = rate_limiter.priority(self.type)
+        # Whether a token of the rate limit of its type was reserved for
+        # the next attempt.
+        self.admitted = False
+        # The notifications about the same subject are sent in order.
+        self.key = coalescer.notification_key(event)
+
+
+class NotificationDispatcher(object):
+    """Send the notifications in the background.
+
+    The notifications are queued in memory and sent by ``workers`` threads,
+    so that the monitors keep monitoring while the masakari-api is slow or
+    unreachable. The workers are native threads, as the notifications may
+    be dispatched from native threads, e.g. the libvirt callback threads of
+    the instancemonitor, which never run the green threads. A notification
+    to retry is queued again after its retry interval instead of holding a
+    worker. While the circuit breaker is open, the workers wait and the
+    notifications stay queued. The notifications about the same host,
+    instance or process are sent one at a time in the order they were
+    queued.
+
+    The notifications are sent by priority of their type, the host
+    notifications first, and the types listed in [api]notification_rate_limits
+    are delayed to not exceed their rate.
+
+    At most ``queue_size`` notifications are queued or being retried, the
+    notifications dispatched beyond are dropped with an error, except for the
+    host notifications. The dropped notifications recorded in the spool are
+    replayed on the next start.
+    """
+
+    def __init__(self, notifier, workers, queue_size):
+        self.notifier = notifier
+        self.workers = workers
+        self.queue_size = queue_size
+        # Guards the state below, and is notified when a notification is
+        # queued.
+        self.condition = threading.Condition()
+        # Heaps of the notifications ready to send by priority, and of the
+        # notifications to queue again later by time.
+        self.ready = []
+        self.delayed = []
+        self.sequence = itertools.count()
+        self.buckets = rate_limiter.get_buckets()
+        # Number of notifications admitted, delayed and dropped by type.
+        self.type_stats = collections.defaultdict(collections.Counter)
+        # Notifications queued, being sent or waiting for a retry.
+        self.notifications = set()
+        # Notifications waiting for the one sent before them by key.
+        self.waiting = {}
+        self.stats = collections.Counter()
+        self.threads = []
+        self.running = True
+
+    def _start(self):
+        if self.threads:
+            return
+        for i in range(self.workers):
+            self._start_thread(self._work, "notification_worker_%d" % i)
+        if CONF.api.notification_stats_interval:
+            self._start_thread(self._report, "notification_stats")
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        """Stop the workers once their current notification is sent."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def dispatch(self, api_retry_max, api_retry_interval, event,
+                 entry=None):
+        """Queue a notification to be sent.
+
+        :param api_retry_max: Number of retries when the notification
+            processing is error.
+        :param api_retry_interval: Trial interval of time of the notification
+            processing is error.
+        :param event: dictionary of event that included in notification.
+        :param entry: SpoolEntry of the notification, acknowledged once the
+            masakari-api answered it.
+
+        :returns: True if the notification was queued, False if it was
+            dropped because the queue is full.
+        """
+        notice_type = event['notification']['type']
+        with self.condition:
+            if len(self.notifications) >= self.queue_size and \
+                    notice_type != ec.EventConstants.TYPE_COMPUTE_HOST:
+                self.stats['dropped'] += 1
+                self.type_stats[notice_type]['dropped'] += 1
+                LOG.error("Notification queue is full(%(size)d"
+                          " notifications, the oldest queued %(age).1f"
+                          " seconds ago). Dropped the notification"
+                          " %(event)s",
+                          {'size': len(self.notifications),
+                           'age': self._get_oldest_age(),
+                           'event': event})
+                return False
+
+            self._start()
+            notification = _QueuedNotification(event, api_retry_max,
+                                               api_retry_interval,
+                                               entry=entry)
+            self.notifications.add(notification)
+            if notification.key in self.waiting:
+                self.waiting[notification.key].append(notification)
+            else:
+                self.waiting[notification.key] = collections.deque()
+                self._put(notification)
+        return True
+
+    def _put(self, notification, delay=0):
+        # Called with the condition held. The sequence keeps the order of
+        # the notifications of a priority.
+        if delay:
+            heapq.heappush(self.delayed, (time.monotonic() + delay,
+                                          next(self.sequence), notification))
+        else:
+            heapq.heappush(self.ready, (notification.priority,
+                                        next(self.sequence), notification))
+        self.condition.notify()
+
+    def _get(self):
+        """Wait for the next notification to send.
+
+        :returns: the notification, or None once stopped.
+        """
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    notification = heapq.heappop(self.delayed)[2]
+                    heapq.heappush(self.ready, (notification.priority,
+                                                next(self.sequence),
+                                                notification))
+                if self.ready:
+                    notification = heapq.heappop(self.ready)[2]
+                    if self._admit(notification):
+                        return notification
+                    continue
+                self.condition.wait(self.delayed[0][0] - now
+                                    if self.delayed else None)
+        return None
+
+    def _admit(self, notification):
+        if notification.admitted:
+            return True
+        notification.admitted = True
+        bucket = self.buckets.get(notification.type)
+        wait = bucket.reserve() if bucket is not None else 0
+        if wait:
+            self.type_stats[notification.type]['delayed'] += 1
+            self._put(notification, wait)
+            return False
+        self.type_stats[notification.type]['admitted'] += 1
+        return True
+
+    def _work(self):
+        while True:
+            notification = self._get()
+            if notification is None:
+                return
+            if self.notifier.breaker is not None:
+                self.notifier.breaker.wait()
+            try:
+                if self.notifier._create_notification(notification.event):
+                    result = 'sent'
+                else:
+                    result = 'rejected'
+            except Exception as e:
+                if notification.retry_count < notification.retry_max:
+                    LOG.warning("Retry sending a notification. (%s)", e)
+                    with self.condition:
+                        notification.retry_count += 1
+                        notification.admitted = False
+                        self.stats['retried'] += 1
+                        self._put(notification, circuit_breaker.backoff(
+                            notification.retry_interval,
+                            notification.retry_count - 1,
+                            CONF.api.api_retry_max_interval))
+                    continue
+                LOG.exception("Exception caught: %s", e)
+                self.notifier._masakari_client = None
+                result = 'failed'
+            else:
+                self.notifier._acknowledge(notification.entry)
+            self._done(notification, result)
+
+    def _done(self, notification, result):
+        with self.condition:
+            self.stats[result] += 1
+            self.notifications.discard(notification)
+            waiting = self.waiting[notification.key]
+            if waiting:
+                self._put(waiting.popleft())
+            else:
+                del self.waiting[notification.key]
+
+    def _get_oldest_age(self):
+        now = time.monotonic()
+        return max([now - n.queued_time for n in self.notifications] or [0])
+
+    def get_stats(self):
+        """Get the back-pressure metrics of the dispatcher.
+
+        :returns: dictionary of the number of notifications queued or being
+            sent(depth), the seconds since the oldest of them was
+            queued(oldest_age), the number of notifications sent,
+            rejected, retried, failed and dropped so far, and the number of
+            notifications admitted, delayed and dropped by type(types).
+        """
+        with self.condition:
+            stats = dict(self.stats)
+            stats['depth'] = len(self.notifications)
+            stats['oldest_age'] = self._get_oldest_age()
+            stats['types'] = dict(
+                (notice_type,
+                 dict((key, counter[key])
+                      for key in ('admitted', 'delayed', 'dropped')))
+                for notice_type, counter in self.type_stats.items())
+        for key in ('sent', 'rejected', 'retried', 'failed', 'dropped'):
+            stats.setdefault(key, 0)
+        return stats
+
+    def _report(self):
+        while self.running:
+            time.sleep(CONF.api.notification_stats_interval)
+            stats = self.get_stats()
+            log = LOG.warning if stats['depth'] else LOG.info
+            log("Notification queue: %(depth)d queued, oldest queued"
+                " %(oldest_age).1f seconds ago, %(sent)d sent, %(rejected)d"
+                " rejected, %(retried)d retried, %(failed)d failed,"
+                " %(dropped)d dropped.", stats)
+            for notice_type, type_stats in sorted(stats['types'].items()):
+                LOG.info("%(type)s notifications: %(admitted)d admitted,"
+                         " %(delayed)d delayed, %(dropped)d dropped.",
+                         dict(type_stats, type=notice_type))
+            if self.notifier.breaker is not None:
+                LOG.info("Circuit breaker of the masakari-api calls:"
+                         " %(state)s, %(open)d opened, %(half-open)d"
+                         " half-opened, %(closed)d closed.",
+                         self.notifier.breaker.get_stats())
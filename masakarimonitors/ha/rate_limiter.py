@@ -0,0 +1,70 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import masakarimonitors.conf
+from masakarimonitors.objects import event_constants as ec
+
+CONF = masakarimonitors.conf.CONF
+
+# Priority of the notifications by type, the lowest first. A host failure
+# evacuates all its instances, so its notification is sent first.
+PRIORITIES = {
+    ec.EventConstants.TYPE_COMPUTE_HOST: 0,
+    ec.EventConstants.TYPE_PROCESS: 1,
+    ec.EventConstants.TYPE_VM: 2,
+}
+
+
+def priority(notice_type):
+    return PRIORITIES.get(notice_type, len(PRIORITIES))
+
+
+class TokenBucket(object):
+    """Token bucket of ``rate`` tokens per second, up to ``burst`` tokens.
+
+    A token is reserved even when the bucket is empty, so that the callers
+    waiting for a token are spread over the time they are refilled.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Reserve a token.
+
+        :returns: Time in seconds to wait before using the token, 0 if it
+            can be used at once.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+def get_buckets():
+    """Get the token buckets of the rate limited notification types."""
+    buckets = {}
+    for notice_type, rate in CONF.api.notification_rate_limits.items():
+        rate = float(rate)
+        if rate > 0:
+            buckets[notice_type] = TokenBucket(
+                rate, CONF.api.notification_rate_burst)
+    return buckets
@@ -0,0 +1,242 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import datetime
+import json
+import os
+import threading
+
+from oslo_log import log as oslo_logging
+
+LOG = oslo_logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.log'
+
+# Spools opened in this process by path.
+_spools = {}
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+class SpoolEntry(object):
+    """A notification recorded in the spool."""
+
+    def __init__(self, entry_id, retry_max, retry_interval, event):
+        self.id = entry_id
+        self.retry_max = retry_max
+        self.retry_interval = retry_interval
+        self.event = event
+
+
+class NotificationSpool(object):
+    """Append-only spool of the notifications to send.
+
+    The notifications are appended to segment files of the spool directory
+    as json lines before they are sent, and acknowledged by appending an
+    ack line once the masakari-api answered. A segment is deleted once it
+    is not the one appended to and it and all the segments before it have
+    no unacknowledged notification, so an ack line never outlives the
+    notification it acknowledges.
+
+    Every line is written to the file at once, so that a notification
+    survives a crash of the process. The file is fsynced at most every
+    ``fsync_interval`` seconds, so that a storm of notifications doesn't
+    wait for the disk, at the cost of the notifications of the last
+    interval on a crash of the host. With an interval of 0, every line is
+    fsynced. The deferred fsync is run by a native timer thread, and the
+    spool is locked, as the notifications are appended from the native
+    threads of the libvirt callbacks too.
+
+    On load, the unacknowledged notifications are appended in order to a
+    new segment and the previous segments are deleted.
+    """
+
+    def __init__(self, path, segment_size, fsync_interval):
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        # Unacknowledged entry ids by segment number, oldest first.
+        self.segments = collections.OrderedDict()
+        self.entry_segment = {}
+        self.next_id = 1
+        self.file = None
+        self.number = 0
+        self.size = 0
+        self.dirty = False
+        self.sync_timer = None
+        self.pending = []
+        # Reentrant, as rotating or writing may sync.
+        self.lock = threading.RLock()
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, '%020d%s' % (number, SEGMENT_SUFFIX))
+
+    def _list_segments(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)])
+                      for name in os.listdir(self.path)
+                      if name.endswith(SEGMENT_SUFFIX)
+                      and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _read_segment(self, number):
+        records = []
+        with open(self._segment_path(number), 'rb') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A line partially written when the host crashed.
+                    LOG.warning("Skipped a corrupted line of the"
+                                " notification spool segment %s.",
+                                self._segment_path(number))
+        return records
+
+    def _sync_dir(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def load(self):
+        """Open the spool and get the unacknowledged notifications.
+
+        :returns: list of SpoolEntry of the notifications to replay, in the
+            order they were appended.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        numbers = self._list_segments()
+        entries = collections.OrderedDict()
+        acked = set()
+        for number in numbers:
+            for record in self._read_segment(number):
+                if 'ack' in record:
+                    acked.add(record['ack'])
+                else:
+                    entries[record['id']] = record
+
+        self.number = numbers[-1] if numbers else 0
+        self._rotate()
+        pending = []
+        for entry_id, record in entries.items():
+            if entry_id not in acked:
+                pending.append(self.append(record['retry_max'],
+                                           record['retry_interval'],
+                                           record['event']))
+        self.sync()
+        for number in numbers:
+            os.remove(self._segment_path(number))
+        if numbers:
+            self._sync_dir()
+        if pending:
+            LOG.info("Replaying %d notifications from the spool %s.",
+                     len(pending), self.path)
+        return pending
+
+    def _rotate(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+        self.number += 1
+        self.file = open(self._segment_path(self.number), 'ab')
+        self.size = 0
+        self.segments[self.number] = set()
+        self._sync_dir()
+        self._compact()
+
+    def _compact(self):
+        while len(self.segments) > 1:
+            number, entry_ids = next(iter(self.segments.items()))
+            if entry_ids:
+                break
+            del self.segments[number]
+            os.remove(self._segment_path(number))
+
+    def _write(self, record):
+        line = json.dumps(record, default=_default).encode() + b'\n'
+        self.file.write(line)
+        self.file.flush()
+        self.size += len(line)
+        self.dirty = True
+        if not self.fsync_interval:
+            self.sync()
+        elif self.sync_timer is None:
+            self.sync_timer = threading.Timer(self.fsync_interval,
+                                              self.sync)
+            self.sync_timer.daemon = True
+            self.sync_timer.start()
+
+    def append(self, retry_max, retry_interval, event):
+        """Append a notification to the spool.
+
+        :returns: SpoolEntry of the notification.
+        :raises OSError: if the notification cannot be written.
+        """
+        with self.lock:
+            if self.size >= self.segment_size:
+                self._rotate()
+            entry = SpoolEntry(self.next_id, retry_max, retry_interval,
+                               event)
+            self.next_id += 1
+            self._write({'id': entry.id, 'retry_max': retry_max,
+                         'retry_interval': retry_interval, 'event': event})
+            self.segments[self.number].add(entry.id)
+            self.entry_segment[entry.id] = self.number
+            return entry
+
+    def ack(self, entry):
+        """Acknowledge a notification, which is not replayed anymore."""
+        with self.lock:
+            number = self.entry_segment.pop(entry.id, None)
+            if number is None:
+                return
+            if self.size >= self.segment_size:
+                self._rotate()
+            self._write({'ack': entry.id})
+            self.segments[number].discard(entry.id)
+            self._compact()
+
+    def sync(self):
+        """Fsync the segment appended to."""
+        with self.lock:
+            if self.sync_timer is not None:
+                if self.sync_timer is not threading.current_thread():
+                    self.sync_timer.cancel()
+                self.sync_timer = None
+            if self.dirty and self.file is not None:
+                self.dirty = False
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.sync()
+                self.file.close()
+                self.file = None
+
+
+def get_spool(path, segment_size, fsync_interval):
+    """Get the spool of a directory, loading it on first use.
+
+    The notifications to replay are left in the pending attribute of the
+    spool, to be taken by the first notifier using it.
+    """
+    spool = _spools.get(path)
+    if spool is None:
+        spool = NotificationSpool(path, segment_size, fsync_interval)
+        spool.pending = spool.load()
+        _spools[path] = spool
+    return spool
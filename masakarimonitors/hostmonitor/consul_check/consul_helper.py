@@ -17,10 +17,13 @@ Main abstraction layer for retrieving node status from consul
 """
 
 import consul
+from oslo_log import log as oslo_logging
 from oslo_utils import netutils
 
 from masakarimonitors.i18n import _
 
+LOG = oslo_logging.getLogger(__name__)
+
 
 DEFAULT_CONSUL_PORT = 8500
 
@@ -44,6 +47,10 @@ class ConsulGetMembersException(ConsulException):
     msg_fmt = _("Failed to get members of %(cluster)s: %(err)s.")
 
 
+class ConsulLockException(ConsulException):
+    msg_fmt = _("Failed to acquire lock %(key)s in %(cluster)s: %(err)s.")
+
+
 class ConsulManager(object):
     """Consul manager class
 
@@ -98,6 +105,11 @@ class ConsulManager(object):
 
         return sequence_hosts_health
 
+    def get_lock(self, key, holder, ttl, sequence):
+        """Get a lock in the first consul cluster of the sequence."""
+        self.valid_agents(sequence[:1])
+        return ConsulLock(self.agents[sequence[0]], key, holder, ttl)
+
 
 class ConsulAgent(object):
     """Agent to consul cluster"""
@@ -129,3 +141,54 @@ class ConsulAgent(object):
                 agents_health[host] = 'down'
 
         return agents_health
+
+
+class ConsulLock(object):
+    """Lock of a key held through a consul session with a TTL.
+
+    The session is renewed whenever the lock is acquired again. Consul
+    invalidates it if it isn't renewed within the TTL, which releases the
+    lock for another holder.
+    """
+
+    def __init__(self, agent, key, holder, ttl):
+        self.agent = agent
+        self.key = key
+        self.holder = holder
+        self.ttl = ttl
+        self.session_id = None
+
+    def acquire(self):
+        """Acquire the lock, or keep it if it is already held.
+
+        :returns: True if the lock is held, False if another holder has it.
+        :raises ConsulLockException: if consul failed to answer.
+        """
+        session = self.agent.cluster.session
+        try:
+            if self.session_id is not None:
+                try:
+                    session.renew(self.session_id)
+                except consul.NotFound:
+                    # The session expired and the lock was released.
+                    self.session_id = None
+            if self.session_id is None:
+                self.session_id = session.create(
+                    name=self.holder, behavior='release', ttl=self.ttl,
+                    lock_delay=0)
+            return bool(self.agent.cluster.kv.put(
+                self.key, self.holder, acquire=self.session_id))
+        except Exception as e:
+            raise ConsulLockException(key=self.key, cluster=self.agent.name,
+                                      err=str(e))
+
+    def release(self):
+        """Release the lock by destroying the session."""
+        if self.session_id is None:
+            return
+        try:
+            self.agent.cluster.session.destroy(self.session_id)
+        except Exception as e:
+            LOG.warning("Failed to release lock %s in %s: %s",
+                        self.key, self.agent.name, e)
+        self.session_id = None
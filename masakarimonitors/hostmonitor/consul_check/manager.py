@@ -12,10 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import eventlet
 import socket
 
-from collections import deque
 from oslo_log import log
 from oslo_utils import timeutils
 
@@ -24,6 +22,10 @@ from masakarimonitors.ha import masakari
 from masakarimonitors.hostmonitor.consul_check import consul_helper
 from masakarimonitors.hostmonitor.consul_check import matrix_helper
 from masakarimonitors.hostmonitor import driver
+from masakarimonitors.hostmonitor import health_history
+from masakarimonitors.hostmonitor import scheduler
+from masakarimonitors.hostmonitor import stabilisation
+from masakarimonitors.hostmonitor import storm_guard
 from masakarimonitors.objects import event_constants as ec
 
 LOG = log.getLogger(__name__)
@@ -38,13 +40,19 @@ class ConsulCheck(driver.DriverBase):
         self.hostname = socket.gethostname()
         self.monitoring_interval = CONF.host.monitoring_interval
         self.monitoring_samples = CONF.host.monitoring_samples
+        self.scheduler = scheduler.FixedRateScheduler(
+            'consul', self.monitoring_interval)
         self.matrix_manager = matrix_helper.MatrixManager(CONF)
         self.consul_manager = consul_helper.ConsulManager(CONF)
         self.notifier = masakari.SendNotification()
         self._matrix = None
         self._sequence = None
-        self.monitoring_data = {}
+        self.monitoring_data = health_history.HealthHistory(
+            self.monitoring_samples,
+            policy=stabilisation.get_policy())
         self.last_host_health = {}
+        self.notifier_lock = None
+        self.storm_guard = storm_guard.StormGuard('consul')
 
     @property
     def matrix(self):
@@ -113,24 +121,27 @@ class ConsulCheck(driver.DriverBase):
         cluster_health = self.consul_manager.get_health(self.sequence)
         LOG.debug("Current cluster state: %s.", cluster_health)
         # Reassemble host health history with the latest host health.
-        # Example of 'host_health_history' is [[x, y, x], [x, y, z]...]
+        # Example of a host health history is [(x, y, x), (x, y, z)...]
         for host, health in cluster_health.items():
-            host_health_history = self.monitoring_data.get(
-                host, deque([], maxlen=self.monitoring_samples))
-            host_health_history.append(health)
-            self.monitoring_data[host] = host_health_history
+            self.monitoring_data.append(host, health)
 
     def get_host_health(self, host):
-        health_history = self.monitoring_data.get(host, [])
-        if len(health_history) < self.monitoring_samples:
+        stabilised_health = self.monitoring_data.get_stabilised(host)
+        if stabilised_health == health_history.COLLECTING:
             LOG.debug("Not enough monitoring data for host %s", host)
             return None
+        elif stabilised_health != health_history.UNCERTAIN:
+            return list(stabilised_health)
+
+        # Only the history of hosts whose health recently changed is
+        # scanned.
+        health_history_list = self.monitoring_data.get_history(host)
 
         # Caculate host health from host health history.
         # Only continous 'down' represents the interface 'down',
         # while continous 'up' represents the interface 'up'.
         host_sequence_health = []
-        for host_health in zip(*health_history):
+        for host_health in zip(*health_history_list):
             if 'up' in host_health and 'down' in host_health:
                 host_sequence_health.append(None)
             else:
@@ -159,9 +170,32 @@ class ConsulCheck(driver.DriverBase):
 
         return []
 
+    def _is_designated_notifier(self):
+        """Answers if this hostmonitor sends the notifications.
+
+        With [host]designated_notifier, only the holder of the
+        [consul]lock_key lock sends them.
+        """
+        if not CONF.host.designated_notifier:
+            return True
+
+        if self.notifier_lock is None:
+            self.notifier_lock = self.consul_manager.get_lock(
+                CONF.consul.lock_key, self.hostname,
+                CONF.host.designated_notifier_ttl, self.sequence)
+        try:
+            return self.notifier_lock.acquire()
+        except consul_helper.ConsulException as e:
+            LOG.warning("Failed to acquire the designated notifier lock: %s",
+                        e)
+            return False
+
     def poll_hosts(self):
         '''poll and check hosts health'''
-        for host in self.monitoring_data.keys():
+        is_designated_notifier = self._is_designated_notifier()
+        # Down events and the health they replace by hostname.
+        stopped = {}
+        for host in self.monitoring_data:
 
             if host == self.hostname:
                 continue
@@ -170,28 +204,57 @@ class ConsulCheck(driver.DriverBase):
             if host_health is None:
                 continue
 
+            if not is_designated_notifier and host in self.last_host_health:
+                # The change isn't recorded, so that it is notified if this
+                # hostmonitor becomes the designated notifier before the
+                # host health changes back.
+                continue
+
+            last_health = self.last_host_health.get(host)
             if not self._host_health_changed(host, host_health):
                 continue
 
             # it will send notifition to trigger host failure recovery
             # according to defined HA strategy
             event = self._event(host, host_health)
-            if event:
+            if not event:
+                continue
+            if 'down' in host_health:
+                stopped[host] = (event, last_health)
+                continue
+            self.notifier.send_notification(
+                CONF.host.api_retry_max,
+                CONF.host.api_retry_interval,
+                event)
+
+        allowed = self.storm_guard.filter(list(stopped),
+                                          len(self.monitoring_data))
+        for host, (event, last_health) in stopped.items():
+            if host in allowed:
                 self.notifier.send_notification(
                     CONF.host.api_retry_max,
                     CONF.host.api_retry_interval,
                     event)
+            elif self.storm_guard.hold:
+                # The change isn't recorded, so that it is notified after
+                # the storm if the host is still down.
+                self.last_host_health[host] = last_health
 
     def stop(self):
         self.running = False
+        if self.notifier_lock is not None:
+            self.notifier_lock.release()
+            self.notifier_lock = None
 
     def monitor_hosts(self):
         self.running = True
         while self.running:
+            self.scheduler.start_cycle()
             try:
                 self.update_monitoring_data()
                 self.poll_hosts()
             except Exception as e:
                 LOG.exception("Exception when host-monitor by consul: %s", e)
 
-            eventlet.greenthread.sleep(self.monitoring_interval)
+            self.scheduler.finish_cycle()
+            self.scheduler.wait()
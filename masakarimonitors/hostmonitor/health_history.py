@@ -0,0 +1,190 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+import time
+
+# Stabilised status of a host which has less samples than required.
+COLLECTING = '_being_collected'
+# Stabilised status of a host whose latest samples are not all the same.
+UNCERTAIN = '_uncertain'
+
+_INITIAL_ROWS = 16
+
+
+class HealthHistory(object):
+    """History of the health samples of the monitored hosts.
+
+    The samples are interned as small integer codes and kept in one flat
+    array used as a hosts x samples ring buffer, a row per host. Next to
+    it, every row has the code of its latest sample and the number of
+    consecutive identical samples ending with it, capped at the number of
+    samples, and the code of its stabilised status. The stabilised status
+    of a host is therefore known without scanning its samples, and the
+    memory used is fixed per host.
+
+    The stabilised status is decided when a sample is appended, by the
+    consecutive samples rule, or by the policy given, see
+    masakarimonitors.hostmonitor.stabilisation.
+
+    The rows of removed hosts are reused.
+    """
+
+    def __init__(self, samples, policy=None):
+        self.samples = max(samples, 1)
+        self.policy = policy
+        self.rows = {}
+        self._free_rows = []
+        self._values = []
+        self._codes = {}
+        self._capacity = 0
+        self._samples = array('H')
+        self._heads = array('H')
+        self._counts = array('H')
+        self._runs = array('H')
+        self._latest = array('H')
+        self._stable = array('H')
+        self._collecting = self._code(COLLECTING)
+        self._uncertain = self._code(UNCERTAIN)
+        self._grow(_INITIAL_ROWS)
+
+    def _grow(self, capacity):
+        added = capacity - self._capacity
+        self._samples.extend([0] * (added * self.samples))
+        for column in (self._heads, self._counts, self._runs, self._latest,
+                       self._stable):
+            column.extend([0] * added)
+        self._free_rows.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def _code(self, value):
+        if isinstance(value, list):
+            value = tuple(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def _row(self, hostname):
+        row = self.rows.get(hostname)
+        if row is None:
+            if not self._free_rows:
+                self._grow(self._capacity * 2)
+            row = self.rows[hostname] = self._free_rows.pop()
+            self._heads[row] = 0
+            self._counts[row] = 0
+            self._runs[row] = 0
+            self._stable[row] = self._collecting
+        return row
+
+    def append(self, hostname, value, now=None):
+        """Append the latest sample of a host.
+
+        :param hostname: Name of the host.
+        :param value: Hashable sample, lists are stored as tuples.
+        :param now: Monotonic time(in seconds) of the sample, the current
+            time by default.
+        """
+        row = self._row(hostname)
+        code = self._code(value)
+        head = self._heads[row]
+        self._samples[row * self.samples + head] = code
+        self._heads[row] = (head + 1) % self.samples
+        if self._counts[row] < self.samples:
+            self._counts[row] += 1
+
+        if self._runs[row] and self._latest[row] == code:
+            if self._runs[row] < self.samples:
+                self._runs[row] += 1
+        else:
+            self._runs[row] = 1
+        self._latest[row] = code
+
+        if self._counts[row] < self.samples:
+            stable = self._collecting
+        elif self._runs[row] < self.samples:
+            stable = self._uncertain
+        else:
+            stable = code
+        if self.policy is not None:
+            if now is None:
+                now = time.monotonic()
+            stable = self._code(self.policy.update(
+                hostname, self._values[code], self._values[stable], now))
+        self._stable[row] = stable
+
+    def remove(self, hostname):
+        """Forget a host, its row is reused by the next new host."""
+        row = self.rows.pop(hostname, None)
+        if row is not None:
+            self._free_rows.append(row)
+            if self.policy is not None:
+                self.policy.remove(hostname)
+
+    def get_history(self, hostname):
+        """Get the samples of a host.
+
+        :returns: List of the samples from the oldest to the latest.
+        """
+        row = self.rows.get(hostname)
+        if row is None:
+            return []
+        count = self._counts[row]
+        start = row * self.samples
+        head = self._heads[row]
+        positions = [(head - count + i) % self.samples for i in range(count)]
+        return [self._values[self._samples[start + position]]
+                for position in positions]
+
+    def get_latest(self, hostname):
+        """Get the latest sample of a host, None if it has none."""
+        row = self.rows.get(hostname)
+        if row is None or not self._counts[row]:
+            return None
+        return self._values[self._latest[row]]
+
+    def get_stabilised(self, hostname):
+        """Get the stabilised status of a host.
+
+        :returns: The sample if the latest ``samples`` samples are the same,
+            COLLECTING if the host has less samples, UNCERTAIN otherwise,
+            unless the policy decided otherwise.
+        """
+        row = self.rows.get(hostname)
+        if row is None:
+            return COLLECTING
+        return self._values[self._stable[row]]
+
+    def stabilised_all(self):
+        """Get the stabilised status of all hosts in one pass.
+
+        :returns: Dictionary of the stabilised status by hostname, see
+            get_stabilised.
+        """
+        stable = self._stable
+        values = self._values
+        return dict((hostname, values[stable[row]])
+                    for hostname, row in self.rows.items())
+
+    def __contains__(self, hostname):
+        return hostname in self.rows
+
+    def __iter__(self):
+        return iter(list(self.rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return repr(dict((hostname, self.get_history(hostname))
+                         for hostname in self.rows))
@@ -0,0 +1,186 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import grp
+import json
+import os
+import socket as native_socket
+
+import eventlet
+from eventlet.green import socket
+from eventlet import queue
+from oslo_log import log as oslo_logging
+
+LOG = oslo_logging.getLogger(__name__)
+
+# Kinds of pacemaker alerts which may come with a node state change. The
+# connection resources of pacemaker-remotes are reported as resource
+# alerts.
+ALERT_KINDS = ('node', 'fencing', 'resource')
+
+# Environment variables set by pacemaker when it runs an alert agent.
+ALERT_ENVIRON = {
+    'kind': 'CRM_alert_kind',
+    'node': 'CRM_alert_node',
+    'desc': 'CRM_alert_desc',
+    'rsc': 'CRM_alert_rsc',
+    'task': 'CRM_alert_task',
+}
+
+# Socket used when the pacemaker alert has no recipient, the same as the
+# default of [host]cib_event_socket.
+DEFAULT_SOCKET_PATH = '/run/masakarimonitors/hostmonitor-cib.sock'
+
+_MAX_EVENT_SIZE = 4096
+
+
+def send_alert(path, environ):
+    """Forward a pacemaker alert to the hostmonitor listening on path.
+
+    This is run by the alert agent, so it never blocks pacemaker: the
+    alert is dropped if hostmonitor doesn't listen or isn't reading.
+
+    :param path: Path of the UNIX socket of hostmonitor.
+    :param environ: Environment of the alert agent.
+
+    :returns: True if the alert was sent, False otherwise.
+    """
+    event = dict((name, environ.get(variable))
+                 for name, variable in ALERT_ENVIRON.items())
+    if event['kind'] not in ALERT_KINDS:
+        return False
+
+    data = json.dumps(event).encode('utf-8')[:_MAX_EVENT_SIZE]
+    sock = native_socket.socket(native_socket.AF_UNIX,
+                                native_socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(False)
+        sock.sendto(data, path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class CibEventListener(object):
+    """Listener of the cib changes forwarded by the alert agent.
+
+    The masakari-hostmonitor-alert agent, configured as a pacemaker alert,
+    sends a datagram to a UNIX socket whenever a node joins or leaves the
+    cluster, is fenced, or a resource changes. One green thread receives
+    them into a queue, so that the monitoring loop can wait for the next
+    change instead of sleeping.
+    """
+
+    def __init__(self, path, group=None):
+        self.path = path
+        self.group = group
+        self.events = queue.LightQueue()
+        self._sock = None
+        self._thread = None
+        self.running = False
+
+    def start(self):
+        """Bind the UNIX socket and start receiving events.
+
+        The socket is only writable by its owner and group.
+
+        :raises OSError: if the socket cannot be bound.
+        :raises KeyError: if the group doesn't exist.
+        """
+        if self.running:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(self.path)
+            # The alert agent runs as the hacluster user, of the group of
+            # pacemaker. The other users must not be able to send fake
+            # alerts.
+            if self.group:
+                os.chown(self.path, -1, grp.getgrnam(self.group).gr_gid)
+            os.chmod(self.path, 0o660)
+        except Exception:
+            sock.close()
+            raise
+
+        self._sock = sock
+        self.running = True
+        self._thread = eventlet.spawn(self._listen)
+        LOG.info("Listening to cib change notifications on %s.", self.path)
+
+    def _listen(self):
+        while self.running:
+            try:
+                data = self._sock.recv(_MAX_EVENT_SIZE)
+            except OSError:
+                if not self.running:
+                    break
+                LOG.warning("Failed to receive cib change notification.",
+                            exc_info=True)
+                eventlet.greenthread.sleep(1)
+                continue
+
+            try:
+                event = json.loads(data)
+            except ValueError:
+                LOG.warning("Ignored malformed cib change notification: %r",
+                            data)
+                continue
+            self.events.put(event)
+
+    def wait(self, timeout):
+        """Wait for cib change notifications.
+
+        :param timeout: Maximum time(in seconds) to wait.
+
+        :returns: List of the notifications received, empty if none was
+            received within timeout.
+        """
+        try:
+            events = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        # Changes often come in bursts, e.g. a node leaving and being
+        # fenced. They are all handled by one query.
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+
+        # None only wakes up the waiter when the listener stops.
+        return [event for event in events if event is not None]
+
+    def stop(self):
+        self.running = False
+        self.events.put(None)
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
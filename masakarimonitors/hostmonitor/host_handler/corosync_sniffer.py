@@ -0,0 +1,188 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import errno
+import struct
+import time
+
+import eventlet
+from eventlet.green import socket
+from oslo_log import log as oslo_logging
+
+LOG = oslo_logging.getLogger(__name__)
+
+ETH_P_ALL = 0x0003
+SO_ATTACH_FILTER = 26
+
+# Number of bytes of a matched frame copied to the socket. Only the arrival
+# of the frame matters, so keep the copy as small as possible.
+_SNAPLEN = 64
+
+
+def _bpf_udp_port(port):
+    """Build a classic BPF program equivalent to 'udp port <port>'.
+
+    This is the program 'tcpdump -dd udp port <port>' compiles to, so the
+    sniffer matches exactly the packets the tcpdump based check matches.
+
+    :param port: UDP port number.
+
+    :returns: List of (code, jt, jf, k) tuples.
+    """
+    return [
+        (0x28, 0, 0, 12),             # ldh [12]
+        (0x15, 0, 6, 0x86dd),         # jeq #ETH_P_IPV6
+        (0x30, 0, 0, 20),             # ldb [20]
+        (0x15, 0, 15, 0x11),          # jeq #IPPROTO_UDP
+        (0x28, 0, 0, 54),             # ldh [54]
+        (0x15, 12, 0, port),          # jeq #port
+        (0x28, 0, 0, 56),             # ldh [56]
+        (0x15, 10, 11, port),         # jeq #port
+        (0x15, 0, 10, 0x0800),        # jeq #ETH_P_IP
+        (0x30, 0, 0, 23),             # ldb [23]
+        (0x15, 0, 8, 0x11),           # jeq #IPPROTO_UDP
+        (0x28, 0, 0, 20),             # ldh [20]
+        (0x45, 6, 0, 0x1fff),         # jset #0x1fff (fragment offset)
+        (0xb1, 0, 0, 14),             # ldxb 4*([14]&0xf)
+        (0x48, 0, 0, 14),             # ldh [x + 14]
+        (0x15, 2, 0, port),           # jeq #port
+        (0x48, 0, 0, 16),             # ldh [x + 16]
+        (0x15, 0, 1, port),           # jeq #port
+        (0x06, 0, 0, _SNAPLEN),       # ret #snaplen
+        (0x06, 0, 0, 0),              # ret #0
+    ]
+
+
+class CorosyncSniffer(object):
+    """Passive listener of the corosync communication.
+
+    This class keeps one green thread per monitored interface/port pair.
+    Each thread reads an AF_PACKET socket filtered in the kernel on the
+    corosync port and records when a packet was last seen, so that the
+    health of the corosync communication is available at any time without
+    forking tcpdump.
+    """
+
+    def __init__(self, interfaces, ports):
+        self.pairs = list(zip(interfaces, ports))
+        self.last_seen = {}
+        self._sockets = {}
+        self._threads = []
+        self.running = False
+
+    def _open_socket(self, interface, port):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                             socket.htons(ETH_P_ALL))
+        try:
+            program = _bpf_udp_port(port)
+            insns = b''.join(struct.pack('HBBI', *insn) for insn in program)
+            buf = ctypes.create_string_buffer(insns)
+            fprog = struct.pack('HL', len(program), ctypes.addressof(buf))
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+            sock.bind((interface, 0))
+
+            # Drop frames queued before the filter was attached.
+            sock.setblocking(False)
+            while True:
+                try:
+                    sock.recv(_SNAPLEN)
+                except OSError as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    raise
+            sock.setblocking(True)
+        except Exception:
+            sock.close()
+            raise
+
+        return sock
+
+    def _listen(self, interface, port):
+        sock = self._sockets[(interface, port)]
+        while self.running:
+            try:
+                sock.recv(_SNAPLEN)
+            except OSError:
+                if not self.running:
+                    break
+                LOG.warning("Failed to receive corosync packet on '%s'.",
+                            interface, exc_info=True)
+                eventlet.greenthread.sleep(1)
+                continue
+
+            self.last_seen[(interface, port)] = time.monotonic()
+
+    def start(self):
+        """Start listening on all interface/port pairs.
+
+        :raises OSError: if a raw socket cannot be opened, typically
+            because the process lacks the CAP_NET_RAW capability.
+        """
+        if self.running:
+            return
+
+        try:
+            for interface, port in self.pairs:
+                self._sockets[(interface, port)] = \
+                    self._open_socket(interface, port)
+        except Exception:
+            self._close_sockets()
+            raise
+
+        self.running = True
+        started = time.monotonic()
+        for interface, port in self.pairs:
+            # Give the listener a full staleness period before the first
+            # verdict instead of reporting a failure right after start.
+            self.last_seen.setdefault((interface, port), started)
+            self._threads.append(
+                eventlet.spawn(self._listen, interface, port))
+        LOG.info("Started corosync sniffer on %s.",
+                 ', '.join('%s:%d' % pair for pair in self.pairs))
+
+    def _close_sockets(self):
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets = {}
+
+    def stop(self):
+        self.running = False
+        for thread in self._threads:
+            thread.kill()
+        self._threads = []
+        self._close_sockets()
+
+    def get_heartbeat_ages(self):
+        """Get the time elapsed since the last corosync packet.
+
+        :returns: Dictionary like {(interface, port): seconds}. The value
+            is None if the sniffer has not been started.
+        """
+        now = time.monotonic()
+        ages = {}
+        for pair in self.pairs:
+            last_seen = self.last_seen.get(pair)
+            ages[pair] = None if last_seen is None else now - last_seen
+        return ages
+
+    def is_alive(self, interface, port, staleness):
+        """Returns if corosync packets were seen recently on a pair.
+
+        :param interface: Name of the interface.
+        :param port: Corosync port number.
+        :param staleness: Maximum age(in seconds) of the last packet.
+
+        :returns: True if a packet was seen within staleness seconds.
+        """
+        age = self.get_heartbeat_ages().get((interface, port))
+        return age is not None and age <= staleness
@@ -12,19 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import socket
+import time
 
-from collections import deque
 import eventlet
+from eventlet import tpool
 from oslo_log import log as oslo_logging
 from oslo_utils import timeutils
 
 import masakarimonitors.conf
 from masakarimonitors.ha import masakari
 import masakarimonitors.hostmonitor.driver as driver
+from masakarimonitors.hostmonitor import health_history
+from masakarimonitors.hostmonitor.host_handler import cib_events
+from masakarimonitors.hostmonitor.host_handler import corosync_sniffer
 from masakarimonitors.hostmonitor.host_handler import hold_host_status
 from masakarimonitors.hostmonitor.host_handler import parse_cib_xml
 from masakarimonitors.hostmonitor.host_handler import parse_crmmon_xml
+from masakarimonitors.hostmonitor.host_handler import power_check
+from masakarimonitors.hostmonitor import scheduler
+from masakarimonitors.hostmonitor import stabilisation
+from masakarimonitors.hostmonitor import storm_guard
 from masakarimonitors.objects import event_constants as ec
 from masakarimonitors import utils
 
@@ -53,31 +62,58 @@ class HandleHost(driver.DriverBase):
     def __init__(self):
         super(HandleHost, self).__init__()
         self.my_hostname = socket.gethostname()
-        self.xml_parser = parse_cib_xml.ParseCibXml()
-        self.crmmon_xml_parser = parse_crmmon_xml.ParseCrmMonXml()
+        if CONF.host.xml_parser_backend == 'lxml':
+            self.xml_parser = parse_cib_xml.StreamParseCibXml()
+            self.crmmon_xml_parser = parse_crmmon_xml.StreamParseCrmMonXml()
+        else:
+            self.xml_parser = parse_cib_xml.ParseCibXml()
+            self.crmmon_xml_parser = parse_crmmon_xml.ParseCrmMonXml()
         self.status_holder = hold_host_status.HostHoldStatus()
         self.notifier = masakari.SendNotification()
-        self.monitoring_data = {}
+        self.monitoring_data = health_history.HealthHistory(
+            CONF.host.monitoring_samples,
+            policy=stabilisation.get_policy())
+        self.corosync_sniffer = None
+        self.corosync_sniffer_failed = False
+        # Version of the last cib whose node states were derived, the
+        # derived node states and the hosts whose stabilised status may
+        # still change without the cib changing.
+        self.cib_version = None
+        self.cib_node_states = []
+        self.unsettled_hosts = set()
+        # Configuration version (admin_epoch, epoch) of the current cib and
+        # of the resources section held by the cib parser.
+        self.cib_config_version = None
+        self.cib_resources_version = None
+        self.query_stats = {'queries': 0, 'bytes': 0, 'parse_time': 0.0}
+        # Pool of the power status checks of the hosts which went offline,
+        # and the expiry time of the recent power off results by hostname.
+        self.ipmi_check_pool = eventlet.GreenPool(
+            CONF.host.ipmi_check_workers)
+        self.poweroff_cache = {}
+        self.power_check = None
+        # Pacemaker services detected by the single_pass probe mode and
+        # their expiry time, and the time taken by the probes of a cycle.
+        self.services_status = None
+        self.services_status_expiry = 0
+        self.probe_timings = {}
+        self.cib_event_listener = None
+        # Name of the DC, whose hostmonitor is the designated notifier.
+        self.dc_name = None
+        self.storm_guard = storm_guard.StormGuard('pacemaker')
+        self.scheduler = scheduler.FixedRateScheduler(
+            'pacemaker', CONF.host.monitoring_interval)
 
     def _update_monitoring_data(self, hostname, status):
-        health_history = self.monitoring_data.setdefault(
-            hostname, deque([], maxlen=CONF.host.monitoring_samples))
-        health_history.append(status)
+        self.monitoring_data.append(hostname, status)
 
     def get_stabilised_host_status(self, hostname):
-        health_history = self.monitoring_data.get(hostname)
-        if len(health_history) < CONF.host.monitoring_samples:
-            LOG.debug("Not enough monitoring data for host %s.", hostname)
-            return '_being_collected'
-
-        stabilised_status = health_history[0]
-
         # If and only if the sequence of host status is consistently the same,
-        # will it return that status.
-        if len(health_history) == health_history.count(stabilised_status):
-            return stabilised_status
-        else:
-            return '_uncertain'
+        # will it return that status, '_uncertain' otherwise.
+        stabilised_status = self.monitoring_data.get_stabilised(hostname)
+        if stabilised_status == health_history.COLLECTING:
+            LOG.debug("Not enough monitoring data for host %s.", hostname)
+        return stabilised_status
 
     def _check_pacemaker_services(self, target_service):
         try:
@@ -98,11 +134,11 @@ class HandleHost(driver.DriverBase):
                         target_service, exc_info=True)
             return False
 
-    def _check_hb_line(self):
-        """Check whether the corosync communication is normal.
+    def _get_pacemaker_services_status(self):
+        """Get whether the Corosync/Pacemaker services are running.
 
-        :returns: 0 if normal, 1 if abnormal, 2 if configuration file is
-            wrong or neither pacemaker nor pacemaker-remote is running.
+        :returns: Tuple of the status of corosync, pacemaker and
+            pacemaker_remote.
         """
         if CONF.host.pacemaker_node_type == 'autodetect':
             # Check whether the Corosync/Pacemaker services are running.
@@ -118,6 +154,32 @@ class HandleHost(driver.DriverBase):
             pacemaker_remote_status = (
                 CONF.host.pacemaker_node_type == 'remote')
 
+        return corosync_status, pacemaker_status, pacemaker_remote_status
+
+    def _get_cached_pacemaker_services_status(self):
+        now = time.monotonic()
+        if self.services_status is None or \
+                now >= self.services_status_expiry:
+            self.services_status = self._get_pacemaker_services_status()
+            self.services_status_expiry = \
+                now + CONF.host.pacemaker_service_cache_ttl
+        return self.services_status
+
+    def _check_hb_line(self, services_status=None):
+        """Check whether the corosync communication is normal.
+
+        :param services_status: Tuple returned by
+            _get_pacemaker_services_status. The services are checked if
+            it is not given.
+
+        :returns: 0 if normal, 1 if abnormal, 2 if configuration file is
+            wrong or neither pacemaker nor pacemaker-remote is running.
+        """
+        if services_status is None:
+            services_status = self._get_pacemaker_services_status()
+        corosync_status, pacemaker_status, pacemaker_remote_status = \
+            services_status
+
         if corosync_status is False or pacemaker_status is False:
             if pacemaker_remote_status is False:
                 LOG.error(
@@ -145,7 +207,23 @@ class HandleHost(driver.DriverBase):
             LOG.error("%s", msg)
             return 2
 
-        is_nic_normal = False
+        is_nic_normal = None
+        if CONF.host.corosync_heartbeat_check == 'sniffer':
+            is_nic_normal = self._check_hb_line_by_sniffer(
+                corosync_multicast_interfaces, corosync_multicast_ports)
+
+        if is_nic_normal is None:
+            is_nic_normal = self._check_hb_line_by_tcpdump(
+                corosync_multicast_interfaces, corosync_multicast_ports)
+
+        if is_nic_normal is False:
+            LOG.error("Corosync communication is failed.")
+            return 1
+
+        return 0
+
+    def _check_hb_line_by_tcpdump(self, corosync_multicast_interfaces,
+                                  corosync_multicast_ports):
         for num in range(0, len(corosync_multicast_interfaces)):
             cmd_str = ("timeout %s tcpdump -n -c 1 -p -i %s port %d") \
                 % (CONF.host.tcpdump_timeout,
@@ -161,18 +239,63 @@ class HandleHost(driver.DriverBase):
                 msg = ("Corosync communication using '%s' is normal.") \
                     % corosync_multicast_interfaces[num]
                 LOG.info("%s", msg)
-                is_nic_normal = True
-                break
+                return True
             except Exception:
                 msg = ("Corosync communication using '%s' is failed.") \
                     % corosync_multicast_interfaces[num]
                 LOG.warning("%s", msg)
 
-        if is_nic_normal is False:
-            LOG.error("Corosync communication is failed.")
-            return 1
+        return False
 
-        return 0
+    def _get_corosync_sniffer(self, corosync_multicast_interfaces,
+                              corosync_multicast_ports):
+        if self.corosync_sniffer_failed:
+            return None
+
+        if self.corosync_sniffer is None:
+            sniffer = corosync_sniffer.CorosyncSniffer(
+                corosync_multicast_interfaces, corosync_multicast_ports)
+            try:
+                sniffer.start()
+            except Exception:
+                # Typically the CAP_NET_RAW capability is missing, which
+                # won't change for the life of the process.
+                LOG.warning("Failed to start corosync sniffer, falling back"
+                            " to tcpdump.", exc_info=True)
+                self.corosync_sniffer_failed = True
+                return None
+            self.corosync_sniffer = sniffer
+
+        return self.corosync_sniffer
+
+    def _check_hb_line_by_sniffer(self, corosync_multicast_interfaces,
+                                  corosync_multicast_ports):
+        """Check the corosync communication with the passive sniffer.
+
+        :returns: True if normal, False if abnormal, None if the sniffer
+            is not available.
+        """
+        sniffer = self._get_corosync_sniffer(corosync_multicast_interfaces,
+                                             corosync_multicast_ports)
+        if sniffer is None:
+            return None
+
+        LOG.debug("Age of the last corosync packets: %s",
+                  sniffer.get_heartbeat_ages())
+
+        is_nic_normal = False
+        for interface, port in zip(corosync_multicast_interfaces,
+                                   corosync_multicast_ports):
+            if sniffer.is_alive(interface, port,
+                                CONF.host.corosync_heartbeat_staleness):
+                LOG.info("Corosync communication using '%s' is normal.",
+                         interface)
+                is_nic_normal = True
+                break
+            LOG.warning("Corosync communication using '%s' is failed.",
+                        interface)
+
+        return is_nic_normal
 
     def _check_host_status_by_crmadmin(self):
         try:
@@ -198,10 +321,39 @@ class HandleHost(driver.DriverBase):
                         self.my_hostname)
             return 1
 
-    def _get_cib_xml(self):
+    def _reset_query_stats(self):
+        self.query_stats = {'queries': 0, 'bytes': 0, 'parse_time': 0.0}
+
+    def _record_query(self, out):
+        self.query_stats['queries'] += 1
+        self.query_stats['bytes'] += len(out or '')
+
+    @contextlib.contextmanager
+    def _measure_parse(self):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.query_stats['parse_time'] += time.monotonic() - start
+
+    def _log_query_stats(self):
+        if CONF.host.log_cluster_query_stats:
+            LOG.info("Pacemaker queries fetched %(bytes)d bytes in"
+                     " %(queries)d queries, parsed in %(parse_ms).3f ms.",
+                     {'bytes': self.query_stats['bytes'],
+                      'queries': self.query_stats['queries'],
+                      'parse_ms': self.query_stats['parse_time'] * 1000})
+
+    def _get_cib_xml(self, *options):
+        """Get cib in XML format.
+
+        :param options: Additional options of cibadmin, e.g. to limit the
+            scope of the query.
+        """
         try:
             # Execute cibadmin command.
-            out, err = utils.execute('cibadmin', '--query', run_as_root=True)
+            out, err = utils.execute('cibadmin', '--query', *options,
+                                     run_as_root=True)
 
             if err:
                 msg = ("cibadmin command output stderr: %s") % err
@@ -211,13 +363,27 @@ class HandleHost(driver.DriverBase):
             LOG.warning("Exception caught: %s", e)
             return
 
+        self._record_query(out)
         return out
 
-    def _get_crmmon_xml(self):
-        """Get summary of cluster's current state in XML format."""
+    def _get_crmmon_xml(self, sections=('dc', 'nodes', 'times')):
+        """Get summary of cluster's current state in XML format.
+
+        :param sections: Sections of crm_mon xml queried with the minimal
+            cluster_query_scope.
+        """
+        if CONF.host.cluster_query_scope == 'minimal':
+            # By default, only the DC (with quorum), nodes and times
+            # sections are needed. The last_change of the times section
+            # tells whether the cached resources section is still valid.
+            command = ('crm_mon', '--output-as=xml', '--exclude=all',
+                       '--include=%s' % ','.join(sections))
+        else:
+            command = ('crm_mon', '-X')
+
         try:
             # Execute crm_mon command.
-            out, err = utils.execute('crm_mon', '-X', run_as_root=True)
+            out, err = utils.execute(*command, run_as_root=True)
 
             if err:
                 msg = ("crmmon command output stderr: %s") % err
@@ -227,48 +393,99 @@ class HandleHost(driver.DriverBase):
             LOG.warning("Exception caught: %s", e)
             return
 
+        self._record_query(out)
         return out
 
+    def _load_cib_resources(self):
+        """Query the resources section of cib if it may have changed.
+
+        The resources section is cached by the cib parser until the
+        configuration version of cib changes.
+        """
+        if self.cib_config_version is not None and \
+                self.cib_config_version == self.cib_resources_version:
+            return
+
+        resources_xml = self._get_cib_xml('--scope', 'resources')
+        if resources_xml is None:
+            return
+
+        with self._measure_parse():
+            self.xml_parser.set_resources_xml(resources_xml)
+        self.cib_resources_version = self.cib_config_version
+
+    def _get_stonith_ipmi_params(self, hostname):
+        if CONF.host.cluster_query_scope == 'minimal' or \
+                CONF.host.probe_mode == 'single_pass':
+            self._load_cib_resources()
+        return self.xml_parser.get_stonith_ipmi_params(hostname)
+
+    def _get_power_check(self):
+        if self.power_check is None:
+            self.power_check = power_check.get_power_check(
+                CONF.host.power_check_backend)
+        return self.power_check
+
     def _is_poweroff(self, hostname):
-        ipmi_values = self.xml_parser.get_stonith_ipmi_params(hostname)
+        ipmi_values = self._get_stonith_ipmi_params(hostname)
         if ipmi_values is None:
             LOG.error("Failed to get params of ipmi RA.")
             return False
 
-        cmd_str = ("timeout %s ipmitool -U %s -P %s -I %s -H %s "
-                   "power status") \
-            % (str(CONF.host.ipmi_timeout), ipmi_values['userid'],
-               ipmi_values['passwd'], ipmi_values['interface'],
-               ipmi_values['ipaddr'])
-        command = cmd_str.split()
-
+        checker = self._get_power_check()
         retry_count = 0
         while True:
+            started = time.monotonic()
             try:
-                # Execute ipmitool command.
-                out, err = utils.execute(*command, run_as_root=False)
-
-                if err:
-                    msg = ("ipmitool command output stderr: %s") % err
-                    raise Exception(msg)
-
-                msg = ("ipmitool command output stdout: %s") % out
-
-                if 'Power is off' in out:
-                    LOG.info("%s", msg)
+                # Check the power status in a native thread so that the
+                # checks of other hosts can run meanwhile.
+                power_state = tpool.execute(checker.get_power_state,
+                                            ipmi_values)
+                LOG.info("Power status of '%s' checked by %s in %.3f "
+                         "seconds.", hostname, CONF.host.power_check_backend,
+                         time.monotonic() - started)
+
+                if power_state == power_check.POWER_OFF:
                     return True
                 else:
-                    raise Exception(msg)
+                    raise Exception("Power status of '%s' is '%s'."
+                                    % (hostname, power_state))
 
             except Exception as e:
                 if retry_count < CONF.host.ipmi_retry_max:
-                    LOG.warning("Retry executing ipmitool command. (%s)", e)
+                    LOG.warning("Retry checking power status. (%s)", e)
                     retry_count = retry_count + 1
                     eventlet.greenthread.sleep(CONF.host.ipmi_retry_interval)
                 else:
                     LOG.error("Exception caught: %s", e)
                     return False
 
+    def _check_poweroff(self, hostname):
+        expiry = self.poweroff_cache.get(hostname)
+        if expiry is not None and expiry > time.monotonic():
+            LOG.info("Reusing the power off check result of '%s'.",
+                     hostname)
+            return True
+
+        started = time.monotonic()
+        is_poweroff = None
+        with eventlet.Timeout(CONF.host.ipmi_check_deadline or None, False):
+            is_poweroff = self._is_poweroff(hostname)
+        if is_poweroff is None:
+            LOG.error("Power status check of '%s' didn't complete within "
+                      "%s seconds.", hostname, CONF.host.ipmi_check_deadline)
+            is_poweroff = False
+        LOG.info("Power status check of '%s' took %.1f seconds.",
+                 hostname, time.monotonic() - started)
+
+        # Only a confirmed power off is cached. A failed or timed out check
+        # must be retried, as reusing it would report the host as unknown
+        # and prevent its recovery.
+        if is_poweroff and CONF.host.ipmi_check_cache_ttl:
+            self.poweroff_cache[hostname] = \
+                time.monotonic() + CONF.host.ipmi_check_cache_ttl
+        return is_poweroff
+
     def _make_event(self, hostname, current_status):
 
         if current_status == 'online':
@@ -283,7 +500,7 @@ class HandleHost(driver.DriverBase):
             cluster_status = current_status.upper()
 
             if not CONF.host.disable_ipmi_check:
-                if self._is_poweroff(hostname):
+                if self._check_poweroff(hostname):
                     # Set value that host status is normal.
                     host_status = ec.EventConstants.HOST_STATUS_NORMAL
                 else:
@@ -318,7 +535,20 @@ class HandleHost(driver.DriverBase):
         except ValueError:
             return host_status
 
+    def _is_designated_notifier(self):
+        """Answers if this hostmonitor sends the notifications.
+
+        With [host]designated_notifier, only the hostmonitor of the DC
+        sends them, the others keep monitoring to take over when the DC
+        changes.
+        """
+        if not CONF.host.designated_notifier:
+            return True
+        return self.dc_name == self.my_hostname
+
     def _check_if_status_changed(self, node_state_tag_list):
+        is_designated_notifier = self._is_designated_notifier()
+        went_offline = []
 
         # Check if host status changed.
         for node_state_tag in node_state_tag_list:
@@ -331,6 +561,9 @@ class HandleHost(driver.DriverBase):
                 node_state_tag.get('crmd')
             )
             self._update_monitoring_data(hostname, current_status)
+            if current_status == 'online':
+                # The host is powered on, whatever was checked before.
+                self.poweroff_cache.pop(hostname, None)
             old_status = self._normalize_host_status(
                 self.status_holder.get_host_status(hostname)
             )
@@ -342,6 +575,7 @@ class HandleHost(driver.DriverBase):
                     % (hostname, current_status)
                 LOG.info("%s", msg)
                 self.status_holder.set_host_status(node_state_tag)
+                self.unsettled_hosts.add(hostname)
                 continue
 
             stabilised_status = self.get_stabilised_host_status(hostname)
@@ -353,8 +587,14 @@ class HandleHost(driver.DriverBase):
             LOG.info("%s", msg)
 
             if stabilised_status == '_being_collected':
+                self.unsettled_hosts.add(hostname)
                 continue
 
+            if stabilised_status == '_uncertain':
+                self.unsettled_hosts.add(hostname)
+            else:
+                self.unsettled_hosts.discard(hostname)
+
             # If host stabilised status changed, send a notification.
             if stabilised_status != old_status:
                 if stabilised_status not in ['online', 'offline']:
@@ -364,27 +604,127 @@ class HandleHost(driver.DriverBase):
                            " hostmonitor doesn't send a notification.") \
                         % stabilised_status
                     LOG.info("%s", msg)
+                elif not is_designated_notifier:
+                    # The status change isn't recorded, so that it is
+                    # notified if this hostmonitor becomes the designated
+                    # notifier before the host status changes back.
+                    LOG.info("'%s' is '%s', it is notified by the"
+                             " hostmonitor of the DC '%s'.",
+                             hostname, stabilised_status, self.dc_name)
+                    continue
+                elif stabilised_status == 'offline':
+                    went_offline.append(node_state_tag)
+                    continue
                 else:
-                    event = self._make_event(hostname, stabilised_status)
-
-                    # Send a notification.
-                    self.notifier.send_notification(
-                        CONF.host.api_retry_max,
-                        CONF.host.api_retry_interval,
-                        event)
+                    self._notify_status_change(hostname, stabilised_status)
 
                 if stabilised_status != '_uncertain':
                     # Update host status.
                     self.status_holder.set_host_status(node_state_tag)
 
+        self._notify_went_offline(went_offline)
+
+        # Wait for the notifications of the hosts which went offline, so that
+        # they are not sent after a later status change of the same host.
+        self.ipmi_check_pool.waitall()
+
+    def _notify_went_offline(self, node_state_tag_list):
+        # The hosts which went offline are notified together, unless the
+        # storm guard holds or suppresses their notifications.
+        hostnames = [node_state_tag.get('uname')
+                     for node_state_tag in node_state_tag_list]
+        allowed = self.storm_guard.filter(hostnames,
+                                          len(self.monitoring_data))
+        for node_state_tag, hostname in zip(node_state_tag_list, hostnames):
+            if hostname not in allowed:
+                if self.storm_guard.hold:
+                    # The status change isn't recorded, so that the host is
+                    # checked and notified again after the storm.
+                    self.unsettled_hosts.add(hostname)
+                    continue
+            elif CONF.host.disable_ipmi_check:
+                self._notify_status_change(hostname, 'offline')
+            else:
+                # Check the power status of the hosts which went offline
+                # concurrently.
+                self.ipmi_check_pool.spawn_n(self._notify_offline, hostname)
+
+            # Update host status.
+            self.status_holder.set_host_status(node_state_tag)
+
+    def _notify_status_change(self, hostname, stabilised_status):
+        event = self._make_event(hostname, stabilised_status)
+
+        # Send a notification.
+        self.notifier.send_notification(
+            CONF.host.api_retry_max,
+            CONF.host.api_retry_interval,
+            event)
+
+    def _notify_offline(self, hostname):
+        # Run in the ipmi check pool, where an exception would only be
+        # printed by the hub.
+        try:
+            self._notify_status_change(hostname, 'offline')
+        except Exception:
+            LOG.exception("Failed to notify that '%s' went offline.",
+                          hostname)
+
     def _check_host_status_by_crm_mon(self):
         crmmon_xml = self._get_crmmon_xml()
         if crmmon_xml is None:
             # crm_mon command failure.
             return 1
 
+        return self._check_host_status_by_crmmon_xml(crmmon_xml)
+
+    def _check_own_host_status_by_crm_mon(self, node_state_tag_list):
+        """Check the host status is stable or unstable by crm_mon xml.
+
+        This host is stable if it is online, neither pending nor unclean,
+        and the DC is elected. Unlike crmadmin, a transition in progress
+        is not detected.
+
+        :returns: 0 if stable, 1 if unstable.
+        """
+        for node_state_tag in node_state_tag_list:
+            if node_state_tag.get('name') != self.my_hostname:
+                continue
+            if node_state_tag.get('online') == 'true' and \
+                    node_state_tag.get('pending') != 'true' and \
+                    node_state_tag.get('unclean') != 'true' and \
+                    self.crmmon_xml_parser.has_dc():
+                return 0
+            break
+
+        LOG.warning("'%s' is unstable state on cluster.", self.my_hostname)
+        return 1
+
+    def _check_host_status_by_crmmon_xml(self, crmmon_xml,
+                                         check_own_host=False,
+                                         remotes_only=True):
+        """Check the host status from crm_mon xml.
+
+        :param crmmon_xml: String of crm_mon xml.
+        :param check_own_host: Check whether this host is stable first.
+        :param remotes_only: Only check the pacemaker-remotes.
+
+        :returns: 0 if checked, 1 if this host is unstable, 2 if the
+            cluster doesn't have quorum.
+        """
         # Set to the ParseCrmMonXml object.
-        self.crmmon_xml_parser.set_crmmon_xml(crmmon_xml)
+        with self._measure_parse():
+            self.crmmon_xml_parser.set_crmmon_xml(crmmon_xml)
+
+        # The resources section cached for the ipmi check is valid until
+        # the cib configuration changes.
+        self.cib_config_version = self.crmmon_xml_parser.get_last_change()
+        self.dc_name = self.crmmon_xml_parser.get_dc_name()
+
+        if check_own_host:
+            if self._check_own_host_status_by_crm_mon(
+                    self.crmmon_xml_parser.get_node_state_tag_list()) != 0:
+                return 1
 
         # Check if the cluster has quorum.
         if not self.crmmon_xml_parser.has_quorum():
@@ -402,21 +742,69 @@ class HandleHost(driver.DriverBase):
 
         node_state_tag_list = [CibSchemaCompliantTag(n)
                                for n in node_state_tag_list
-                               if n.get('type') == 'remote']
+                               if not remotes_only or
+                               n.get('type') == 'remote']
         # Check if status changed.
         self._check_if_status_changed(node_state_tag_list)
 
         return 0
 
+    def _check_unchanged_node_states(self):
+        """Check hosts when the cib is unchanged since the last cycle.
+
+        The node states derived from the last cib are reused. Only the
+        sample history of settled hosts is advanced, while hosts whose
+        stabilised status may still change are checked as usual.
+        """
+        unsettled_node_states = []
+        for node_state in self.cib_node_states:
+            hostname = node_state.get('uname')
+            if hostname == self.my_hostname:
+                continue
+
+            if hostname in self.unsettled_hosts:
+                unsettled_node_states.append(node_state)
+            else:
+                self._update_monitoring_data(
+                    hostname,
+                    self._normalize_host_status(node_state.get('crmd')))
+
+        if unsettled_node_states:
+            self._check_if_status_changed(unsettled_node_states)
+
     def _check_host_status_by_cibadmin(self):
         # Get xml of cib info.
-        cib_xml = self._get_cib_xml()
+        if CONF.host.cluster_query_scope == 'minimal':
+            # Only the cib tag, which has the version and quorum.
+            cib_xml = self._get_cib_xml('--no-children')
+        else:
+            cib_xml = self._get_cib_xml()
         if cib_xml is None:
             # cibadmin command failure.
             return 1
 
+        # Skip parsing if the cib is the same as the last cycle.
+        cib_version = parse_cib_xml.get_cib_version(cib_xml)
+        self.cib_config_version = cib_version[:2] if cib_version else None
+        if cib_version is not None and cib_version == self.cib_version:
+            LOG.debug("Cib version %s is unchanged.", cib_version)
+            self._check_unchanged_node_states()
+            return 0
+        self.cib_version = None
+
         # Set to the ParseCibXml object.
-        self.xml_parser.set_cib_xml(cib_xml)
+        if CONF.host.cluster_query_scope == 'minimal':
+            status_xml = self._get_cib_xml('--scope', 'status')
+            if status_xml is None:
+                # cibadmin command failure.
+                return 1
+            with self._measure_parse():
+                self.xml_parser.set_cib_xml(cib_xml, status_xml=status_xml)
+        else:
+            with self._measure_parse():
+                self.xml_parser.set_cib_xml(cib_xml)
+
+        self.dc_name = self.xml_parser.get_dc_name()
 
         # Check if pacemaker cluster have quorum.
         if self.xml_parser.have_quorum() == 0:
@@ -435,10 +823,187 @@ class HandleHost(driver.DriverBase):
         # Check if status changed.
         self._check_if_status_changed(node_state_tag_list)
 
+        self.cib_version = cib_version
+        self.cib_node_states = [
+            {'uname': node_state_tag.get('uname'),
+             'crmd': node_state_tag.get('crmd')}
+            for node_state_tag in node_state_tag_list]
+
         return 0
 
     def stop(self):
         self.running = False
+        if self.corosync_sniffer is not None:
+            self.corosync_sniffer.stop()
+            self.corosync_sniffer = None
+        if self.power_check is not None:
+            self.power_check.close()
+            self.power_check = None
+        if self.cib_event_listener is not None:
+            self.cib_event_listener.stop()
+            self.cib_event_listener = None
+
+    def _run_probe(self, name, func, *args):
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            self.probe_timings[name] = time.monotonic() - started
+
+    def _log_probe_timings(self, cycle_time):
+        if not CONF.host.log_cluster_query_stats:
+            return
+
+        # The corosync communication check and the cluster query run
+        # concurrently, so only the slower one is on the critical path.
+        timings = [(name, self.probe_timings[name])
+                   for name in ('services', 'hb_line', 'cluster_query',
+                                'host_status')
+                   if name in self.probe_timings]
+        concurrent = dict((name, seconds) for name, seconds in timings
+                          if name in ('hb_line', 'cluster_query'))
+        slowest = max(concurrent, key=concurrent.get) if concurrent else None
+        LOG.info("Monitoring cycle took %(cycle).3f seconds (%(probes)s),"
+                 " critical path: %(path)s.",
+                 {'cycle': cycle_time,
+                  'probes': ', '.join('%s: %.3f' % timing
+                                      for timing in timings),
+                  'path': ' -> '.join(name for name, seconds in timings
+                                      if name not in concurrent or
+                                      name == slowest)})
+
+    def _monitor_cycle(self):
+        """Run a monitoring cycle.
+
+        :returns: True if the host status was checked, False if skipped.
+        """
+        # Check whether corosync communication between hosts
+        # is normal.
+        ret = self._check_hb_line()
+        if ret == 1:
+            # Because my host may be fenced by stonith due to split
+            # brain condition, sleep for a certain time.
+            eventlet.greenthread.sleep(CONF.host.stonith_wait)
+        elif ret == 2:
+            LOG.warning("hostmonitor skips monitoring hosts.")
+            return False
+
+        if CONF.host.pacemaker_node_type == 'autodetect':
+            pacemaker_remote_status = self._check_pacemaker_services(
+                'pacemaker_remote')
+        else:
+            pacemaker_remote_status = (
+                CONF.host.pacemaker_node_type == 'remote')
+
+        # Check the host status is stable or unstable by crmadmin.
+        # It only checks when this process runs on the full cluster
+        # stack of corosync.
+        if pacemaker_remote_status is False:
+            if self._check_host_status_by_crmadmin() != 0:
+                LOG.warning("hostmonitor skips monitoring hosts.")
+                return False
+
+        # Check the host status is online or offline.
+        if CONF.host.restrict_to_remotes:
+            status_func = self._check_host_status_by_crm_mon
+        else:
+            status_func = self._check_host_status_by_cibadmin
+
+        self._reset_query_stats()
+        ret = status_func()
+        self._log_query_stats()
+        if ret != 0:
+            LOG.warning("hostmonitor skips monitoring hosts.")
+            return False
+
+        return True
+
+    def _monitor_cycle_single_pass(self):
+        """Run a monitoring cycle with a single cluster query.
+
+        The DC, the quorum and the node states all come from one crm_mon
+        query, which runs while the corosync communication is checked.
+
+        :returns: True if the host status was checked, False if skipped.
+        """
+        started = time.monotonic()
+        self.probe_timings = {}
+        self._reset_query_stats()
+
+        services_status = self._run_probe(
+            'services', self._get_cached_pacemaker_services_status)
+        pacemaker_remote_status = services_status[2]
+
+        # The cluster query waits for crm_mon in a native thread, which
+        # starts before the corosync communication check blocks.
+        cluster_query = eventlet.spawn(
+            tpool.execute, self._run_probe, 'cluster_query',
+            self._get_crmmon_xml)
+        eventlet.greenthread.sleep(0)
+        ret = self._run_probe('hb_line', self._check_hb_line,
+                              services_status)
+        crmmon_xml = cluster_query.wait()
+
+        if ret == 2:
+            # Detect the pacemaker services again in the next cycle.
+            self.services_status = None
+            LOG.warning("hostmonitor skips monitoring hosts.")
+            return False
+        elif ret == 1:
+            # Because my host may be fenced by stonith due to split
+            # brain condition, sleep for a certain time.
+            eventlet.greenthread.sleep(CONF.host.stonith_wait)
+            # The cluster state has been queried before the sleep.
+            crmmon_xml = self._run_probe('cluster_query',
+                                         self._get_crmmon_xml)
+
+        if crmmon_xml is None:
+            # crm_mon command failure.
+            self.services_status = None
+            LOG.warning("hostmonitor skips monitoring hosts.")
+            return False
+
+        # Check the host status is stable or unstable only when this
+        # process runs on the full cluster stack of corosync.
+        ret = self._run_probe(
+            'host_status', self._check_host_status_by_crmmon_xml,
+            crmmon_xml, pacemaker_remote_status is False,
+            CONF.host.restrict_to_remotes)
+        self._log_query_stats()
+        self._log_probe_timings(time.monotonic() - started)
+        if ret != 0:
+            LOG.warning("hostmonitor skips monitoring hosts.")
+            return False
+
+        return True
+
+    def _start_cib_event_listener(self):
+        listener = cib_events.CibEventListener(
+            CONF.host.cib_event_socket, CONF.host.cib_event_socket_group)
+        try:
+            listener.start()
+        except Exception:
+            LOG.warning("Failed to listen to cib change notifications,"
+                        " falling back to polling.", exc_info=True)
+            return
+        self.cib_event_listener = listener
+
+    def _wait_next_cycle(self, checked):
+        """Wait until the next monitoring cycle.
+
+        :param checked: Whether the last cycle checked the host status.
+        """
+        # The status of unsettled hosts is sampled every monitoring
+        # interval, as is the cluster state when the last check failed.
+        if self.cib_event_listener is None or not checked or \
+                self.unsettled_hosts:
+            self.scheduler.wait()
+            return
+
+        events = self.cib_event_listener.wait(
+            CONF.host.cib_event_poll_interval)
+        if events:
+            LOG.debug("Cib change notified: %s", events)
 
     def monitor_hosts(self):
         """Host monitoring main method.
@@ -446,47 +1011,20 @@ class HandleHost(driver.DriverBase):
         This method monitors hosts.
         """
         self.running = True
+        if CONF.host.monitoring_mode == 'event':
+            self._start_cib_event_listener()
+
         while self.running:
+            checked = False
+            self.scheduler.start_cycle()
             try:
-                # Check whether corosync communication between hosts
-                # is normal.
-                ret = self._check_hb_line()
-                if ret == 1:
-                    # Because my host may be fenced by stonith due to split
-                    # brain condition, sleep for a certain time.
-                    eventlet.greenthread.sleep(CONF.host.stonith_wait)
-                elif ret == 2:
-                    LOG.warning("hostmonitor skips monitoring hosts.")
-                    eventlet.greenthread.sleep(CONF.host.monitoring_interval)
-                    continue
-
-                if CONF.host.pacemaker_node_type == 'autodetect':
-                    pacemaker_remote_status = self._check_pacemaker_services(
-                        'pacemaker_remote')
+                if CONF.host.probe_mode == 'single_pass':
+                    checked = self._monitor_cycle_single_pass()
                 else:
-                    pacemaker_remote_status = (
-                        CONF.host.pacemaker_node_type == 'remote')
-
-                # Check the host status is stable or unstable by crmadmin.
-                # It only checks when this process runs on the full cluster
-                # stack of corosync.
-                if pacemaker_remote_status is False:
-                    if self._check_host_status_by_crmadmin() != 0:
-                        LOG.warning("hostmonitor skips monitoring hosts.")
-                        eventlet.greenthread.sleep(
-                            CONF.host.monitoring_interval)
-                        continue
-
-                # Check the host status is online or offline.
-                if CONF.host.restrict_to_remotes:
-                    status_func = self._check_host_status_by_crm_mon
-                else:
-                    status_func = self._check_host_status_by_cibadmin
-
-                if status_func() != 0:
-                    LOG.warning("hostmonitor skips monitoring hosts.")
+                    checked = self._monitor_cycle()
 
             except Exception as e:
                 LOG.exception("Exception caught: %s", e)
 
-            eventlet.greenthread.sleep(CONF.host.monitoring_interval)
+            self.scheduler.finish_cycle()
+            self._wait_next_cycle(checked)
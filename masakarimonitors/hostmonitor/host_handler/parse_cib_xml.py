@@ -12,12 +12,58 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import re
 from xml.etree import ElementTree
 
+from lxml import etree
 from oslo_log import log as oslo_logging
 
 LOG = oslo_logging.getLogger(__name__)
 
+# Attributes of the cib tag which identify a version of the cib.
+CIB_VERSION_ATTRIBUTES = ('admin_epoch', 'epoch', 'num_updates')
+
+# Names of the params of the fence_ipmilan RA, by the name of the
+# corresponding param of the external/ipmi RA.
+_FENCE_IPMILAN_PARAMS = (
+    ('ipaddr', ('ip', 'ipaddr')),
+    ('userid', ('username', 'login')),
+    ('passwd', ('password', 'passwd')),
+)
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+_CIB_START_TAG_RE = re.compile(r'<cib\b[^>]*>')
+_ATTRIBUTE_RE = re.compile(r'''([\w:.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+
+
+def get_cib_version(cib_xml):
+    """Get the version of cib xml without parsing the whole document.
+
+    Pacemaker increments admin_epoch, epoch or num_updates of the cib tag
+    whenever the cib changes, so two cib xml strings with the same version
+    describe the same cluster state.
+
+    :params cib_xml: String of cib xml
+
+    :returns: Tuple of (admin_epoch, epoch, num_updates), or None if the
+              cib tag or one of these attributes is missing.
+    """
+    match = _CIB_START_TAG_RE.search(cib_xml)
+    if match is None:
+        return None
+
+    attributes = {}
+    for name, double_quoted, single_quoted in \
+            _ATTRIBUTE_RE.findall(match.group(0)):
+        attributes[name] = double_quoted or single_quoted
+
+    try:
+        return tuple(int(attributes[attribute])
+                     for attribute in CIB_VERSION_ATTRIBUTES)
+    except (KeyError, ValueError):
+        return None
+
 
 class ParseCibXml(object):
     """ParseCibXml class
@@ -27,18 +73,43 @@ class ParseCibXml(object):
 
     def __init__(self):
         self.cib_tag = None
-
-    def set_cib_xml(self, cib_xml):
+        self.resources_tag = None
+        # Index of ipmi RA's params by hostname, and the configuration
+        # version and the resources tag it was built from.
+        self.ipmi_params_index = None
+        self.ipmi_params_version = None
+        self.ipmi_params_resources_tag = None
+
+    def set_cib_xml(self, cib_xml, status_xml=None):
         """Set xml.etree.ElementTree.Element object.
 
         This method recieves string of cib xml, and convert it
         to xml.etree.ElementTree.Element object.
 
         :params cib_xml: String of cib xml
+        :params status_xml: String of the status section of cib xml, if it
+                            was queried separately from the cib tag.
         """
         # Convert xml.etree.ElementTree.Element object.
         self.cib_tag = ElementTree.fromstring(cib_xml)
 
+        if status_xml is not None:
+            status_tag = self._get_status_tag()
+            if status_tag is not None:
+                self.cib_tag.remove(status_tag)
+            self.cib_tag.append(ElementTree.fromstring(status_xml))
+
+    def set_resources_xml(self, resources_xml):
+        """Set the resources section of cib xml.
+
+        The resources section is used by get_stonith_ipmi_params when the
+        cib xml set by set_cib_xml doesn't have the configuration tag.
+
+        :params resources_xml: String of the resources section of cib xml
+        """
+        self.resources_tag = ElementTree.fromstring(resources_xml)
+        self.ipmi_params_index = None
+
     def have_quorum(self):
         """Returns if cluster has quorum or not.
 
@@ -46,6 +117,20 @@ class ParseCibXml(object):
         """
         return int(self.cib_tag.get('have-quorum'))
 
+    def get_dc_name(self):
+        """Get the name of the DC.
+
+        :returns: uname of the node_state tag of the DC, or None if no DC
+            is elected.
+        """
+        dc_uuid = self._get_cib_attributes().get('dc-uuid')
+        if dc_uuid is None:
+            return None
+        for node_state_tag in self.get_node_state_tag_list():
+            if node_state_tag.get('id') == dc_uuid:
+                return node_state_tag.get('uname')
+        return None
+
     def _get_status_tag(self):
         # status tag exists in the cib tag.
         child_list = list(self.cib_tag)
@@ -85,76 +170,98 @@ class ParseCibXml(object):
 
         return node_state_tag_list
 
-    def _parse_instance_attributes_tag(self,
-                                       instance_attributes_tag, hostname):
-        # Parse nvpair tag under the instance_attributes tag.
-        is_target_ipmi = False
+    def _parse_external_ipmi(self, nvpairs):
+        hostname = nvpairs.get('hostname')
+        if hostname is None:
+            return []
+
         ipmi_values = {}
+        for name in ('ipaddr', 'userid', 'passwd', 'interface'):
+            if name in nvpairs:
+                ipmi_values[name] = nvpairs[name]
+        return [(hostname, ipmi_values)]
 
-        nvpair_tag_list = list(instance_attributes_tag)
-        for nvpair_tag in nvpair_tag_list:
-            if nvpair_tag.get('name') == 'hostname' and \
-                nvpair_tag.get('value') == hostname:
-                is_target_ipmi = True
-            elif nvpair_tag.get('name') == 'ipaddr':
-                ipmi_values['ipaddr'] = nvpair_tag.get('value')
-            elif nvpair_tag.get('name') == 'userid':
-                ipmi_values['userid'] = nvpair_tag.get('value')
-            elif nvpair_tag.get('name') == 'passwd':
-                ipmi_values['passwd'] = nvpair_tag.get('value')
-            elif nvpair_tag.get('name') == 'interface':
-                ipmi_values['interface'] = nvpair_tag.get('value')
-
-        if is_target_ipmi is True:
-            return ipmi_values
+    def _parse_fence_ipmilan(self, nvpairs):
+        hostnames = nvpairs.get('pcmk_host_list', '').replace(',', ' ')
+        ipmi_values = {}
+        for name, aliases in _FENCE_IPMILAN_PARAMS:
+            for alias in aliases:
+                if alias in nvpairs:
+                    ipmi_values[name] = nvpairs[alias]
+                    break
+        if nvpairs.get('lanplus', '').lower() in _TRUE_VALUES:
+            ipmi_values['interface'] = 'lanplus'
         else:
-            return None
-
-    def _parse_primitive_tag(self, primitive_tag, hostname):
-        if primitive_tag.get('type') != 'external/ipmi':
-            return None
+            ipmi_values['interface'] = 'lan'
+        return [(hostname, ipmi_values) for hostname in hostnames.split()]
+
+    def _parse_primitive_tag(self, primitive_tag):
+        # Parse nvpair tag under the instance_attributes tags.
+        if primitive_tag.get('type') == 'external/ipmi':
+            parse_nvpairs = self._parse_external_ipmi
+        elif primitive_tag.get('type') == 'fence_ipmilan':
+            parse_nvpairs = self._parse_fence_ipmilan
+        else:
+            return []
 
-        # Parse instance_attributes tag under the primitive tag.
-        child_list = list(primitive_tag)
-        for child in child_list:
+        ipmi_params = []
+        for child in primitive_tag:
             if child.tag == 'instance_attributes':
-                ipmi_values = self._parse_instance_attributes_tag(
-                    child, hostname)
-                if ipmi_values is not None:
-                    return ipmi_values
-        return None
-
-    def _parse_group_tag(self, group_tag, hostname):
-        # Parse primitive tag under the group tag.
-        child_list = list(group_tag)
-        for child in child_list:
-            if child.tag == 'primitive':
-                ipmi_values = self._parse_primitive_tag(child, hostname)
-                if ipmi_values is not None:
-                    return ipmi_values
-        return None
-
-    def get_stonith_ipmi_params(self, hostname):
-        """Get stonith ipmi params from cib xml.
-
-        This method gets params of ipmi resource agent(RA) which is set on
-        resources tag.
-        The resources tag exists under the configuration tag.
-        And it is assumed that ipmi RA belongs to some resource group.
-
-        :params hostname: hostname
+                nvpairs = {}
+                for nvpair_tag in child:
+                    if nvpair_tag.tag == 'nvpair':
+                        nvpairs.setdefault(nvpair_tag.get('name'),
+                                           nvpair_tag.get('value'))
+                ipmi_params.extend(parse_nvpairs(nvpairs))
+        return ipmi_params
+
+    def _build_ipmi_params_index(self, resources_tag):
+        # ipmi RAs are primitive tags which exist under the resources tag
+        # or under a group tag of it.
+        index = {}
+        for child in resources_tag:
+            if child.tag == 'group':
+                primitive_tags = [primitive_tag for primitive_tag in child
+                                  if primitive_tag.tag == 'primitive']
+            elif child.tag == 'primitive':
+                primitive_tags = [child]
+            else:
+                continue
+
+            for primitive_tag in primitive_tags:
+                for hostname, ipmi_values in \
+                        self._parse_primitive_tag(primitive_tag):
+                    # The first RA of a host wins.
+                    index.setdefault(hostname, ipmi_values)
+        return index
+
+    def _get_cib_attributes(self):
+        if self.cib_tag is None:
+            return {}
+        return self.cib_tag.attrib
+
+    def _get_config_version(self):
+        # admin_epoch and epoch are incremented whenever the configuration
+        # section changes.
+        attributes = self._get_cib_attributes()
+        try:
+            return (int(attributes['admin_epoch']),
+                    int(attributes['epoch']))
+        except (KeyError, ValueError):
+            return None
 
-        :returns: Dictionary of ipmi RA's params.
-                  They are ipaddr, userid, passwd and interface.
-        """
+    def _get_resources_tag(self):
         # Get configuration tag from cib tag.
         configuration_tag = None
-        child_list = list(self.cib_tag)
+        child_list = list(self.cib_tag) if self.cib_tag is not None else []
         for child in child_list:
             if child.tag == 'configuration':
                 configuration_tag = child
                 break
         if configuration_tag is None:
+            # The resources section may have been queried separately.
+            if self.resources_tag is not None:
+                return self.resources_tag
             LOG.error("Cib xml doesn't have configuration tag.")
             return None
 
@@ -169,14 +276,140 @@ class ParseCibXml(object):
             LOG.error("Cib xml doesn't have resources tag.")
             return None
 
-        # They are set at nvpair tag which exists under the
-        # instance_attributes of primitive of group tag.
-        ipmi_values = None
-        child_list = list(resources_tag)
-        for child in child_list:
-            if child.tag == 'group':
-                ipmi_values = self._parse_group_tag(child, hostname)
-                if ipmi_values is not None:
-                    break
+        return resources_tag
+
+    def get_stonith_ipmi_params(self, hostname):
+        """Get stonith ipmi params from cib xml.
+
+        This method gets params of ipmi resource agent(RA) which is set on
+        resources tag.
+        The resources tag exists under the configuration tag.
+        Both external/ipmi and fence_ipmilan RAs are supported, whether or
+        not they belong to some resource group.
+        The params of all hosts are indexed by hostname at the first call,
+        and the index is reused until the configuration changes. Without
+        the configuration version, e.g. when only the resources section
+        was set, it is reused until another resources section is set.
+
+        :params hostname: hostname
+
+        :returns: Dictionary of ipmi RA's params.
+                  They are ipaddr, userid, passwd and interface.
+        """
+        config_version = self._get_config_version()
+        if self.ipmi_params_index is None or config_version is None or \
+                config_version != self.ipmi_params_version:
+            resources_tag = self._get_resources_tag()
+            if resources_tag is None:
+                return None
+            if self.ipmi_params_index is None or \
+                    resources_tag is not self.ipmi_params_resources_tag:
+                self.ipmi_params_index = self._build_ipmi_params_index(
+                    resources_tag)
+                self.ipmi_params_resources_tag = resources_tag
+            self.ipmi_params_version = config_version
+
+        return self.ipmi_params_index.get(hostname)
+
+
+class StreamParseCibXml(ParseCibXml):
+    """StreamParseCibXml class
+
+    This class parses the cib xml with lxml.etree.iterparse.
+    Only the attributes of the cib tag and of the node_state tags are kept,
+    as dictionaries, and every other element is freed as soon as it has
+    been parsed. The resources section is the only subtree kept, so that
+    get_stonith_ipmi_params works as with ParseCibXml.
+    """
+
+    def __init__(self):
+        super(StreamParseCibXml, self).__init__()
+        self.cib_attributes = {}
+        self.node_states = None
+        self.configuration_resources_tag = None
+
+    def _iterparse(self, xml):
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+
+        # Only the events of these tags are reported, other elements are
+        # parsed without going through python.
+        context = etree.iterparse(
+            io.BytesIO(xml), events=('start', 'end'),
+            tag=('cib', 'configuration', 'resources', 'status', 'node_state'),
+            resolve_entities=False)
+        for event, elem in context:
+            parent = elem.getparent()
+            parent_tag = parent.tag if parent is not None else None
+            if event == 'start':
+                if elem.tag == 'cib' and parent is None:
+                    self.cib_attributes = dict(elem.attrib)
+                elif elem.tag == 'status' and parent_tag in ('cib', None):
+                    self.node_states = []
+                continue
+
+            if elem.tag == 'node_state' and parent_tag == 'status':
+                self.node_states.append(dict(elem.attrib))
+            elif elem.tag == 'resources' and parent_tag == 'configuration':
+                # Detach the resources tag so that clearing the
+                # configuration tag doesn't free it.
+                parent.remove(elem)
+                self.configuration_resources_tag = elem
+                continue
+            elif elem.tag not in ('configuration', 'status'):
+                continue
+
+            # Free the element and the siblings parsed before it.
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    def set_cib_xml(self, cib_xml, status_xml=None):
+        """Parse cib xml.
 
-        return ipmi_values
+        :params cib_xml: String of cib xml
+        :params status_xml: String of the status section of cib xml, if it
+                            was queried separately from the cib tag.
+        """
+        self.cib_attributes = {}
+        self.node_states = None
+        self.configuration_resources_tag = None
+
+        self._iterparse(cib_xml)
+        if status_xml is not None:
+            self.node_states = None
+            self._iterparse(status_xml)
+
+    def have_quorum(self):
+        """Returns if cluster has quorum or not.
+
+        :returns: 0 on no-quorum, 1 if cluster has quorum.
+        """
+        return int(self.cib_attributes.get('have-quorum'))
+
+    def get_node_state_tag_list(self):
+        """Get node_state tag list.
+
+        This method gets the attributes of the node_state tags of cib xml.
+
+        :returns: List of dictionaries of node_state tag attributes
+        """
+        if self.node_states is None:
+            LOG.error("Cib xml doesn't have status tag.")
+            return []
+
+        if len(self.node_states) == 0:
+            LOG.error("Cib xml doesn't have node_state tag.")
+
+        return self.node_states
+
+    def _get_cib_attributes(self):
+        return self.cib_attributes
+
+    def _get_resources_tag(self):
+        if self.configuration_resources_tag is not None:
+            return self.configuration_resources_tag
+        if self.resources_tag is not None:
+            return self.resources_tag
+        LOG.error("Cib xml doesn't have resources tag.")
+        return None
@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 from xml.etree import ElementTree
 
+from lxml import etree
 from oslo_log import log as oslo_logging
 
 LOG = oslo_logging.getLogger(__name__)
@@ -47,7 +49,38 @@ class ParseCrmMonXml(object):
         current_dc = self._get_current_dc()
         return current_dc.get('with_quorum') == 'true'
 
+    def has_dc(self):
+        """Answers if cluster has an elected DC or not.
+
+        :returns: True if the DC is present, False otherwise.
+        """
+        current_dc = self._get_current_dc()
+        return current_dc is not None and current_dc.get('present') == 'true'
+
+    def get_dc_name(self):
+        """Get the name of the DC.
+
+        :returns: Name of the DC, or None if no DC is elected.
+        """
+        if not self.has_dc():
+            return None
+        return self._get_current_dc().get('name')
+
+    def get_last_change(self):
+        """Get the last change of the cib configuration.
+
+        :returns: Tuple of the time, user, client and origin attributes of
+            the last_change tag, or None if crmmon xml doesn't have it.
+        """
+        last_change = self._get_last_change()
+        if last_change is None:
+            return None
+        return tuple(last_change.get(name)
+                     for name in ('time', 'user', 'client', 'origin'))
+
     def _get_summary(self):
+        if self.crmmon_tag is None:
+            return None
         child_list = list(self.crmmon_tag)
         for child in child_list:
             if child.tag == 'summary':
@@ -55,12 +88,24 @@ class ParseCrmMonXml(object):
         return None
 
     def _get_current_dc(self):
-        child_list = list(self._get_summary())
+        summary = self._get_summary()
+        if summary is None:
+            return None
+        child_list = list(summary)
         for child in child_list:
             if child.tag == 'current_dc':
                 return child
         return None
 
+    def _get_last_change(self):
+        summary = self._get_summary()
+        if summary is None:
+            return None
+        for child in list(summary):
+            if child.tag == 'last_change':
+                return child
+        return None
+
     def _get_nodes(self):
         # status tag exists in the crmmon tag.
         if self.crmmon_tag is None:
@@ -101,3 +146,85 @@ class ParseCrmMonXml(object):
             LOG.error("crm_mon xml doesn't have online tag.")
 
         return node_state_tag_list
+
+
+class StreamParseCrmMonXml(ParseCrmMonXml):
+    """StreamParseCrmMonXml class
+
+    This class parses the crmmon xml with lxml.etree.iterparse.
+    Only the attributes of the current_dc, last_change and node tags are
+    kept, as dictionaries, and every element is freed as soon as it has
+    been parsed.
+    """
+
+    def __init__(self):
+        super(StreamParseCrmMonXml, self).__init__()
+        self.current_dc = None
+        self.last_change = None
+        self.nodes = None
+
+    def set_crmmon_xml(self, crmmon_xml):
+        """Parse crmmon xml.
+
+        :params crmmon_xml: String of crmmon xml
+        """
+        self.current_dc = None
+        self.last_change = None
+        self.nodes = None
+        if isinstance(crmmon_xml, str):
+            crmmon_xml = crmmon_xml.encode('utf-8')
+
+        # Only the events of these tags are reported, other elements are
+        # parsed without going through python.
+        context = etree.iterparse(io.BytesIO(crmmon_xml),
+                                  events=('start', 'end'),
+                                  tag=('nodes', 'node', 'current_dc',
+                                       'last_change'),
+                                  resolve_entities=False)
+        for event, elem in context:
+            parent = elem.getparent()
+            parent_tag = parent.tag if parent is not None else None
+            if event == 'start':
+                # The root is crm_mon with 'crm_mon -X', and
+                # pacemaker-result with 'crm_mon --output-as=xml'.
+                if elem.tag == 'nodes' and parent is not None and \
+                        parent.getparent() is None:
+                    self.nodes = []
+                continue
+
+            if elem.tag == 'current_dc' and parent_tag == 'summary':
+                self.current_dc = dict(elem.attrib)
+            elif elem.tag == 'last_change' and parent_tag == 'summary':
+                self.last_change = dict(elem.attrib)
+            elif elem.tag == 'node' and parent_tag == 'nodes' and \
+                    self.nodes is not None:
+                self.nodes.append(dict(elem.attrib))
+            else:
+                continue
+
+            # Free the element and the siblings parsed before it.
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    def _get_current_dc(self):
+        return self.current_dc
+
+    def _get_last_change(self):
+        return self.last_change
+
+    def get_node_state_tag_list(self):
+        """Get node_state tag list.
+
+        This method gets the attributes of the node tags of crmmon xml.
+
+        :returns: List of dictionaries of node tag attributes
+        """
+        if self.nodes is None:
+            LOG.error("crm_mon xml doesn't have nodes tag.")
+            return []
+
+        if len(self.nodes) == 0:
+            LOG.error("crm_mon xml doesn't have online tag.")
+
+        return self.nodes
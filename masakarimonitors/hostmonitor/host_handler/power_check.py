@@ -0,0 +1,229 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import threading
+
+from oslo_log import log as oslo_logging
+from oslo_utils import strutils
+import requests
+
+import masakarimonitors.conf
+from masakarimonitors import utils
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+POWER_OFF = 'off'
+POWER_ON = 'on'
+
+
+class PowerCheckError(Exception):
+    """The power state of a host cannot be determined."""
+    pass
+
+
+class PowerCheckBase(object, metaclass=abc.ABCMeta):
+    """Power check base class.
+
+    This class is base of checking the power status of a host through its
+    BMC. The BMC is described by the params of the ipmi RA of the host,
+    which are ipaddr, userid, passwd and interface.
+    """
+
+    @abc.abstractmethod
+    def get_power_state(self, ipmi_values):
+        """Get the power state of a host.
+
+        :param ipmi_values: Dictionary of ipmi RA's params of the host.
+
+        :returns: POWER_OFF or POWER_ON.
+        :raises PowerCheckError: if the power state cannot be determined.
+        """
+        pass
+
+    def close(self):
+        """Release the resources held for the BMCs."""
+        pass
+
+
+class IpmitoolPowerCheck(PowerCheckBase):
+    """Check the power status with the ipmitool command."""
+
+    def get_power_state(self, ipmi_values):
+        cmd_str = ("timeout %s ipmitool -U %s -P %s -I %s -H %s "
+                   "power status") \
+            % (str(CONF.host.ipmi_timeout), ipmi_values['userid'],
+               ipmi_values['passwd'], ipmi_values['interface'],
+               ipmi_values['ipaddr'])
+        command = cmd_str.split()
+
+        # Execute ipmitool command.
+        out, err = utils.execute(*command, run_as_root=False)
+
+        if err:
+            msg = ("ipmitool command output stderr: %s") % err
+            raise PowerCheckError(msg)
+
+        msg = ("ipmitool command output stdout: %s") % out
+
+        if 'Power is off' in out:
+            LOG.info("%s", msg)
+            return POWER_OFF
+        elif 'Power is on' in out:
+            return POWER_ON
+        else:
+            raise PowerCheckError(msg)
+
+
+class _RedfishBMC(object):
+    # HTTP session and authentication state of a BMC.
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['Accept'] = 'application/json'
+        try:
+            self.session.verify = strutils.bool_from_string(
+                CONF.host.redfish_verify, strict=True)
+        except ValueError:
+            # Path to a CA bundle.
+            self.session.verify = CONF.host.redfish_verify
+        self.lock = threading.Lock()
+        self.token_location = None
+        self.system_path = None
+
+
+class RedfishPowerCheck(PowerCheckBase):
+    """Check the power status with the Redfish API of the BMC.
+
+    One HTTP session, whose connections are kept alive, is kept per BMC.
+    The BMC is authenticated through its SessionService and the token is
+    reused until the BMC rejects it. If the BMC doesn't provide the
+    SessionService, HTTP basic authentication is used.
+
+    The ipaddr param of the ipmi RA is the address of the BMC. It may be
+    an URL like 'http://192.168.10.20:8000' to use another scheme or
+    port than https.
+    """
+
+    def __init__(self):
+        self.bmcs = {}
+        self.lock = threading.Lock()
+
+    def _get_bmc(self, ipmi_values):
+        address = ipmi_values['ipaddr']
+        if '://' in address:
+            base_url = address.rstrip('/')
+        else:
+            base_url = 'https://%s' % address
+
+        with self.lock:
+            bmc = self.bmcs.get(base_url)
+            if bmc is None:
+                bmc = self.bmcs[base_url] = _RedfishBMC(base_url)
+        return bmc
+
+    def _login(self, bmc, ipmi_values):
+        bmc.session.headers.pop('X-Auth-Token', None)
+        bmc.session.auth = None
+        resp = bmc.session.post(
+            bmc.base_url + '/redfish/v1/SessionService/Sessions',
+            json={'UserName': ipmi_values['userid'],
+                  'Password': ipmi_values['passwd']},
+            timeout=CONF.host.ipmi_timeout)
+
+        token = resp.headers.get('X-Auth-Token')
+        if resp.ok and token:
+            bmc.session.headers['X-Auth-Token'] = token
+            bmc.token_location = resp.headers.get('Location')
+        elif resp.status_code in (404, 405, 501):
+            LOG.info("%s doesn't provide the Redfish SessionService, "
+                     "using basic authentication.", bmc.base_url)
+            bmc.session.auth = (ipmi_values['userid'], ipmi_values['passwd'])
+        else:
+            raise PowerCheckError("Failed to log in to %s: HTTP %s"
+                                  % (bmc.base_url, resp.status_code))
+
+    def _get(self, bmc, ipmi_values, path):
+        if 'X-Auth-Token' not in bmc.session.headers and \
+                bmc.session.auth is None:
+            self._login(bmc, ipmi_values)
+
+        resp = bmc.session.get(bmc.base_url + path,
+                               timeout=CONF.host.ipmi_timeout)
+        if resp.status_code == 401:
+            # The token expired or the credentials changed.
+            self._login(bmc, ipmi_values)
+            resp = bmc.session.get(bmc.base_url + path,
+                                   timeout=CONF.host.ipmi_timeout)
+        if not resp.ok:
+            raise PowerCheckError("Failed to get %s%s: HTTP %s"
+                                  % (bmc.base_url, path, resp.status_code))
+        return resp.json()
+
+    def get_power_state(self, ipmi_values):
+        bmc = self._get_bmc(ipmi_values)
+        with bmc.lock:
+            if bmc.system_path is None:
+                systems = self._get(bmc, ipmi_values, '/redfish/v1/Systems')
+                members = systems.get('Members', [])
+                if not members:
+                    raise PowerCheckError("%s doesn't have any system."
+                                          % bmc.base_url)
+                bmc.system_path = members[0]['@odata.id']
+
+            system = self._get(bmc, ipmi_values, bmc.system_path)
+
+        power_state = system.get('PowerState')
+        msg = ("Redfish PowerState of %s: %s") % (bmc.base_url, power_state)
+        if power_state == 'Off':
+            LOG.info("%s", msg)
+            return POWER_OFF
+        elif power_state in ('On', 'PoweringOn', 'PoweringOff', 'Paused'):
+            return POWER_ON
+        else:
+            raise PowerCheckError(msg)
+
+    def close(self):
+        with self.lock:
+            bmcs = list(self.bmcs.values())
+            self.bmcs = {}
+
+        for bmc in bmcs:
+            if bmc.token_location:
+                try:
+                    location = bmc.token_location
+                    if '://' not in location:
+                        location = bmc.base_url + location
+                    bmc.session.delete(location,
+                                       timeout=CONF.host.ipmi_timeout)
+                except requests.RequestException:
+                    LOG.debug("Failed to log out of %s.", bmc.base_url,
+                              exc_info=True)
+            bmc.session.close()
+
+
+POWER_CHECKS = {
+    'ipmitool': IpmitoolPowerCheck,
+    'redfish': RedfishPowerCheck,
+}
+
+
+def get_power_check(backend):
+    """Get a power check instance of a backend.
+
+    :param backend: Name of the backend, 'ipmitool' or 'redfish'.
+
+    :returns: PowerCheckBase instance.
+    """
+    return POWER_CHECKS[backend]()
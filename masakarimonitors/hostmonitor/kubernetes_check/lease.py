@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from oslo_log import log
+from oslo_utils import timeutils
+
+LOG = log.getLogger(__name__)
+
+
+class LeaseLock(object):
+    """Leader election with a coordination.k8s.io Lease.
+
+    The holder renews the Lease whenever it acquires it again. Like the
+    leader election of client-go, the expiry of the Lease of another holder
+    is measured on the local monotonic clock from the time its renewal was
+    last observed, so that it doesn't depend on clock synchronisation.
+    """
+
+    def __init__(self, api, name, namespace, holder, duration):
+        self.api = api
+        self.name = name
+        self.namespace = namespace
+        self.holder = holder
+        self.duration = duration
+        # Last observed (holder, renew time) of the Lease and when it was
+        # observed.
+        self.observed_record = None
+        self.observed_time = None
+
+    def _make_lease(self, now):
+        return client.V1Lease(
+            metadata=client.V1ObjectMeta(name=self.name,
+                                         namespace=self.namespace),
+            spec=client.V1LeaseSpec(
+                holder_identity=self.holder,
+                lease_duration_seconds=self.duration,
+                acquire_time=now,
+                renew_time=now,
+                lease_transitions=0))
+
+    def _observe(self, spec):
+        record = (spec.holder_identity, spec.renew_time)
+        if record != self.observed_record:
+            self.observed_record = record
+            self.observed_time = time.monotonic()
+
+    def acquire(self):
+        """Acquire the Lease, or renew it if it is already held.
+
+        :returns: True if the Lease is held, False if another holder has it.
+        :raises ApiException: if the Lease cannot be read or written.
+        """
+        now = timeutils.utcnow(with_timezone=True)
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            try:
+                self.api.create_namespaced_lease(self.namespace,
+                                                 self._make_lease(now))
+            except ApiException as e:
+                if e.status == 409:
+                    # Created by another hostmonitor meanwhile.
+                    return False
+                raise
+            LOG.info("Acquired Lease %s/%s.", self.namespace, self.name)
+            return True
+
+        spec = lease.spec
+        self._observe(spec)
+        if spec.holder_identity and spec.holder_identity != self.holder:
+            duration = spec.lease_duration_seconds or self.duration
+            if time.monotonic() - self.observed_time < duration:
+                return False
+            LOG.info("Lease %s/%s of %s expired, taking it over.",
+                     self.namespace, self.name, spec.holder_identity)
+
+        if spec.holder_identity != self.holder:
+            spec.holder_identity = self.holder
+            spec.acquire_time = now
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+        spec.renew_time = now
+        spec.lease_duration_seconds = self.duration
+        try:
+            # The resource version of the Lease read makes the update fail
+            # if another hostmonitor updated it meanwhile.
+            self.api.replace_namespaced_lease(self.name, self.namespace,
+                                              lease)
+        except ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        self._observe(spec)
+        return True
+
+    def release(self):
+        """Release the Lease if it is held, to be taken over at once."""
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+            if lease.spec.holder_identity != self.holder:
+                return
+            lease.spec.holder_identity = None
+            lease.spec.acquire_time = None
+            lease.spec.renew_time = None
+            self.api.replace_namespaced_lease(self.name, self.namespace,
+                                              lease)
+        except ApiException as e:
+            LOG.warning("Failed to release Lease %s/%s: %s",
+                        self.namespace, self.name, e)
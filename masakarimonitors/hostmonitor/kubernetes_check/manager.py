@@ -12,10 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import deque
-
-import eventlet
-
 from kubernetes import client
 from kubernetes import config
 
@@ -27,6 +23,11 @@ import socket
 from masakarimonitors import conf
 from masakarimonitors.ha import masakari
 from masakarimonitors.hostmonitor import driver
+from masakarimonitors.hostmonitor import health_history
+from masakarimonitors.hostmonitor.kubernetes_check import lease
+from masakarimonitors.hostmonitor import scheduler
+from masakarimonitors.hostmonitor import stabilisation
+from masakarimonitors.hostmonitor import storm_guard
 from masakarimonitors.objects import event_constants as ec
 
 LOG = log.getLogger(__name__)
@@ -41,10 +42,16 @@ class KubernetesCheck(driver.DriverBase):
         self.hostname = socket.gethostname()
         self.monitoring_interval = CONF.host.monitoring_interval
         self.monitoring_samples = CONF.host.monitoring_samples
+        self.scheduler = scheduler.FixedRateScheduler(
+            'kubernetes', self.monitoring_interval)
         self.notifier = masakari.SendNotification()
-        self.monitoring_data = {}
+        self.monitoring_data = health_history.HealthHistory(
+            self.monitoring_samples,
+            policy=stabilisation.get_policy())
         self.last_status = {}
         self.running = False
+        self.notifier_lease = None
+        self.storm_guard = storm_guard.StormGuard('kubernetes')
 
         config.load_incluster_config()
         self.kube_client = client.CoreV1Api()
@@ -57,10 +64,10 @@ class KubernetesCheck(driver.DriverBase):
         ).items
 
         # Remove non-exist node from monitoring_data
-        self.monitoring_data = {
-            node: status for node, status in self.monitoring_data.items()
-            if node in [i.metadata.name for i in node_list]
-        }
+        node_names = set(i.metadata.name for i in node_list)
+        for node in self.monitoring_data:
+            if node not in node_names:
+                self.monitoring_data.remove(node)
 
         for host in node_list:
             hostname = host.metadata.name
@@ -69,15 +76,13 @@ class KubernetesCheck(driver.DriverBase):
                 if condition.type != "Ready":
                     continue
 
-                host_health_history = self.monitoring_data.get(
-                    hostname, deque([], maxlen=self.monitoring_samples))
-                host_health_history.appendleft(condition.status)
                 LOG.debug("hostname: %s, condition: %s",
-                          hostname, host_health_history)
+                          hostname, condition.status)
 
-                # Status is 'True' if node is healthy else 'False' or 'unknown'
-                # Most up-to-date state is stored in index 0
-                self.monitoring_data[hostname] = host_health_history
+                # Status is 'True' if node is healthy else 'False' or
+                # 'unknown', only whether it is healthy is kept.
+                self.monitoring_data.append(hostname,
+                                            condition.status == 'True')
 
     @staticmethod
     def _event(host, host_health):
@@ -99,35 +104,82 @@ class KubernetesCheck(driver.DriverBase):
 
         return event
 
+    def _is_designated_notifier(self):
+        """Answers if this hostmonitor sends the notifications.
+
+        With [host]designated_notifier, only the holder of the
+        [kubernetes]lease_name Lease sends them.
+        """
+        if not CONF.host.designated_notifier:
+            return True
+
+        if self.notifier_lease is None:
+            self.notifier_lease = lease.LeaseLock(
+                client.CoordinationV1Api(), CONF.kubernetes.lease_name,
+                CONF.kubernetes.lease_namespace, self.hostname,
+                CONF.host.designated_notifier_ttl)
+        try:
+            return self.notifier_lease.acquire()
+        except Exception as e:
+            LOG.warning("Failed to acquire the designated notifier Lease: "
+                        "%s", e)
+            return False
+
     def poll_hosts(self):
         """poll and check hosts health"""
-        for host, health_history in self.monitoring_data.items():
+        is_designated_notifier = self._is_designated_notifier()
+        stopped = []
+        for host, stabilised_health in \
+                self.monitoring_data.stabilised_all().items():
             if not self.last_status:
-                self.last_status[host] = self.monitoring_data[host][0]
+                # Any Ready condition status of the first host counts as
+                # alive.
+                self.last_status[host] = True
 
             if host == self.hostname:
                 continue
 
-            if len(health_history) < self.monitoring_samples:
+            if stabilised_health == health_history.COLLECTING:
                 continue
 
-            is_host_alive = "True" in health_history
+            # The host is dead if it wasn't healthy in any of the samples.
+            is_host_alive = stabilised_health is not False
 
             if not is_host_alive and self.last_status.get(host):
-                event = self._event(host, is_host_alive)
+                if not is_designated_notifier:
+                    # The change isn't recorded, so that it is notified if
+                    # this hostmonitor becomes the designated notifier
+                    # before the host is healthy again.
+                    continue
+                stopped.append(host)
+                continue
+
+            self.last_status[host] = is_host_alive
+
+        allowed = self.storm_guard.filter(stopped, len(self.monitoring_data))
+        for host in stopped:
+            if host in allowed:
+                event = self._event(host, False)
                 self.notifier.send_notification(
                     CONF.host.api_retry_max,
                     CONF.host.api_retry_interval,
                     event)
-
-            self.last_status[host] = is_host_alive
+            elif self.storm_guard.hold:
+                # The change isn't recorded, so that it is notified after
+                # the storm if the host is still down.
+                continue
+            self.last_status[host] = False
 
     def stop(self):
         self.running = False
+        if self.notifier_lease is not None:
+            self.notifier_lease.release()
+            self.notifier_lease = None
 
     def monitor_hosts(self):
         self.running = True
         while self.running:
+            self.scheduler.start_cycle()
             try:
                 self.update_monitoring_data()
                 LOG.info("Monitoring data: %s", self.monitoring_data)
@@ -135,4 +187,5 @@ class KubernetesCheck(driver.DriverBase):
             except Exception as e:
                 LOG.exception("Exception when host-monitor by k8s: %s", e)
 
-            eventlet.greenthread.sleep(self.monitoring_interval)
+            self.scheduler.finish_cycle()
+            self.scheduler.wait()
@@ -0,0 +1,131 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+import math
+import time
+
+import eventlet
+from oslo_log import log as oslo_logging
+
+import masakarimonitors.conf
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+# Number of the latest cycle durations the percentiles are computed from.
+DURATION_WINDOW = 100
+
+
+class FixedRateScheduler(object):
+    """Schedule the monitoring cycles of a host driver at a fixed rate.
+
+    The cycles start every interval seconds on the monotonic clock, whatever
+    time the cycles take, instead of sleeping interval seconds after each
+    cycle. A cycle which ends after the start of the next one is an overrun.
+    The ticks which passed during an overrun are skipped rather than run
+    back to back, and the next cycle starts at the following tick.
+
+    A driver runs::
+
+        scheduler.start_cycle()
+        ...
+        scheduler.finish_cycle()
+        scheduler.wait()
+    """
+
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+        self.next_tick = None
+        self.cycle_tick = None
+        self.cycle_started = None
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.durations = deque([], maxlen=DURATION_WINDOW)
+        self.stats_logged = time.monotonic()
+
+    def start_cycle(self):
+        now = time.monotonic()
+        if self.next_tick is not None and \
+                self.next_tick <= now < self.next_tick + self.interval:
+            # A late wake up doesn't delay the following ticks.
+            self.cycle_tick = self.next_tick
+        else:
+            # The first cycle, or one which didn't wait for its tick, e.g.
+            # run on an event, starts a new schedule.
+            self.cycle_tick = now
+        self.cycle_started = now
+
+    def finish_cycle(self):
+        if self.cycle_started is None:
+            return
+
+        now = time.monotonic()
+        self.cycles += 1
+        self.durations.append(now - self.cycle_started)
+
+        missed = int((now - self.cycle_tick) // self.interval)
+        if missed > 0:
+            self.overruns += 1
+            self.skipped_ticks += missed
+            LOG.warning("%(name)s monitoring cycle took %(duration).1f"
+                        " seconds, longer than the monitoring interval of"
+                        " %(interval)s seconds. %(missed)d tick(s) skipped.",
+                        {'name': self.name, 'duration': now - self.cycle_tick,
+                         'interval': self.interval, 'missed': missed})
+        self.next_tick = self.cycle_tick + (missed + 1) * self.interval
+        self.cycle_started = None
+
+        if CONF.host.cycle_stats_interval and \
+                now - self.stats_logged >= CONF.host.cycle_stats_interval:
+            self.stats_logged = now
+            LOG.info("%(name)s monitoring cycles: %(cycles)d, overruns:"
+                     " %(overruns)d, skipped ticks: %(skipped_ticks)d,"
+                     " duration p50/p90/p99: %(p50).3f/%(p90).3f/%(p99).3f"
+                     " seconds.", dict(self.get_stats(), name=self.name))
+
+    def _percentile(self, durations, percent):
+        # Nearest-rank percentile.
+        if not durations:
+            return 0.0
+        rank = max(int(math.ceil(percent / 100.0 * len(durations))), 1)
+        return durations[rank - 1]
+
+    def get_stats(self):
+        """Get the statistics of the cycles.
+
+        :returns: Dictionary of the number of cycles, overruns and skipped
+            ticks, and of the 50th, 90th and 99th percentiles(in seconds)
+            of the durations of the latest cycles.
+        """
+        durations = sorted(self.durations)
+        return {
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'skipped_ticks': self.skipped_ticks,
+            'p50': self._percentile(durations, 50),
+            'p90': self._percentile(durations, 90),
+            'p99': self._percentile(durations, 99),
+        }
+
+    def time_to_next_tick(self):
+        """Get the time(in seconds) until the next tick."""
+        if self.next_tick is None:
+            return self.interval
+        return max(self.next_tick - time.monotonic(), 0)
+
+    def wait(self):
+        """Sleep until the next tick."""
+        # Sleep even if the tick has passed, to let other green threads run.
+        eventlet.greenthread.sleep(self.time_to_next_tick())
@@ -0,0 +1,144 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+import math
+
+from oslo_log import log as oslo_logging
+
+import masakarimonitors.conf
+from masakarimonitors.hostmonitor import health_history
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+# Number of intervals a host must have been seen in its stabilised status
+# before the phi-accrual detector is trusted.
+PHI_MIN_INTERVALS = 3
+
+# Minimum standard deviation of the intervals, relative to their mean, so
+# that the hosts sampled at a perfectly fixed rate are not declared down
+# on the slightest delay.
+PHI_MIN_STD_DEVIATION_RATIO = 0.1
+
+
+class PhiAccrualPolicy(object):
+    """Phi-accrual stabilisation policy of the host health history.
+
+    Every host has a stabilised status, first decided by the consecutive
+    samples rule. Each sample in this status is a heartbeat, and the
+    intervals between the heartbeats of a host are learnt over the latest
+    ``phi_window`` of them. When a sample differs from the stabilised
+    status, the suspicion level phi of the stabilised status is computed
+    from the time since its last heartbeat, assuming normally distributed
+    intervals::
+
+        phi = -log10(P(interval > time since the last heartbeat))
+
+    The latest sample becomes the stabilised status as soon as phi reaches
+    ``phi_threshold``, or when the consecutive samples rule decides it. A
+    host usually sampled in the same status every cycle is therefore
+    declared changed after two samples, while a host whose samples often
+    differ needs more evidence.
+    """
+
+    def __init__(self, threshold, window):
+        self.threshold = threshold
+        self.window = window
+        # Stabilised status, time of its last heartbeat and the intervals
+        # between its heartbeats by hostname.
+        self.hosts = {}
+
+    def _heartbeat(self, state, now):
+        state[2].append(now - state[1])
+        state[1] = now
+
+    def phi(self, intervals, elapsed):
+        """Get the suspicion level after elapsed seconds without heartbeat.
+
+        :param intervals: Intervals(in seconds) between the heartbeats.
+        :param elapsed: Time(in seconds) since the last heartbeat.
+        """
+        mean = sum(intervals) / len(intervals)
+        variance = sum((i - mean) ** 2 for i in intervals) / len(intervals)
+        std_deviation = max(math.sqrt(variance),
+                            mean * PHI_MIN_STD_DEVIATION_RATIO)
+        if std_deviation <= 0:
+            return float('inf') if elapsed > mean else 0.0
+
+        p_later = 0.5 * math.erfc(
+            (elapsed - mean) / (std_deviation * math.sqrt(2)))
+        if p_later <= 0:
+            return float('inf')
+        return -math.log10(p_later)
+
+    def update(self, hostname, value, status, now):
+        """Get the stabilised status of a host after a new sample.
+
+        :param hostname: Name of the host.
+        :param value: The new sample.
+        :param status: Stabilised status by the consecutive samples rule.
+        :param now: Time(in seconds) of the sample.
+
+        :returns: The stabilised status of the host.
+        """
+        state = self.hosts.get(hostname)
+
+        if status not in (health_history.COLLECTING,
+                          health_history.UNCERTAIN):
+            if state is None:
+                self.hosts[hostname] = [status, now,
+                                        deque([], maxlen=self.window)]
+            elif state[0] == status:
+                self._heartbeat(state, now)
+            else:
+                state[0] = status
+                state[1] = now
+            return status
+
+        if state is None:
+            return status
+
+        if value == state[0]:
+            self._heartbeat(state, now)
+            return state[0]
+
+        if len(state[2]) < PHI_MIN_INTERVALS:
+            return status
+
+        phi = self.phi(state[2], now - state[1])
+        if phi < self.threshold:
+            LOG.debug("Host %(hostname)s is suspected with phi %(phi).2f.",
+                      {'hostname': hostname, 'phi': phi})
+            return status
+
+        LOG.info("Host %(hostname)s is declared '%(value)s', phi %(phi).2f"
+                 " reached the threshold.",
+                 {'hostname': hostname, 'value': value, 'phi': phi})
+        state[0] = value
+        state[1] = now
+        return value
+
+    def remove(self, hostname):
+        self.hosts.pop(hostname, None)
+
+
+def get_policy():
+    """Get the stabilisation policy configured by [host]stabilisation_policy.
+
+    :returns: The policy, None for the consecutive samples rule which is
+        applied by the health history itself.
+    """
+    if CONF.host.stabilisation_policy == 'phi_accrual':
+        return PhiAccrualPolicy(CONF.host.phi_threshold,
+                                CONF.host.phi_window)
+    return None
@@ -0,0 +1,101 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from oslo_log import log as oslo_logging
+
+import masakarimonitors.conf
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+
+class StormGuard(object):
+    """Guard against storms of host down notifications.
+
+    The hosts which went down in a monitoring cycle are passed to filter
+    before their notifications are sent. The failing hosts are these hosts
+    and the hosts notified down within the last ``storm_guard_window``
+    seconds. When they are at least ``storm_guard_min_hosts`` and more than
+    ``storm_guard_threshold`` of the monitored hosts, it is more likely that
+    this host is isolated, or that a whole rack or switch failed, than that
+    the hosts need to be evacuated one by one. No notification is then
+    sent, and a single error is logged when the storm starts.
+
+    With ``storm_guard_action = hold``, the drivers don't record the status
+    of the hosts held, so that they are notified in a later cycle once the
+    failing hosts are below the threshold, e.g. because the other hosts
+    came back. With ``suppress``, it is recorded and they are never
+    notified.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # Time of the latest down notification by hostname.
+        self.notified = {}
+        self.storm = False
+
+    @property
+    def hold(self):
+        return CONF.host.storm_guard_action == 'hold'
+
+    def filter(self, hostnames, monitored_hosts, now=None):
+        """Get the hosts whose down notification may be sent.
+
+        :param hostnames: Names of the hosts which went down in this cycle.
+        :param monitored_hosts: Number of monitored hosts.
+        :param now: Monotonic time(in seconds), the current time by default.
+
+        :returns: List of the names of the hosts which may be notified.
+        """
+        threshold = CONF.host.storm_guard_threshold
+        if not threshold:
+            return list(hostnames)
+
+        if now is None:
+            now = time.monotonic()
+        window = CONF.host.storm_guard_window
+        self.notified = dict((hostname, notified)
+                             for hostname, notified in self.notified.items()
+                             if now - notified < window)
+
+        failing = set(hostnames) | set(self.notified)
+        fraction = float(len(failing)) / max(monitored_hosts, 1)
+        if fraction <= threshold or \
+                len(failing) < CONF.host.storm_guard_min_hosts:
+            if self.storm:
+                self.storm = False
+                LOG.warning("%(name)s notification storm ended,"
+                            " %(failing)d of %(total)d hosts are failing.",
+                            {'name': self.name, 'failing': len(failing),
+                             'total': monitored_hosts})
+            for hostname in hostnames:
+                self.notified[hostname] = now
+            return list(hostnames)
+
+        params = {'name': self.name, 'failing': len(failing),
+                  'total': monitored_hosts, 'window': window,
+                  'threshold': threshold,
+                  'action': 'held' if self.hold else 'suppressed',
+                  'hosts': ', '.join(sorted(hostnames))}
+        if not self.storm:
+            self.storm = True
+            LOG.error("%(name)s notification storm: %(failing)d of %(total)d"
+                      " hosts went down within %(window)s seconds, more"
+                      " than the threshold of %(threshold)s. Check whether"
+                      " this host is isolated or a rack failed. The down"
+                      " notifications of %(hosts)s are %(action)s.", params)
+        elif hostnames:
+            LOG.warning("%(name)s notification storm: the down notifications"
+                        " of %(hosts)s are %(action)s.", params)
+        return []
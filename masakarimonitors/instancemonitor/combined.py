@@ -0,0 +1,64 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import libvirt
+from oslo_config import cfg
+from oslo_log import log as oslo_logging
+
+from masakarimonitors.common import libvirt_event_bus
+from masakarimonitors.instancemonitor import instance
+from masakarimonitors.introspectiveinstancemonitor import instance as \
+    introspective_instance
+from masakarimonitors import manager
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = cfg.CONF
+
+
+class CombinedInstanceMonitorManager(manager.Manager):
+    """Runs the instancemonitor and the introspectiveinstancemonitor.
+
+    Both monitors subscribe to a single libvirt event bus, so that they
+    share one libvirt connection and event loop instead of running in two
+    processes. It is used by setting ``instancemonitor_manager`` to this
+    class and running masakari-instancemonitor only.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CombinedInstanceMonitorManager, self).__init__(
+            service_name="instancemonitor", *args, **kwargs)
+        self.bus = libvirt_event_bus.LibvirtEventBus()
+        self.instancemonitor = instance.InstancemonitorManager(
+            bus=self.bus, *args, **kwargs)
+        self.introspectiveinstancemonitor = \
+            introspective_instance.IntrospectiveInstanceMonitorManager(
+                bus=self.bus, *args, **kwargs)
+
+    def init_host(self):
+        self.instancemonitor.init_host()
+        self.introspectiveinstancemonitor.init_host()
+
+    def stop(self):
+        self.bus.stop()
+
+    def main(self):
+        """Main method.
+
+        Set the URI, error handler, and executes event loop processing.
+        """
+        uri = CONF.libvirt.connection_uri
+        LOG.debug("Using uri:" + uri)
+
+        # set error handler & do event loop
+        libvirt.registerErrorHandler(self.instancemonitor._err_handler,
+                                     '_virt_event')
+        self.bus.run(uri)
@@ -12,46 +12,70 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import threading
-import time
-
-import eventlet
 import libvirt
 from oslo_config import cfg
 from oslo_log import log as oslo_logging
 
+from masakarimonitors.common import libvirt_event_bus
 from masakarimonitors.instancemonitor.libvirt_handler import eventfilter
 from masakarimonitors import manager
 
 LOG = oslo_logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# Domain states in which a domain is not running anymore.
+STOPPED_STATES = (libvirt.VIR_DOMAIN_SHUTOFF, libvirt.VIR_DOMAIN_CRASHED)
+
+# Lifecycle event (event, detail) synthesized for a domain found in a
+# stopped or paused state with a reason, after it was running.
+MISSED_EVENTS = {
+    (libvirt.VIR_DOMAIN_SHUTOFF, libvirt.VIR_DOMAIN_SHUTOFF_CRASHED):
+        (libvirt.VIR_DOMAIN_EVENT_STOPPED,
+         libvirt.VIR_DOMAIN_EVENT_STOPPED_FAILED),
+    (libvirt.VIR_DOMAIN_SHUTOFF, libvirt.VIR_DOMAIN_SHUTOFF_DESTROYED):
+        (libvirt.VIR_DOMAIN_EVENT_STOPPED,
+         libvirt.VIR_DOMAIN_EVENT_STOPPED_DESTROYED),
+    (libvirt.VIR_DOMAIN_SHUTOFF, libvirt.VIR_DOMAIN_SHUTOFF_SHUTDOWN):
+        (libvirt.VIR_DOMAIN_EVENT_STOPPED,
+         libvirt.VIR_DOMAIN_EVENT_STOPPED_SHUTDOWN),
+    (libvirt.VIR_DOMAIN_PAUSED, libvirt.VIR_DOMAIN_PAUSED_IOERROR):
+        (libvirt.VIR_DOMAIN_EVENT_SUSPENDED,
+         libvirt.VIR_DOMAIN_EVENT_SUSPENDED_IOERROR),
+    (libvirt.VIR_DOMAIN_PAUSED, libvirt.VIR_DOMAIN_PAUSED_WATCHDOG):
+        (libvirt.VIR_DOMAIN_EVENT_SUSPENDED,
+         libvirt.VIR_DOMAIN_EVENT_SUSPENDED_WATCHDOG),
+}
+
+# Domain state after a lifecycle event.
+EVENT_STATES = {
+    libvirt.VIR_DOMAIN_EVENT_STARTED: libvirt.VIR_DOMAIN_RUNNING,
+    libvirt.VIR_DOMAIN_EVENT_RESUMED: libvirt.VIR_DOMAIN_RUNNING,
+    libvirt.VIR_DOMAIN_EVENT_SUSPENDED: libvirt.VIR_DOMAIN_PAUSED,
+    libvirt.VIR_DOMAIN_EVENT_STOPPED: libvirt.VIR_DOMAIN_SHUTOFF,
+    libvirt.VIR_DOMAIN_EVENT_CRASHED: libvirt.VIR_DOMAIN_CRASHED,
+}
+
 
 class InstancemonitorManager(manager.Manager):
     """Manages the masakari-instancemonitor."""
 
     def __init__(self, *args, **kwargs):
+        # The libvirt event bus of the monitors run in this process, a
+        # bus of its own by default.
+        bus = kwargs.pop('bus', None)
         super(InstancemonitorManager, self).__init__(
             service_name="instancemonitor", *args, **kwargs)
         self.evf = eventfilter.EventFilter()
-        # This keeps track of what thread is running the event loop,
-        # (if it is run in a background thread)
-        self.event_loop_thread = None
-
-    def _vir_event_loop_native_run(self):
-        # Directly run the event loop in the current thread
-        while True:
-            libvirt.virEventRunDefaultImpl()
-
-    def _vir_event_loop_native_start(self):
-        libvirt.virEventRegisterDefaultImpl()
-        self.event_loop_thread = threading.Thread(
-            target=self._vir_event_loop_native_run,
-            name="lib_virt_eventLoop")
-        self.event_loop_thread.daemon = True
-        self.event_loop_thread.start()
+        # Last known state of the domains by uuid, None before the first
+        # connection.
+        self.domain_states = None
+        self.bus = bus or libvirt_event_bus.LibvirtEventBus()
+        self.bus.subscribe(self._event_callback_handlers(),
+                           on_connect=self._reconcile_domains)
 
     def _my_domain_event_callback(self, conn, dom, event, detail, opaque):
+        if self.domain_states is not None and event in EVENT_STATES:
+            self.domain_states[dom.UUIDString()] = EVENT_STATES[event]
         self.evf.vir_event_filter(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
                                   event, detail, dom.UUIDString())
 
@@ -95,31 +119,46 @@ class InstancemonitorManager(manager.Manager):
         self.evf.vir_event_filter(libvirt.VIR_DOMAIN_EVENT_ID_CONTROL_ERROR,
                                   -1, -1, dom.UUIDString())
 
-    def _err_handler(self, ctxt, err):
-        LOG.warning("Error from libvirt : %s", err[2])
-
-    @staticmethod
-    def _connect_auth_cb(creds, user_data):
-        if len(creds) == 0:
-            return 0
-        raise Exception("Can not handle authentication request for %d "
-                        "credentials" % len(creds))
-
-    def _virt_event(self, uri):
-        auth = [[libvirt.VIR_CRED_AUTHNAME,
-                 libvirt.VIR_CRED_ECHOPROMPT,
-                 libvirt.VIR_CRED_REALM,
-                 libvirt.VIR_CRED_PASSPHRASE,
-                 libvirt.VIR_CRED_NOECHOPROMPT,
-                 libvirt.VIR_CRED_EXTERNAL],
-                InstancemonitorManager._connect_auth_cb,
-                None]
+    def _reconcile_domains(self, vc):
+        """Report the domains which stopped while disconnected.
 
-        flags = libvirt.VIR_CONNECT_RO
+        Called on every connection to libvirt. The state of the domains is
+        compared with their last known state,
+        and a lifecycle event is synthesized for every domain which was
+        running and is now stopped, crashed or paused on an error, as the
+        events libvirt emitted while disconnected were lost.
+        """
+        states = {}
+        for dom in vc.listAllDomains(0):
+            state, reason = dom.state()
+            states[dom.UUIDString()] = (state, reason)
+
+        previous_states = self.domain_states
+        self.domain_states = dict((domain_uuid, state) for domain_uuid,
+                                  (state, reason) in states.items())
+        if previous_states is None:
+            return
+
+        for domain_uuid, (state, reason) in states.items():
+            previous = previous_states.get(domain_uuid)
+            if previous is None or previous in STOPPED_STATES or \
+                    previous == state:
+                continue
+            missed = MISSED_EVENTS.get((state, reason))
+            if missed is None:
+                continue
+            LOG.warning("Domain %(uuid)s changed from state %(previous)s to"
+                        " %(state)s(reason %(reason)s) while disconnected"
+                        " from libvirt.",
+                        {'uuid': domain_uuid, 'previous': previous,
+                         'state': state, 'reason': reason})
+            self.evf.vir_event_filter(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                                      missed[0], missed[1], domain_uuid)
 
-        # Run a background thread with the event loop
-        self._vir_event_loop_native_start()
+    def _err_handler(self, ctxt, err):
+        LOG.warning("Error from libvirt : %s", err[2])
 
+    def _event_callback_handlers(self):
         event_callback_handlers = {
             libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE:
                 self._my_domain_event_callback,
@@ -140,37 +179,21 @@ class InstancemonitorManager(manager.Manager):
             libvirt.VIR_DOMAIN_EVENT_ID_CONTROL_ERROR:
                 self._my_domain_event_generic_callback
         }
+        # Only the events the filter can match are registered, so that
+        # libvirt doesn't send the others. The lifecycle events keep the
+        # states of the domains up to date.
+        registered = self.evf.event_ids | set(
+            [libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE])
+        return dict((event, callback)
+                    for event, callback in event_callback_handlers.items()
+                    if event in registered)
+
+    def _virt_event(self, uri):
         # Connect to libvirt - If be disconnected, reprocess.
-        self.running = True
-        while self.running:
-            vc = libvirt.openAuth(uri, auth, flags)
-
-            # Event callback settings
-            callback_ids = []
-            for event, callback in event_callback_handlers.items():
-                cid = vc.domainEventRegisterAny(None, event, callback, None)
-                callback_ids.append(cid)
-
-            # Connection monitoring.
-            vc.setKeepAlive(5, 3)
-            while vc.isAlive() == 1 and self.running:
-                eventlet.greenthread.sleep(1)
-
-            # If connection between libvirtd was lost,
-            # clear callback connection.
-            LOG.warning("Libvirt Connection Closed Unexpectedly.")
-            for cid in callback_ids:
-                try:
-                    vc.domainEventDeregisterAny(cid)
-                except Exception:
-                    LOG.debug("Failed to deregister libvirt event "
-                              "callback %s.", cid, exc_info=True)
-            vc.close()
-            del vc
-            time.sleep(3)
+        self.bus.run(uri)
 
     def stop(self):
-        self.running = False
+        self.bus.stop()
 
     def main(self):
         """Main method.
@@ -0,0 +1,118 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import queue
+import threading
+import time
+import zlib
+
+from oslo_log import log as oslo_logging
+
+import masakarimonitors.conf
+
+LOG = oslo_logging.getLogger(__name__)
+CONF = masakarimonitors.conf.CONF
+
+
+class CallbackPool(object):
+    """Fixed pool of threads running the libvirt event callbacks.
+
+    The events of a domain are always run by the same worker, in the order
+    they were submitted, and each worker has a queue of at most
+    ``queue_size`` events. The events submitted to a full queue are dropped
+    with an error, so that the threads and the memory used during a storm
+    of events are bounded.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.queues = [queue.Queue(queue_size) for i in range(workers)]
+        self.threads = []
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.max_latency = 0.0
+
+    def _start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i, work_queue in enumerate(self.queues):
+                thread = threading.Thread(target=self._work,
+                                          args=(work_queue,),
+                                          name="libvirt_callback_%d" % i)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+            if CONF.callback.stats_interval:
+                thread = threading.Thread(target=self._report,
+                                          name="libvirt_callback_stats")
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, domain_uuid, func, *args):
+        """Run a callback in the worker of a domain.
+
+        :param domain_uuid: UUID of the domain of the event.
+        :param func: Callback to run.
+        :param args: Arguments of the callback.
+
+        :returns: True if the callback was queued, False if it was dropped.
+        """
+        self._start()
+        index = zlib.crc32(str(domain_uuid).encode()) % len(self.queues)
+        try:
+            self.queues[index].put_nowait((time.monotonic(), func, args))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            LOG.error("Libvirt event callback queue is full, dropped the"
+                      " event of the domain %s.", domain_uuid)
+            return False
+        return True
+
+    def _work(self, work_queue):
+        while True:
+            queued_time, func, args = work_queue.get()
+            latency = time.monotonic() - queued_time
+            self.max_latency = max(self.max_latency, latency)
+            try:
+                func(*args)
+            except Exception:
+                LOG.exception("Libvirt event callback failed.")
+            finally:
+                self.stats['processed'] += 1
+                work_queue.task_done()
+
+    def join(self):
+        """Wait until the queued callbacks were run."""
+        for work_queue in self.queues:
+            work_queue.join()
+
+    def get_stats(self):
+        """Get the metrics of the pool.
+
+        :returns: dictionary of the number of queued callbacks(depth), the
+            number of callbacks run(processed) and dropped, and the longest
+            time in seconds a callback was queued(max_latency).
+        """
+        return {'depth': sum(q.qsize() for q in self.queues),
+                'processed': self.stats['processed'],
+                'dropped': self.stats['dropped'],
+                'max_latency': self.max_latency}
+
+    def _report(self):
+        while True:
+            time.sleep(CONF.callback.stats_interval)
+            LOG.info("Libvirt event callbacks: %(depth)d queued,"
+                     " %(processed)d processed, %(dropped)d dropped, queued"
+                     " for %(max_latency).3f seconds at most.",
+                     self.get_stats())
@@ -14,14 +14,15 @@
 
 import socket
 import sys
-import threading
 
 from oslo_log import log as oslo_logging
 from oslo_utils import excutils
 from oslo_utils import timeutils
+import yaml
 
 import masakarimonitors.conf
 from masakarimonitors.instancemonitor.libvirt_handler import callback
+from masakarimonitors.instancemonitor.libvirt_handler import callback_pool
 from masakarimonitors.instancemonitor.libvirt_handler \
     import eventfilter_table as evft
 from masakarimonitors.objects import event_constants as ec
@@ -36,6 +37,24 @@ class EventFilter(object):
 
     def __init__(self):
         self.callback = callback.Callback()
+        self.pool = callback_pool.CallbackPool(CONF.callback.workers,
+                                               CONF.callback.queue_size)
+        self.hostname = CONF.hostname or socket.gethostname()
+        self.filter = self._load_filter()
+        # The libvirt events to register.
+        self.event_ids = set(key[0] for key in self.filter)
+
+    def _load_filter(self):
+        path = CONF.libvirt.event_filter_file
+        if path:
+            try:
+                event_filter = evft.load_filter_file(path)
+                LOG.info("Loaded libvirt event filter file %s.", path)
+                return event_filter
+            except (OSError, ValueError, yaml.YAMLError):
+                LOG.exception("Failed to load libvirt event filter file %s,"
+                              " using the default filter.", path)
+        return evft.compile_filter()
 
     def vir_event_filter(self, eventID, eventType, detail, uuID):
         """Filter events from libvirt.
@@ -46,36 +65,29 @@ class EventFilter(object):
         :pram uuID: UUID
         """
 
-        noticeType = ec.EventConstants.TYPE_VM
-        hostname = CONF.hostname or socket.gethostname()
-        currentTime = timeutils.utcnow()
-
-        # All Event Output if debug mode is on.
-        msg = "libvirt Event Received.type = %s \
-            hostname = %s uuid = %s time = %s eventID = %d eventType = %d \
-            detail = %d" % (
-            noticeType,
-            hostname, uuID, currentTime, eventID,
-            eventType, detail)
-        LOG.debug(msg)
-
         try:
-            if detail in evft.event_filter_dic[eventID][eventType]:
-                LOG.debug("Event Filter Matched.")
-
-                eventID_val = evft.eventID_dic[eventID]
-                detail_val = evft.detail_dic[eventID][eventType][detail]
-
-                # callback Thread Start
-                thread = threading.Thread(
-                    target=self.callback.libvirt_event_callback,
-                    args=(eventID_val, detail_val,
-                          uuID, noticeType,
-                          hostname, currentTime)
-                )
-                thread.start()
-            else:
-                LOG.debug("Event Filter Unmatched.")
+            names = self.filter.get((eventID, eventType, detail))
+            if names is None:
+                LOG.debug("libvirt Event Unmatched. uuid = %s eventID = %s"
+                          " eventType = %s detail = %s",
+                          uuID, eventID, eventType, detail)
+                return
+
+            noticeType = ec.EventConstants.TYPE_VM
+            hostname = self.hostname
+            currentTime = timeutils.utcnow()
+            LOG.debug("libvirt Event Matched. type = %s hostname = %s"
+                      " uuid = %s time = %s eventID = %s eventType = %s"
+                      " detail = %s", noticeType, hostname, uuID,
+                      currentTime, eventID, eventType, detail)
+
+            eventID_val, detail_val = names
+
+            # Run the callback in the worker of the domain.
+            self.pool.submit(uuID, self.callback.libvirt_event_callback,
+                             eventID_val, detail_val,
+                             uuID, noticeType,
+                             hostname, currentTime)
 
         except KeyError:
             LOG.debug("virEventFilter KeyError")
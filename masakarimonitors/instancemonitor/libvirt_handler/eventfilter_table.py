@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import libvirt
+import yaml
 
 # If is not defined internal , -1 is stored.
 DUMMY = -1
@@ -118,3 +119,73 @@ detail_dic = {
         DUMMY: {
             DUMMY: 'UNKNOWN'}}
 }
+
+
+def compile_filter(filter_dic=None):
+    """Flatten a filter table into a single lookup.
+
+    :param filter_dic: Filter table shaped like event_filter_dic, whose
+        entries are named in eventID_dic and detail_dic, event_filter_dic
+        by default.
+
+    :returns: dictionary of the (event id, event type, detail) of the
+        matched events to their (event id, detail) names.
+    """
+    if filter_dic is None:
+        filter_dic = event_filter_dic
+    compiled = {}
+    for event_id, event_types in filter_dic.items():
+        for event_type, details in event_types.items():
+            for detail in details:
+                compiled[(event_id, event_type, detail)] = (
+                    eventID_dic[event_id],
+                    detail_dic[event_id][event_type][detail])
+    return compiled
+
+
+def _constant(name):
+    try:
+        return getattr(libvirt, name)
+    except AttributeError:
+        raise ValueError("Unknown libvirt event %s." % name)
+
+
+def load_filter_file(path):
+    """Load a filter table from a yaml file.
+
+    The file maps the names of the events to match, without their
+    VIR_DOMAIN_EVENT_ID_ prefix, to the event types and details of the
+    LIFECYCLE events, or to the actions of the WATCHDOG and IO_ERROR
+    events, e.g.::
+
+        LIFECYCLE:
+          STOPPED: [FAILED, DESTROYED]
+        WATCHDOG: [RESET, POWEROFF]
+        CONTROL_ERROR:
+
+    :returns: dictionary like compile_filter.
+    :raises ValueError: if the file names an unknown event.
+    """
+    with open(path) as f:
+        table = yaml.safe_load(f) or {}
+
+    compiled = {}
+    for event_name, event_types in table.items():
+        event_id = _constant('VIR_DOMAIN_EVENT_ID_%s' % event_name)
+        if isinstance(event_types, dict):
+            for type_name, detail_names in event_types.items():
+                event_type = _constant('VIR_DOMAIN_EVENT_%s' % type_name)
+                for detail_name in detail_names or []:
+                    detail = _constant('VIR_DOMAIN_EVENT_%s_%s' % (
+                        type_name, detail_name))
+                    compiled[(event_id, event_type, detail)] = (
+                        event_name, '%s_%s' % (type_name, detail_name))
+        elif event_types:
+            for action_name in event_types:
+                action = _constant('VIR_DOMAIN_EVENT_%s_%s' % (
+                    event_name, action_name))
+                compiled[(event_id, action, DUMMY)] = (
+                    event_name, '%s_%s' % (event_name, action_name))
+        else:
+            compiled[(event_id, DUMMY, DUMMY)] = (event_name, 'UNKNOWN')
+    return compiled
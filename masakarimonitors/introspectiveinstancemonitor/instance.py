@@ -12,18 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import eventlet
 import libvirt
 import socket
 import sys
 import threading
-import time
 
 from oslo_config import cfg
 from oslo_log import log as oslo_logging
 from oslo_utils import excutils
 from oslo_utils import timeutils
 
+from masakarimonitors.common import libvirt_event_bus
 from masakarimonitors.introspectiveinstancemonitor import qemu_utils
 from masakarimonitors.introspectiveinstancemonitor import scheduler
 from masakarimonitors import manager
@@ -36,12 +35,20 @@ CONF = cfg.CONF
 class IntrospectiveInstanceMonitorManager(manager.Manager):
 
     def __init__(self, *args, **kwargs):
+        # The libvirt event bus of the monitors run in this process, a
+        # bus of its own by default. The guest agent commands need a
+        # read-write connection.
+        self.bus = kwargs.pop('bus', None) or \
+            libvirt_event_bus.LibvirtEventBus()
+        self.bus.subscribe({
+            libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE:
+                self._my_domain_event_callback,
+            libvirt.VIR_DOMAIN_EVENT_ID_REBOOT:
+                self._my_domain_event_reboot_callback
+        }, read_only=False)
         self.init_tgm()
         super(IntrospectiveInstanceMonitorManager, self).__init__(
             service_name="introspectiveinstancemonitor", *args, **kwargs)
-        # This keeps track of what thread is running the event loop,
-        # (if it is run in a background thread)
-        self.event_loop_thread = None
 
     def _reset_journal(self, event_id, event_type, detail, domain_uuid):
         """To reset the monitoring to discovery stage
@@ -86,20 +93,7 @@ class IntrospectiveInstanceMonitorManager(manager.Manager):
 
     def init_tgm(self):
         """Manages the masakari-introspectiveinstancemonitor."""
-        self.TG = scheduler.ThreadGroupManager()
-
-    def _vir_event_loop_native_run(self):
-        # Directly run the event loop in the current thread
-        while True:
-            libvirt.virEventRunDefaultImpl()
-
-    def _vir_event_loop_native_start(self):
-        libvirt.virEventRegisterDefaultImpl()
-        self.event_loop_thread = threading.Thread(
-            target=self._vir_event_loop_native_run,
-            name="lib_virt_eventLoop")
-        self.event_loop_thread.daemon = True
-        self.event_loop_thread.start()
+        self.TG = scheduler.ThreadGroupManager(self.bus)
 
     def _my_domain_event_callback(self, conn, dom, event, detail, opaque):
         self._reset_journal(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
@@ -113,46 +107,11 @@ class IntrospectiveInstanceMonitorManager(manager.Manager):
         LOG.warning("Error from libvirt : %s", err[2])
 
     def _virt_event(self, uri):
-        # Run a background thread with the event loop
-        self._vir_event_loop_native_start()
-
-        event_callback_handlers = {
-            libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE:
-                self._my_domain_event_callback,
-            libvirt.VIR_DOMAIN_EVENT_ID_REBOOT:
-                self._my_domain_event_reboot_callback
-        }
         # Connect to libvirt - If be disconnected, reprocess.
-        self.running = True
-        while self.running:
-            vc = libvirt.openReadOnly(uri)
-
-            # Event callback settings
-            callback_ids = []
-            for event, callback in event_callback_handlers.items():
-                cid = vc.domainEventRegisterAny(None, event, callback, None)
-                callback_ids.append(cid)
-
-            # Connection monitoring.
-            vc.setKeepAlive(5, 3)
-            while vc.isAlive() == 1 and self.running:
-                eventlet.greenthread.sleep(1)
-
-            # If connection between libvirtd was lost,
-            # clear callback connection.
-            LOG.warning("Libvirt Connection Closed Unexpectedly.")
-            for cid in callback_ids:
-                try:
-                    vc.domainEventDeregisterAny(cid)
-                except Exception:
-                    LOG.debug("Failed to deregister libvirt event "
-                              "callback %s.", cid, exc_info=True)
-            vc.close()
-            del vc
-            time.sleep(3)
+        self.bus.run(uri)
 
     def stop(self):
-        self.running = False
+        self.bus.stop()
 
     def main(self):
         """Main method.
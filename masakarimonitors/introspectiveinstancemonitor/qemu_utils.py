@@ -215,9 +215,12 @@ def resetJournal(domain_uuid):
 # Note: checkGuests function is called by the scheduler
 class QemuGuestAgent(object):
 
-    def __init__(self):
+    def __init__(self, bus=None):
         super(QemuGuestAgent, self).__init__()
         self.notifier = masakari.SendNotification()
+        # libvirt event bus whose connection is used for the checks, a
+        # connection is opened for every check without it.
+        self.bus = bus
 
     # _thresholdsCrossing
     #
@@ -389,7 +392,14 @@ class QemuGuestAgent(object):
         """
 
         try:
-            conn = libvirt.open(CONF.libvirt.connection_uri)
+            if self.bus is None:
+                conn = libvirt.open(CONF.libvirt.connection_uri)
+            else:
+                conn = self.bus.get_connection()
+                if conn is None:
+                    LOG.warning("Skipped the guest checks, not connected"
+                                " to libvirt.")
+                    return
 
             for domain_id in conn.listDomainsID():
                 try:
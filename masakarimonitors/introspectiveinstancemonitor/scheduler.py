@@ -28,12 +28,12 @@ CONF = cfg.CONF
 class ThreadGroupManager(object):
     """Thread group manager."""
 
-    def init_qemu_ga(self):
-        self.qemuGA = qemu_utils.QemuGuestAgent()
+    def init_qemu_ga(self, bus=None):
+        self.qemuGA = qemu_utils.QemuGuestAgent(bus)
         LOG.debug('Started QemuGuestAgent')
 
-    def __init__(self):
-        self.init_qemu_ga()
+    def __init__(self, bus=None):
+        self.init_qemu_ga(bus)
         super(ThreadGroupManager, self).__init__()
         self.threads = {}
         self.group = threadgroup.ThreadGroup()
@@ -22,6 +22,7 @@ from oslo_service import service
 from oslo_utils import importutils
 
 import masakarimonitors.conf
+from masakarimonitors.ha import masakari
 from masakarimonitors.i18n import _
 from masakarimonitors import utils
 
@@ -58,6 +59,7 @@ class Service(service.Service):
     def start(self):
         LOG.info('Starting %s', self.binary)
         self.basic_config_check()
+        masakari.start_prewarm()
         self.manager.init_host()
         self.manager.main()
 
@@ -100,6 +102,7 @@ class Service(service.Service):
 
     def stop(self):
         LOG.info('Stopping %s', self.binary)
+        masakari.stop_prewarm()
         self.manager.stop()
         super(Service, self).stop()
 
@@ -0,0 +1,170 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import testtools
+import threading
+from unittest import mock
+
+import eventlet
+import libvirt
+
+from masakarimonitors.common import libvirt_event_bus
+
+
+class StopLoop(Exception):
+    pass
+
+
+class TestLibvirtEventBus(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLibvirtEventBus, self).setUp()
+
+    def test_subscribe(self):
+        obj = libvirt_event_bus.LibvirtEventBus()
+        callback1 = mock.Mock()
+        callback2 = mock.Mock()
+        callback3 = mock.Mock()
+        hook = mock.Mock()
+
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: callback1,
+                       libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG: callback2},
+                      on_connect=hook)
+        self.assertTrue(obj.read_only)
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: callback3},
+                      read_only=False)
+
+        self.assertEqual(
+            {libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: [callback1, callback3],
+             libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG: [callback2]},
+            obj.handlers)
+        self.assertEqual([hook], obj.connect_hooks)
+        self.assertFalse(obj.read_only)
+
+    @mock.patch.object(libvirt_event_bus, 'LOG')
+    def test_fan_out(self, mock_log):
+        obj = libvirt_event_bus.LibvirtEventBus()
+        callback1 = mock.Mock(side_effect=ValueError("Test error."))
+        callback2 = mock.Mock()
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_REBOOT: callback1})
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_REBOOT: callback2})
+
+        obj._fan_out(libvirt.VIR_DOMAIN_EVENT_ID_REBOOT)('conn', 'dom', None)
+
+        # A failing subscriber doesn't prevent the others from handling
+        # the event.
+        callback1.assert_called_once_with('conn', 'dom', None)
+        callback2.assert_called_once_with('conn', 'dom', None)
+        mock_log.exception.assert_called_once()
+
+    @mock.patch.object(libvirt_event_bus.LibvirtEventBus, '_wait_closed')
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(libvirt, 'openAuth')
+    @mock.patch.object(threading, 'Thread')
+    @mock.patch.object(libvirt, 'virEventRegisterDefaultImpl')
+    def test_run(self, mock_virEventRegisterDefaultImpl, mock_Thread,
+                 mock_openAuth, mock_greenthread_sleep, mock_wait_closed):
+        mock_wait_closed.return_value = False
+        mock_vc = mock.Mock()
+        mock_openAuth.return_value = mock_vc
+        mock_vc.domainEventRegisterAny.side_effect = [1, 2]
+        obj = libvirt_event_bus.LibvirtEventBus()
+
+        def _isAlive():
+            self.assertIs(mock_vc, obj.get_connection())
+            return mock_vc.isAlive.call_count == 1
+
+        mock_vc.isAlive.side_effect = _isAlive
+        hook = mock.Mock()
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: mock.Mock(),
+                       libvirt.VIR_DOMAIN_EVENT_ID_REBOOT: mock.Mock()},
+                      on_connect=hook)
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: mock.Mock()},
+                      read_only=False)
+
+        # The reconnect wait ends the test.
+        mock_greenthread_sleep.side_effect = StopLoop()
+
+        self.assertRaises(StopLoop, obj.run, "qemu:///system")
+
+        mock_openAuth.assert_called_once_with(
+            "qemu:///system",
+            [[2, 6, 8, 5, 7, 9], libvirt_event_bus._connect_auth_cb, None],
+            0)
+        # Every event is registered once for all the subscribers.
+        self.assertEqual(
+            [libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+             libvirt.VIR_DOMAIN_EVENT_ID_REBOOT],
+            [c[0][1] for c in mock_vc.domainEventRegisterAny.call_args_list])
+        hook.assert_called_once_with(mock_vc)
+        self.assertEqual([mock.call(1), mock.call(2)],
+                         mock_vc.domainEventDeregisterAny.call_args_list)
+        mock_vc.close.assert_called_once_with()
+        self.assertIsNone(obj.get_connection())
+        # The connection is only checked after waiting for the close
+        # callback.
+        mock_wait_closed.assert_called_once_with(
+            libvirt_event_bus.CONNECTION_CHECK_INTERVAL)
+        mock_greenthread_sleep.assert_called_with(
+            libvirt_event_bus.RECONNECT_INTERVAL)
+
+    def test_wait_closed(self):
+        obj = libvirt_event_bus.LibvirtEventBus()
+        obj.stop()
+
+        # Stopping wakes up the connection monitoring.
+        self.assertTrue(obj._wait_closed(5))
+
+    @mock.patch.object(libvirt, 'openAuth')
+    def test_run_async(self, mock_openAuth):
+        mock_vc = mock.Mock()
+        threads = []
+
+        def _openAuth(*args):
+            threads.append(threading.current_thread())
+            if mock_openAuth.call_count == 1:
+                raise libvirt.libvirtError("Test error.")
+            return mock_vc
+
+        mock_openAuth.side_effect = _openAuth
+        mock_vc.domainEventRegisterAny.return_value = 1
+        obj = libvirt_event_bus.LibvirtEventBus()
+        obj.subscribe({libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE: mock.Mock()})
+        obj.running = True
+
+        def _close(*args):
+            # Closed by libvirt while connecting and stopping.
+            obj.running = False
+            obj._close_callback(mock_vc, 0, None)
+
+        mock_vc.setKeepAlive.side_effect = _close
+
+        async def _run():
+            threads.append(threading.current_thread())
+            await obj._run_async("qemu:///system")
+
+        with mock.patch.object(libvirt_event_bus, 'RECONNECT_INTERVAL', 0):
+            asyncio.run(_run())
+
+        self.assertEqual(2, mock_openAuth.call_count)
+        # libvirt is connected to outside of the event loop thread.
+        self.assertNotIn(threads[0], threads[1:])
+        self.assertEqual(libvirt.VIR_CONNECT_RO,
+                         mock_openAuth.call_args[0][2])
+        mock_vc.domainEventRegisterAny.assert_called_once_with(
+            None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, mock.ANY, None)
+        # The connection isn't polled.
+        mock_vc.isAlive.assert_not_called()
+        mock_vc.domainEventDeregisterAny.assert_called_once_with(1)
+        mock_vc.unregisterCloseCallback.assert_called_once_with()
+        mock_vc.close.assert_called_once_with()
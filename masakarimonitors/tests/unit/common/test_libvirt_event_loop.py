@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import sys
+import testtools
+from unittest import mock
+
+from masakarimonitors.common import libvirt_event_loop
+
+
+class TestAsyncioEventLoop(testtools.TestCase):
+
+    def setUp(self):
+        super(TestAsyncioEventLoop, self).setUp()
+        self.libvirtaio = mock.Mock()
+        patcher = mock.patch.dict(sys.modules,
+                                  {'libvirtaio': self.libvirtaio})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The loop is run in the test thread instead of a native thread,
+        # as the other tests monkey patch threading.
+        self.threading = mock.Mock()
+        patcher = mock.patch.object(libvirt_event_loop.patcher, 'original',
+                                    return_value=self.threading)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _start(self):
+        obj = libvirt_event_loop.AsyncioEventLoop('test_loop')
+        obj.start()
+        self.addCleanup(obj.loop.close)
+        return obj
+
+    def _execute(self, obj):
+        # Run the loop until the future waited for is done.
+        def _execute(func):
+            future = func.__self__
+            obj.loop.run_until_complete(
+                asyncio.wrap_future(future, loop=obj.loop))
+            return func()
+        return mock.patch.object(libvirt_event_loop.tpool, 'execute',
+                                 side_effect=_execute)
+
+    def test_start(self):
+        obj = self._start()
+
+        self.libvirtaio.virEventRegisterAsyncIOImpl.assert_called_once_with(
+            loop=obj.loop)
+        self.threading.Thread.assert_called_once_with(target=obj._run,
+                                                      name='test_loop')
+        self.assertTrue(obj.thread.daemon)
+        obj.thread.start.assert_called_once_with()
+
+    def test_run_loop(self):
+        obj = self._start()
+        obj.loop.call_soon(obj.loop.stop)
+
+        obj._run()
+
+        self.assertFalse(obj.loop.is_running())
+
+    def test_run(self):
+        obj = self._start()
+
+        async def _coro(value):
+            return value, asyncio.get_running_loop()
+
+        with self._execute(obj):
+            value, loop = obj.run(_coro('test'))
+
+        self.assertEqual('test', value)
+        self.assertIs(obj.loop, loop)
+
+    def test_run_exception(self):
+        obj = self._start()
+
+        async def _coro():
+            raise ValueError("Test error.")
+
+        with self._execute(obj):
+            self.assertRaises(ValueError, obj.run, _coro())
+
+    def test_call_soon(self):
+        obj = self._start()
+        called = []
+
+        obj.call_soon(called.append, 'test')
+
+        async def _coro():
+            return called
+
+        with self._execute(obj):
+            self.assertEqual(['test'], obj.run(_coro()))
@@ -0,0 +1,142 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from unittest import mock
+
+import testtools
+
+import masakarimonitors.conf
+from masakarimonitors.ha import circuit_breaker
+
+CONF = masakarimonitors.conf.CONF
+
+
+@mock.patch.object(time, 'monotonic')
+class TestCircuitBreaker(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCircuitBreaker, self).setUp()
+        self.breaker = circuit_breaker.CircuitBreaker(3, 10, 30)
+
+    def test_open(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+
+        self.breaker.failure()
+        self.breaker.failure()
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.failure()
+        self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failures(self, mock_monotonic):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+
+    def test_half_open_probe(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        for i in range(3):
+            self.breaker.failure()
+
+        mock_monotonic.return_value = 110
+        # A single probe is let through.
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(circuit_breaker.HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.success()
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+        self.assertEqual({'state': circuit_breaker.CLOSED,
+                          circuit_breaker.OPEN: 1,
+                          circuit_breaker.HALF_OPEN: 1,
+                          circuit_breaker.CLOSED: 1},
+                         self.breaker.get_stats())
+
+    def test_half_open_probe_failed(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        for i in range(3):
+            self.breaker.failure()
+
+        for timeout in (20, 30, 30):
+            mock_monotonic.return_value += 10
+            self.assertTrue(self.breaker.allow())
+            self.breaker.failure()
+            self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
+            # The circuit stays open twice as long, up to the maximum.
+            self.assertEqual(mock_monotonic.return_value + timeout,
+                             self.breaker.opened_until)
+            mock_monotonic.return_value = self.breaker.opened_until - 10
+
+    def test_wait_timeout(self, mock_monotonic):
+        mock_monotonic.side_effect = [100, 100, 100, 100, 101, 101]
+        for i in range(3):
+            self.breaker.failure()
+
+        with mock.patch.object(self.breaker.condition, 'wait') as mock_wait:
+            self.assertFalse(self.breaker.wait(1))
+
+        mock_wait.assert_called_once_with(1)
+
+    def test_wait_wakes_up(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        for i in range(3):
+            self.breaker.failure()
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(self.breaker.wait()))
+        waiting = threading.Event()
+        wait = self.breaker.condition.wait
+
+        def _wait(timeout):
+            waiting.set()
+            return wait(timeout)
+
+        with mock.patch.object(self.breaker.condition, 'wait',
+                               side_effect=_wait):
+            waiter.start()
+            self.assertTrue(waiting.wait(5))
+            self.breaker.success()
+            waiter.join(5)
+
+        self.assertEqual([True], results)
+
+
+class TestBackoff(testtools.TestCase):
+
+    def test_fixed(self):
+        self.assertEqual(10, circuit_breaker.backoff(10, 5, 0))
+
+    def test_exponential(self):
+        for retry_count, low, high in ((0, 5, 10), (2, 20, 40), (5, 30, 60)):
+            wait = circuit_breaker.backoff(10, retry_count, 60)
+            self.assertTrue(low <= wait <= high, wait)
+
+
+class TestGetBreaker(testtools.TestCase):
+
+    def test_get_breaker(self):
+        self.assertIsNone(circuit_breaker.get_breaker())
+
+        CONF.set_override('circuit_breaker_failures', 5, group='api')
+        self.addCleanup(CONF.clear_override, 'circuit_breaker_failures',
+                        group='api')
+        self.addCleanup(setattr, circuit_breaker, '_breaker', None)
+
+        breaker = circuit_breaker.get_breaker()
+        self.assertEqual(5, breaker.failures)
+        self.assertIs(breaker, circuit_breaker.get_breaker())
@@ -0,0 +1,169 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from unittest import mock
+
+import testtools
+
+from masakarimonitors.ha import coalescer
+from masakarimonitors.objects import event_constants as ec
+
+
+def _make_vm_event(detail, uuid='uuid1', generated_time='time'):
+    return {
+        'notification': {
+            'type': ec.EventConstants.TYPE_VM,
+            'hostname': 'compute-node1',
+            'generated_time': generated_time,
+            'payload': {
+                'event': 'LIFECYCLE',
+                'instance_uuid': uuid,
+                'vir_domain_event': detail
+            }
+        }
+    }
+
+
+def _make_host_event(event, generated_time='time'):
+    return {
+        'notification': {
+            'type': ec.EventConstants.TYPE_COMPUTE_HOST,
+            'hostname': 'compute-node1',
+            'generated_time': generated_time,
+            'payload': {
+                'event': event,
+                'cluster_status': 'OFFLINE',
+                'host_status': ec.EventConstants.HOST_STATUS_NORMAL
+            }
+        }
+    }
+
+
+@mock.patch.object(threading, 'Timer')
+class TestNotificationCoalescer(testtools.TestCase):
+
+    def setUp(self):
+        super(TestNotificationCoalescer, self).setUp()
+        self.notifier = mock.Mock()
+        self.coalescer = coalescer.NotificationCoalescer(self.notifier, 5,
+                                                         300)
+
+    def _delivered(self):
+        return [c[0][2] for c in self.notifier._deliver.call_args_list]
+
+    def test_most_significant(self, mock_timer):
+        suspended = _make_vm_event('SUSPENDED_IOERROR')
+        stopped = _make_vm_event('STOPPED_FAILED')
+
+        self.coalescer.add(12, 10, suspended, entry='entry1')
+        self.coalescer.add(12, 10, stopped, entry='entry2')
+
+        mock_timer.assert_called_once_with(5, self.coalescer._flush,
+                                           mock.ANY)
+        self.notifier._deliver.assert_not_called()
+
+        self.coalescer._flush(mock_timer.call_args[0][2][0])
+
+        self.notifier._deliver.assert_called_once_with(12, 10, stopped,
+                                                       'entry2')
+        self.notifier._acknowledge.assert_called_once_with('entry1')
+        self.assertEqual(1, self.coalescer.stats['coalesced'])
+
+    def test_final_state_kept(self, mock_timer):
+        stopped = _make_host_event(ec.EventConstants.EVENT_STOPPED)
+        started = _make_host_event(ec.EventConstants.EVENT_STARTED)
+
+        self.coalescer.add(12, 10, stopped)
+        self.coalescer.add(12, 10, started)
+        self.coalescer.add(12, 10, stopped)
+        self.coalescer.add(12, 10, started)
+        self.coalescer._flush(mock_timer.call_args[0][2][0])
+
+        # The last STOPPED and the final STARTED are sent in order.
+        self.assertEqual([stopped, started], self._delivered())
+        self.assertEqual(2, self.coalescer.stats['coalesced'])
+
+    def test_subjects_not_coalesced(self, mock_timer):
+        event1 = _make_vm_event('STOPPED_FAILED', uuid='uuid1')
+        event2 = _make_vm_event('SUSPENDED_IOERROR', uuid='uuid2')
+
+        self.coalescer.add(12, 10, event1)
+        self.coalescer.add(12, 10, event2)
+        self.assertEqual(2, mock_timer.call_count)
+        for c in mock_timer.call_args_list:
+            self.coalescer._flush(c[0][2][0])
+
+        self.assertEqual([event1, event2], self._delivered())
+
+    @mock.patch.object(time, 'monotonic')
+    def test_duplicate(self, mock_monotonic, mock_timer):
+        mock_monotonic.return_value = 100
+        self.coalescer.record_answered(_make_vm_event('STOPPED_FAILED'))
+
+        mock_monotonic.return_value = 200
+        self.coalescer.add(12, 10, _make_vm_event('STOPPED_FAILED',
+                                                  generated_time='later'),
+                           entry='entry1')
+
+        mock_timer.assert_not_called()
+        self.notifier._acknowledge.assert_called_once_with('entry1')
+        self.assertEqual(1, self.coalescer.stats['duplicate'])
+
+        # A different notification is not a duplicate.
+        self.coalescer.add(12, 10, _make_vm_event('SUSPENDED_IOERROR'))
+        mock_timer.assert_called_once()
+
+    @mock.patch.object(time, 'monotonic')
+    def test_duplicate_expired(self, mock_monotonic, mock_timer):
+        mock_monotonic.return_value = 100
+        self.coalescer.record_answered(_make_vm_event('STOPPED_FAILED'))
+
+        mock_monotonic.return_value = 400
+        self.coalescer.add(12, 10, _make_vm_event('STOPPED_FAILED'))
+
+        mock_timer.assert_called_once()
+        self.assertEqual(0, self.coalescer.stats['duplicate'])
+
+    def test_significance(self, mock_timer):
+        self.assertEqual(3, coalescer.significance(
+            _make_vm_event('STOPPED_FAILED')))
+        self.assertEqual(1, coalescer.significance(
+            _make_vm_event('SUSPENDED_IOERROR')))
+        self.assertEqual(3, coalescer.significance(
+            _make_host_event(ec.EventConstants.EVENT_STOPPED)))
+        self.assertEqual(0, coalescer.significance(
+            _make_host_event(ec.EventConstants.EVENT_STARTED)))
+
+
+class TestNotificationCoalescerThreads(testtools.TestCase):
+
+    def test_flush_from_native_thread(self):
+        notifier = mock.Mock()
+        obj = coalescer.NotificationCoalescer(notifier, 0.01, 0)
+        suspended = _make_vm_event('SUSPENDED_IOERROR')
+        stopped = _make_vm_event('STOPPED_FAILED')
+
+        def _callback():
+            obj.add(12, 10, suspended)
+            obj.add(12, 10, stopped)
+        thread = threading.Thread(target=_callback)
+        thread.start()
+        thread.join(5)
+        for i in range(500):
+            if notifier._deliver.called:
+                break
+            time.sleep(0.01)
+
+        notifier._deliver.assert_called_once_with(12, 10, stopped, None)
+        self.assertEqual({}, obj.pending)
@@ -12,7 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import shutil
+import tempfile
 import testtools
+import threading
+import time
 from unittest import mock
 import uuid
 
@@ -23,7 +28,9 @@ from openstack import exceptions
 from oslo_utils import timeutils
 
 import masakarimonitors.conf
+from masakarimonitors.ha import circuit_breaker
 from masakarimonitors.ha import masakari
+from masakarimonitors.ha import spool
 from masakarimonitors.objects import event_constants as ec
 
 CONF = masakarimonitors.conf.CONF
@@ -140,3 +147,493 @@ class TestSendNotification(testtools.TestCase):
             payload=self.event['notification']['payload'])
         self.assertEqual(self.api_retry_max + 1,
                          mock_conn.instance_ha.create_notification.call_count)
+
+    @mock.patch.object(masakari, 'NotificationDispatcher')
+    def test_send_notification_dispatcher(self, mock_dispatcher):
+        CONF.set_override('notification_workers', 2, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_workers',
+                        group='api')
+
+        notifier = masakari.SendNotification()
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+
+        mock_dispatcher.assert_called_once_with(notifier, 2, 1000)
+        mock_dispatcher.return_value.dispatch.assert_called_once_with(
+            self.api_retry_max, self.api_retry_interval, self.event,
+            entry=None)
+
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    def test_send_notification_spool(
+        self, mock_auth, mock_session, mock_connection):
+
+        mock_conn = mock.Mock()
+        mock_connection.return_value = mock_conn
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        CONF.set_override('notification_spool_dir', path, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_spool_dir',
+                        group='api')
+        self.addCleanup(spool._spools.clear)
+
+        notifier = masakari.SendNotification()
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+
+        mock_conn.instance_ha.create_notification.assert_called_once()
+        self.assertEqual({}, notifier.spool.entry_segment)
+
+    @mock.patch.object(masakari, 'LOG')
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    def test_send_notification_spool_error(
+        self, mock_auth, mock_session, mock_connection, mock_log):
+
+        mock_conn = mock.Mock()
+        mock_connection.return_value = mock_conn
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        CONF.set_override('notification_spool_dir', path, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_spool_dir',
+                        group='api')
+        self.addCleanup(spool._spools.clear)
+
+        notifier = masakari.SendNotification()
+        with mock.patch.object(notifier.spool, 'append',
+                               side_effect=OSError('No space left')):
+            notifier.send_notification(
+                self.api_retry_max, self.api_retry_interval, self.event)
+
+        # The notification is sent without being recorded.
+        mock_log.error.assert_called_once()
+        mock_conn.instance_ha.create_notification.assert_called_once()
+
+    @mock.patch.object(eventlet, 'spawn')
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    def test_send_notification_spool_replay(
+        self, mock_auth, mock_session, mock_connection, mock_sleep,
+        mock_spawn):
+
+        mock_conn = mock.Mock()
+        mock_connection.return_value = mock_conn
+        response = FakeResponse(status_code=500)
+        mock_conn.instance_ha.create_notification.side_effect = \
+            exceptions.HttpException(response=response)
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        CONF.set_override('notification_spool_dir', path, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_spool_dir',
+                        group='api')
+        self.addCleanup(spool._spools.clear)
+
+        notifier = masakari.SendNotification()
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+        notifier.spool.close()
+
+        # The monitor restarts after the retries were exhausted.
+        spool._spools.clear()
+        mock_conn.instance_ha.create_notification.side_effect = None
+        notifier = masakari.SendNotification()
+
+        mock_spawn.assert_called_once_with(notifier._replay_entries,
+                                           mock.ANY)
+        entries = mock_spawn.call_args[0][1]
+        self.assertEqual(1, len(entries))
+        self.assertEqual(self.event['notification']['hostname'],
+                         entries[0].event['notification']['hostname'])
+
+        notifier._replay_entries(entries)
+        self.assertEqual({}, notifier.spool.entry_segment)
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    def test_send_notification_circuit_breaker(
+        self, mock_auth, mock_session, mock_connection, mock_sleep):
+
+        mock_conn = mock.Mock()
+        mock_connection.return_value = mock_conn
+        response = FakeResponse(status_code=500)
+        mock_conn.instance_ha.create_notification.side_effect = \
+            exceptions.HttpException(response=response)
+        CONF.set_override('circuit_breaker_failures', 2, group='api')
+        self.addCleanup(CONF.clear_override, 'circuit_breaker_failures',
+                        group='api')
+        CONF.set_override('api_retry_max_interval', 8, group='api')
+        self.addCleanup(CONF.clear_override, 'api_retry_max_interval',
+                        group='api')
+        self.addCleanup(setattr, circuit_breaker, '_breaker', None)
+
+        notifier = masakari.SendNotification()
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+
+        # The circuit opened after 2 failures, and the retries didn't call
+        # the masakari-api anymore.
+        self.assertEqual(2,
+                         mock_conn.instance_ha.create_notification.call_count)
+        self.assertEqual(circuit_breaker.OPEN, notifier.breaker.state)
+        self.assertEqual(self.api_retry_max, mock_sleep.call_count)
+        # The client isn't reset when the masakari-api wasn't called.
+        self.assertIsNotNone(notifier._masakari_client)
+        # The backoff grows with the retries.
+        waits = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertTrue(0.5 <= waits[0] <= 1)
+        self.assertTrue(2 <= waits[2] <= 4)
+
+    @mock.patch.object(masakari.ClientPrewarmer, 'start')
+    def test_start_prewarm(self, mock_start):
+        self.addCleanup(masakari.stop_prewarm)
+        masakari.start_prewarm()
+        self.assertIsNone(masakari._prewarmer)
+
+        CONF.set_override('client_prewarm', True, group='api')
+        self.addCleanup(CONF.clear_override, 'client_prewarm', group='api')
+        masakari.start_prewarm()
+        prewarmer = masakari._prewarmer
+        masakari.start_prewarm()
+
+        # A single prewarmer runs in the process.
+        mock_start.assert_called_once_with()
+        masakari.stop_prewarm()
+        self.assertTrue(prewarmer.stopped.is_set())
+        self.assertIsNone(masakari._prewarmer)
+
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    def test_prewarm(self, mock_auth, mock_session, mock_connection):
+        mock_conn = mock.Mock()
+        mock_connection.return_value = mock_conn
+        mock_conn.instance_ha.get_endpoint.side_effect = [
+            Exception('error'), 'http://controller/instance-ha/v1']
+        session = mock_session.return_value
+        session.auth.get_access.return_value.expires = \
+            timeutils.utcnow(with_timezone=True) + \
+            datetime.timedelta(seconds=3600)
+
+        prewarmer = masakari.ClientPrewarmer()
+        with mock.patch.object(prewarmer.stopped, 'wait',
+                               side_effect=[False, True]) as mock_wait:
+            prewarmer._run()
+
+        self.assertEqual(2, mock_conn.instance_ha.get_endpoint.call_count)
+        session.auth.get_access.assert_called_once_with(session)
+        # The token is refreshed a minute before it expires.
+        wait = mock_wait.call_args_list[1][0][0]
+        self.assertTrue(3530 < wait <= 3540, wait)
+
+        # The notifiers use the client prepared.
+        self.addCleanup(setattr, masakari, '_prewarmer', None)
+        masakari._prewarmer = prewarmer
+        notifier = masakari.SendNotification()
+        self.assertIs(mock_conn.instance_ha, notifier.masakari_client)
+        self.assertEqual(2, mock_connection.call_count)
+
+    def test_prewarm_stop(self):
+        prewarmer = masakari.ClientPrewarmer()
+        self.addCleanup(prewarmer.stop)
+        with mock.patch.object(masakari, '_make_client',
+                               side_effect=Exception('error')):
+            prewarmer.start()
+            prewarmer.stop()
+            prewarmer.thread.join(5)
+
+        self.assertFalse(prewarmer.thread.is_alive())
+        self.assertIsNone(prewarmer.client)
+
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    @mock.patch.object(masakari, 'LOG')
+    def test_send_notification_first_latency(
+        self, mock_log, mock_auth, mock_session, mock_connection):
+
+        notifier = masakari.SendNotification()
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+
+        first = [c for c in mock_log.info.call_args_list
+                 if c[0][0].startswith('First notification')]
+        self.assertEqual(1, len(first))
+
+    @mock.patch.object(threading, 'Timer')
+    @mock.patch.object(connection, 'Connection')
+    @mock.patch.object(ks_loading, 'load_session_from_conf_options')
+    @mock.patch.object(ks_loading, 'load_auth_from_conf_options')
+    def test_send_notification_coalesce(
+        self, mock_auth, mock_session, mock_connection, mock_timer):
+
+        mock_conn = mock.Mock()
+        mock_connection.return_value = mock_conn
+        CONF.set_override('notification_coalesce_window', 5, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_coalesce_window',
+                        group='api')
+        CONF.set_override('notification_duplicate_ttl', 300, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_duplicate_ttl',
+                        group='api')
+
+        notifier = masakari.SendNotification()
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+
+        mock_conn.instance_ha.create_notification.assert_not_called()
+        notifier.coalescer._flush(mock_timer.call_args[0][2][0])
+        mock_conn.instance_ha.create_notification.assert_called_once()
+
+        # The notification answered is not sent again.
+        notifier.send_notification(
+            self.api_retry_max, self.api_retry_interval, self.event)
+        mock_timer.assert_called_once()
+
+
+class TestNotificationDispatcher(testtools.TestCase):
+
+    def setUp(self):
+        super(TestNotificationDispatcher, self).setUp()
+        self.notifier = mock.Mock()
+        self.notifier._create_notification.return_value = True
+        self.notifier.breaker = None
+        self.dispatcher = masakari.NotificationDispatcher(self.notifier, 2, 3)
+        self.addCleanup(self._stop)
+        # Released to let the workers send the notifications.
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def _stop(self):
+        self.dispatcher.stop()
+
+    def _make_event(self, hostname, event=ec.EventConstants.EVENT_STOPPED,
+                    notice_type=ec.EventConstants.TYPE_COMPUTE_HOST):
+        return {
+            'notification': {
+                'type': notice_type,
+                'hostname': hostname,
+                'generated_time': timeutils.utcnow(),
+                'payload': {'event': event}
+            }
+        }
+
+    def _wait_for(self, predicate):
+        for i in range(500):
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _run(self):
+        self.assertTrue(self._wait_for(
+            lambda: not self.dispatcher.notifications))
+
+    def _hold(self):
+        # The workers wait for the release to send the notifications.
+        def _create_notification(event):
+            self.release.wait(5)
+            return True
+        self.notifier._create_notification.side_effect = _create_notification
+
+    def test_dispatch(self):
+        event = self._make_event('compute-node1')
+        self._hold()
+
+        self.assertTrue(self.dispatcher.dispatch(3, 0, event))
+        # The notification is sent in the background.
+        self.assertEqual(1, self.dispatcher.get_stats()['depth'])
+
+        self.release.set()
+        self._run()
+
+        self.notifier._create_notification.assert_called_once_with(event)
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual(0, stats['oldest_age'])
+        self.assertEqual(1, stats['sent'])
+        self.assertEqual({}, self.dispatcher.waiting)
+
+    def test_dispatch_rejected(self):
+        self.notifier._create_notification.return_value = False
+
+        self.dispatcher.dispatch(3, 0, self._make_event('compute-node1'))
+        self._run()
+
+        self.notifier._create_notification.assert_called_once()
+        self.assertEqual(1, self.dispatcher.get_stats()['rejected'])
+
+    def test_dispatch_retry(self):
+        self.notifier._create_notification.side_effect = [
+            Exception('error'), Exception('error'), True]
+
+        self.dispatcher.dispatch(3, 0, self._make_event('compute-node1'))
+        self._run()
+
+        self.assertEqual(3, self.notifier._create_notification.call_count)
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(2, stats['retried'])
+        self.assertEqual(1, stats['sent'])
+
+    def test_dispatch_retry_failed(self):
+        self.notifier._create_notification.side_effect = Exception('error')
+        self.notifier._masakari_client = mock.Mock()
+
+        self.dispatcher.dispatch(2, 0, self._make_event('compute-node1'))
+        self._run()
+
+        self.assertEqual(3, self.notifier._create_notification.call_count)
+        self.assertEqual(1, self.dispatcher.get_stats()['failed'])
+        self.assertIsNone(self.notifier._masakari_client)
+
+    def test_dispatch_retry_does_not_hold_worker(self):
+        event1 = self._make_event('compute-node1')
+        event2 = self._make_event('compute-node2')
+        self.notifier._create_notification.side_effect = [
+            Exception('error'), True, True]
+
+        self.dispatcher.dispatch(3, 60, event1)
+        self.dispatcher.dispatch(3, 60, event2)
+        self.assertTrue(self._wait_for(
+            lambda: self.dispatcher.get_stats()['sent'] == 1))
+
+        # The notification of compute-node2 was sent while the one of
+        # compute-node1 waits for its retry.
+        self.assertEqual([mock.call(event1), mock.call(event2)],
+                         self.notifier._create_notification.call_args_list)
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(1, stats['depth'])
+        self.assertEqual(1, stats['sent'])
+
+    def test_dispatch_in_order_per_host(self):
+        stopped = self._make_event('compute-node1')
+        started = self._make_event('compute-node1',
+                                   ec.EventConstants.EVENT_STARTED)
+        self.notifier._create_notification.side_effect = [
+            Exception('error'), True, True]
+
+        self.dispatcher.dispatch(3, 0, stopped)
+        self.dispatcher.dispatch(3, 0, started)
+        self._run()
+
+        # The second notification waited for the retry of the first.
+        self.assertEqual(
+            [mock.call(stopped), mock.call(stopped), mock.call(started)],
+            self.notifier._create_notification.call_args_list)
+
+    @mock.patch.object(masakari, 'LOG')
+    def test_dispatch_queue_full(self, mock_log):
+        vm = ec.EventConstants.TYPE_VM
+        self._hold()
+        for i in range(3):
+            self.assertTrue(self.dispatcher.dispatch(
+                3, 0, self._make_event('compute-node%d' % i,
+                                       notice_type=vm)))
+
+        self.assertFalse(self.dispatcher.dispatch(
+            3, 0, self._make_event('compute-node3', notice_type=vm)))
+
+        mock_log.error.assert_called_once()
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(3, stats['depth'])
+        self.assertEqual(1, stats['dropped'])
+        self.assertEqual(1, stats['types'][vm]['dropped'])
+
+        # The host notifications are never dropped.
+        self.assertTrue(self.dispatcher.dispatch(
+            3, 0, self._make_event('compute-node4')))
+
+        self.release.set()
+        self._run()
+        self.assertEqual(4, self.dispatcher.get_stats()['sent'])
+
+    def test_dispatch_priority(self):
+        vm = self._make_event('compute-node1',
+                              notice_type=ec.EventConstants.TYPE_VM)
+        process = self._make_event('compute-node1',
+                                   notice_type=ec.EventConstants.TYPE_PROCESS)
+        host = self._make_event('compute-node1')
+        self.dispatcher.workers = 1
+
+        # The worker takes the notifications once all are queued.
+        with self.dispatcher.condition:
+            self.dispatcher.dispatch(3, 0, vm)
+            self.dispatcher.dispatch(3, 0, process)
+            self.dispatcher.dispatch(3, 0, host)
+        self._run()
+
+        self.assertEqual(
+            [mock.call(host), mock.call(process), mock.call(vm)],
+            self.notifier._create_notification.call_args_list)
+
+    def test_dispatch_rate_limit(self):
+        CONF.set_override('notification_rate_limits', {'VM': '1'},
+                          group='api')
+        self.addCleanup(CONF.clear_override, 'notification_rate_limits',
+                        group='api')
+        CONF.set_override('notification_rate_burst', 1, group='api')
+        self.addCleanup(CONF.clear_override, 'notification_rate_burst',
+                        group='api')
+        self.dispatcher = masakari.NotificationDispatcher(self.notifier, 2, 3)
+        vm = ec.EventConstants.TYPE_VM
+        host = ec.EventConstants.TYPE_COMPUTE_HOST
+
+        self.dispatcher.dispatch(3, 0, self._make_event(
+            'compute-node1', notice_type=vm))
+        self.dispatcher.dispatch(3, 0, self._make_event(
+            'compute-node2', notice_type=vm))
+        self.dispatcher.dispatch(3, 0, self._make_event('compute-node3'))
+        self.assertTrue(self._wait_for(
+            lambda: self.dispatcher.get_stats()['sent'] == 2))
+
+        # The second VM notification waits for a token.
+        self.assertEqual(2, self.notifier._create_notification.call_count)
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(1, stats['depth'])
+        self.assertEqual({'admitted': 1, 'delayed': 1, 'dropped': 0},
+                         stats['types'][vm])
+        self.assertEqual(1, stats['types'][host]['admitted'])
+
+    def test_dispatch_circuit_breaker(self):
+        self.notifier.breaker = circuit_breaker.CircuitBreaker(1, 60, 300)
+        self.notifier.breaker.failure()
+
+        self.dispatcher.dispatch(3, 0, self._make_event('compute-node1'))
+        time.sleep(0.1)
+
+        # The notification stays queued while the circuit is open.
+        self.notifier._create_notification.assert_not_called()
+        self.assertEqual(1, self.dispatcher.get_stats()['depth'])
+
+        self.notifier.breaker.success()
+        self._run()
+
+        self.notifier._create_notification.assert_called_once()
+        self.assertEqual(0, self.dispatcher.get_stats()['depth'])
+
+    def test_dispatch_from_native_thread(self):
+        event = self._make_event('compute-node1',
+                                 notice_type=ec.EventConstants.TYPE_VM)
+
+        def _callback():
+            self.dispatcher.dispatch(3, 0, event)
+            # A libvirt callback thread blocks until its next event.
+            self.release.wait(5)
+
+        thread = threading.Thread(target=_callback)
+        thread.start()
+
+        # The notification is sent while the callback thread is blocked.
+        self.assertTrue(self._wait_for(
+            lambda: self.dispatcher.get_stats()['sent'] == 1))
+        self.notifier._create_notification.assert_called_once_with(event)
+        self.release.set()
+        thread.join(5)
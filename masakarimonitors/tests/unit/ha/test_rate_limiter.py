@@ -0,0 +1,79 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from unittest import mock
+
+import testtools
+
+import masakarimonitors.conf
+from masakarimonitors.ha import rate_limiter
+from masakarimonitors.objects import event_constants as ec
+
+CONF = masakarimonitors.conf.CONF
+
+
+@mock.patch.object(time, 'monotonic')
+class TestTokenBucket(testtools.TestCase):
+
+    def test_reserve(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        bucket = rate_limiter.TokenBucket(2, 2)
+
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        # The reservations beyond the burst are spread over the refill.
+        self.assertEqual(0.5, bucket.reserve())
+        self.assertEqual(1.0, bucket.reserve())
+
+    def test_refill(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        bucket = rate_limiter.TokenBucket(2, 2)
+        bucket.reserve()
+        bucket.reserve()
+
+        mock_monotonic.return_value = 101
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+
+        # The tokens don't accumulate beyond the burst.
+        mock_monotonic.return_value = 200
+        bucket.reserve()
+        self.assertEqual(1, bucket.tokens)
+
+
+class TestRateLimiter(testtools.TestCase):
+
+    def test_priority(self):
+        self.assertLess(
+            rate_limiter.priority(ec.EventConstants.TYPE_COMPUTE_HOST),
+            rate_limiter.priority(ec.EventConstants.TYPE_PROCESS))
+        self.assertLess(
+            rate_limiter.priority(ec.EventConstants.TYPE_PROCESS),
+            rate_limiter.priority(ec.EventConstants.TYPE_VM))
+        self.assertLess(
+            rate_limiter.priority(ec.EventConstants.TYPE_VM),
+            rate_limiter.priority('UNKNOWN'))
+
+    def test_get_buckets(self):
+        self.assertEqual({}, rate_limiter.get_buckets())
+
+        CONF.set_override('notification_rate_limits',
+                          {'VM': '10', 'PROCESS': '0.5', 'COMPUTE_HOST': '0'},
+                          group='api')
+        self.addCleanup(CONF.clear_override, 'notification_rate_limits',
+                        group='api')
+
+        buckets = rate_limiter.get_buckets()
+        self.assertEqual(['PROCESS', 'VM'], sorted(buckets))
+        self.assertEqual(0.5, buckets['PROCESS'].rate)
+        self.assertEqual(10, buckets['VM'].burst)
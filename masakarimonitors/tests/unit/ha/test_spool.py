@@ -0,0 +1,185 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+import shutil
+import tempfile
+import testtools
+import threading
+import time
+from unittest import mock
+
+from masakarimonitors.ha import spool
+
+
+def _make_event(hostname):
+    return {
+        'notification': {
+            'type': 'COMPUTE_HOST',
+            'hostname': hostname,
+            'generated_time': datetime.datetime(2026, 10, 1),
+            'payload': {'event': 'STOPPED'}
+        }
+    }
+
+
+class TestNotificationSpool(testtools.TestCase):
+
+    def setUp(self):
+        super(TestNotificationSpool, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _open(self, segment_size=4096):
+        obj = spool.NotificationSpool(self.path, segment_size, 0)
+        pending = obj.load()
+        self.addCleanup(obj.close)
+        return obj, pending
+
+    def _segments(self):
+        return sorted(os.listdir(self.path))
+
+    def test_load_empty(self):
+        obj, pending = self._open()
+
+        self.assertEqual([], pending)
+        self.assertEqual(['%020d.log' % 1], self._segments())
+
+    def test_replay(self):
+        obj, pending = self._open()
+        entries = [obj.append(12, 10, _make_event('node%d' % i))
+                   for i in range(3)]
+        obj.ack(entries[1])
+        obj.close()
+
+        obj, pending = self._open()
+
+        self.assertEqual(['node0', 'node2'],
+                         [e.event['notification']['hostname']
+                          for e in pending])
+        self.assertEqual('2026-10-01T00:00:00',
+                         pending[0].event['notification']['generated_time'])
+        self.assertEqual((12, 10),
+                         (pending[0].retry_max, pending[0].retry_interval))
+        # The pending notifications were moved to a new segment.
+        self.assertEqual(['%020d.log' % 2], self._segments())
+
+    def test_replay_acknowledged_after_restart(self):
+        obj, pending = self._open()
+        obj.append(12, 10, _make_event('node0'))
+        obj.close()
+
+        obj, pending = self._open()
+        obj.ack(pending[0])
+        obj.close()
+
+        obj, pending = self._open()
+        self.assertEqual([], pending)
+
+    @mock.patch.object(spool, 'LOG')
+    def test_replay_corrupted_line(self, mock_log):
+        obj, pending = self._open()
+        obj.append(12, 10, _make_event('node0'))
+        obj.file.write(b'{"id": 2, "retry')
+        obj.close()
+
+        obj, pending = self._open()
+
+        self.assertEqual(1, len(pending))
+        mock_log.warning.assert_called_once()
+
+    def test_compact(self):
+        obj, pending = self._open(segment_size=4096)
+        entries = []
+        while obj.number < 3:
+            entries.append(obj.append(12, 10, _make_event('node')))
+        self.assertEqual(3, len(self._segments()))
+
+        # The segments are deleted from the oldest one, once all their
+        # notifications were acknowledged.
+        for entry in entries[1:]:
+            obj.ack(entry)
+        self.assertEqual(3, len(self._segments()))
+
+        obj.ack(entries[0])
+        self.assertEqual([obj.number], [int(name[:20])
+                                        for name in self._segments()])
+
+    @mock.patch.object(os, 'fsync')
+    def test_fsync_interval(self, mock_fsync):
+        obj = spool.NotificationSpool(self.path, 4096, 60)
+        obj.load()
+        self.addCleanup(obj.close)
+        mock_fsync.reset_mock()
+
+        obj.append(12, 10, _make_event('node0'))
+        obj.append(12, 10, _make_event('node1'))
+        mock_fsync.assert_not_called()
+        self.assertIsNotNone(obj.sync_timer)
+
+        obj.sync()
+        # The timers of the spools of other tests may fsync their own file
+        # meanwhile.
+        self.assertEqual(
+            [mock.call(obj.file.fileno())],
+            [c for c in mock_fsync.call_args_list
+             if c == mock.call(obj.file.fileno())])
+        self.assertIsNone(obj.sync_timer)
+
+    @mock.patch.object(os, 'fsync')
+    def test_fsync_timer(self, mock_fsync):
+        obj = spool.NotificationSpool(self.path, 4096, 0.01)
+        obj.load()
+        self.addCleanup(obj.close)
+        fsync = mock.call(obj.file.fileno())
+
+        # Appended from a native thread, like the libvirt callbacks.
+        thread = threading.Thread(target=obj.append,
+                                  args=(12, 10, _make_event('node0')))
+        thread.start()
+        thread.join(5)
+        for i in range(500):
+            if obj.sync_timer is None:
+                break
+            time.sleep(0.01)
+
+        self.assertIsNone(obj.sync_timer)
+        self.assertIn(fsync, mock_fsync.call_args_list)
+        self.assertFalse(obj.dirty)
+
+    def test_append_concurrently(self):
+        obj, pending = self._open(segment_size=1024)
+        threads = [threading.Thread(
+            target=lambda i=i: [obj.append(12, 10, _make_event('node%d' % i))
+                                for j in range(20)])
+            for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        obj.close()
+
+        obj, pending = self._open()
+        self.assertEqual(80, len(pending))
+
+    def test_get_spool(self):
+        self.addCleanup(spool._spools.clear)
+        obj, pending = self._open()
+        obj.append(12, 10, _make_event('node0'))
+        obj.close()
+
+        obj = spool.get_spool(self.path, 4096, 0)
+        self.addCleanup(obj.close)
+
+        self.assertEqual(1, len(obj.pending))
+        self.assertIs(obj, spool.get_spool(self.path, 4096, 0))
@@ -15,6 +15,7 @@
 import testtools
 from unittest import mock
 
+import consul
 from oslo_config import fixture as fixture_config
 
 from masakarimonitors.hostmonitor.consul_check import consul_helper
@@ -158,6 +159,15 @@ class TestConsulManager(testtools.TestCase):
                     agents_health = self.consul_manager.get_health(sequence)
                     self.assertEqual(excepted_health, agents_health)
 
+    def test_get_lock(self):
+        lock = self.consul_manager.get_lock(
+            'masakari/lock', 'node01', 30, ['tenant', 'storage'])
+
+        self.assertIs(self.consul_manager.agents['tenant'], lock.agent)
+        self.assertEqual('masakari/lock', lock.key)
+        self.assertEqual('node01', lock.holder)
+        self.assertEqual(30, lock.ttl)
+
 
 class TestConsulAgent(testtools.TestCase):
 
@@ -181,3 +191,54 @@ class TestConsulAgent(testtools.TestCase):
             }
             agents_health = self.consul_agent.get_health()
             self.assertEqual(excepted_health, agents_health)
+
+
+class TestConsulLock(testtools.TestCase):
+
+    def setUp(self):
+        super(TestConsulLock, self).setUp()
+        self.agent = mock.Mock()
+        self.agent.name = 'manage'
+        self.lock = consul_helper.ConsulLock(
+            self.agent, 'masakari/lock', 'node01', 30)
+
+    def test_acquire(self):
+        self.agent.cluster.session.create.return_value = 'session-1'
+        self.agent.cluster.kv.put.return_value = True
+
+        self.assertTrue(self.lock.acquire())
+        self.agent.cluster.session.create.assert_called_once_with(
+            name='node01', behavior='release', ttl=30, lock_delay=0)
+        self.agent.cluster.kv.put.assert_called_once_with(
+            'masakari/lock', 'node01', acquire='session-1')
+
+        # The session is renewed instead of created again.
+        self.agent.cluster.kv.put.return_value = False
+        self.assertFalse(self.lock.acquire())
+        self.agent.cluster.session.renew.assert_called_once_with('session-1')
+        self.agent.cluster.session.create.assert_called_once()
+
+    def test_acquire_session_expired(self):
+        self.lock.session_id = 'session-1'
+        self.agent.cluster.session.renew.side_effect = consul.NotFound()
+        self.agent.cluster.session.create.return_value = 'session-2'
+        self.agent.cluster.kv.put.return_value = True
+
+        self.assertTrue(self.lock.acquire())
+        self.assertEqual('session-2', self.lock.session_id)
+
+    def test_acquire_failure(self):
+        self.agent.cluster.session.create.side_effect = Exception('error')
+
+        self.assertRaises(consul_helper.ConsulLockException,
+                          self.lock.acquire)
+
+    def test_release(self):
+        self.lock.session_id = 'session-1'
+
+        self.lock.release()
+        self.lock.release()
+
+        self.agent.cluster.session.destroy.assert_called_once_with(
+            'session-1')
+        self.assertIsNone(self.lock.session_id)
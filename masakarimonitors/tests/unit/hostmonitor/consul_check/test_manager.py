@@ -15,7 +15,6 @@
 import testtools
 from unittest import mock
 
-from collections import deque
 import eventlet
 from oslo_config import fixture as fixture_config
 
@@ -24,12 +23,21 @@ from masakarimonitors.ha import masakari
 from masakarimonitors.hostmonitor.consul_check import consul_helper
 from masakarimonitors.hostmonitor.consul_check import manager
 from masakarimonitors.hostmonitor.consul_check import matrix_helper
+from masakarimonitors.hostmonitor import health_history
 
 eventlet.monkey_patch(os=False)
 
 CONF = masakarimonitors.conf.CONF
 
 
+def _make_history(samples, histories):
+    history = health_history.HealthHistory(samples)
+    for host, health_list in histories.items():
+        for health in health_list:
+            history.append(host, health)
+    return history
+
+
 class TestConsulCheck(testtools.TestCase):
 
     def setUp(self):
@@ -42,20 +50,17 @@ class TestConsulCheck(testtools.TestCase):
         self.host_monitor.consul_manager = \
             consul_helper.ConsulManager(self.CONF)
         self.host_monitor._sequence = ['manage', 'tenant', 'storage']
-        self.host_monitor.monitoring_data = {
-            "node01": deque([['up', 'up', 'up'],
-                             ['up', 'up', 'up'],
-                             ['up', 'up', 'up']],
-                            maxlen=3),
-            "node02": deque([['up', 'up', 'up'],
-                             ['up', 'up', 'up'],
-                             ['up', 'up', 'down']],
-                            maxlen=3),
-            "node03": deque([['up', 'up', 'up'],
-                             ['down', 'up', 'up'],
-                             ['down', 'up', 'up']],
-                            maxlen=3),
-        }
+        self.host_monitor.monitoring_data = _make_history(3, {
+            "node01": [['up', 'up', 'up'],
+                       ['up', 'up', 'up'],
+                       ['up', 'up', 'up']],
+            "node02": [['up', 'up', 'up'],
+                       ['up', 'up', 'up'],
+                       ['up', 'up', 'down']],
+            "node03": [['up', 'up', 'up'],
+                       ['down', 'up', 'up'],
+                       ['down', 'up', 'up']],
+        })
 
     def test_update_monitoring_data(self):
         mock_health = {
@@ -68,21 +73,20 @@ class TestConsulCheck(testtools.TestCase):
                 return_value=mock_health):
             self.host_monitor.update_monitoring_data()
             excepted_monitoring_data = {
-                "node01": deque([['up', 'up', 'up'],
-                                 ['up', 'up', 'up'],
-                                 ['up', 'up', 'up']],
-                                maxlen=3),
-                "node02": deque([['up', 'up', 'up'],
-                                 ['up', 'up', 'down'],
-                                 ['up', 'up', 'up']],
-                                maxlen=3),
-                "node03": deque([['down', 'up', 'up'],
-                                 ['down', 'up', 'up'],
-                                 ['up', 'up', 'up']],
-                                maxlen=3),
+                "node01": [('up', 'up', 'up'),
+                           ('up', 'up', 'up'),
+                           ('up', 'up', 'up')],
+                "node02": [('up', 'up', 'up'),
+                           ('up', 'up', 'down'),
+                           ('up', 'up', 'up')],
+                "node03": [('down', 'up', 'up'),
+                           ('down', 'up', 'up'),
+                           ('up', 'up', 'up')],
             }
-            self.assertEqual(excepted_monitoring_data,
-                             self.host_monitor.monitoring_data)
+            for host, history in excepted_monitoring_data.items():
+                self.assertEqual(
+                    history, self.host_monitor.monitoring_data.get_history(
+                        host))
 
     def test_get_host_statistical_health(self):
         self.assertEqual(['up', 'up', 'up'],
@@ -155,20 +159,17 @@ class TestConsulCheck(testtools.TestCase):
     @mock.patch.object(masakari.SendNotification, 'send_notification')
     @mock.patch.object(manager.ConsulCheck, '_event')
     def test_poll_hosts(self, mock_event, mock_send_notification):
-        self.host_monitor.monitoring_data = {
-            "node01": deque([['up', 'up', 'up'],
-                             ['up', 'up', 'up'],
-                             ['up', 'up', 'up']],
-                            maxlen=3),
-            "node02": deque([['up', 'up', 'down'],
-                             ['up', 'up', 'down'],
-                             ['up', 'up', 'down']],
-                            maxlen=3),
-            "node03": deque([['up', 'up', 'up'],
-                             ['up', 'up', 'up'],
-                             ['up', 'up', 'up']],
-                            maxlen=3),
-        }
+        self.host_monitor.monitoring_data = _make_history(3, {
+            "node01": [['up', 'up', 'up'],
+                       ['up', 'up', 'up'],
+                       ['up', 'up', 'up']],
+            "node02": [['up', 'up', 'down'],
+                       ['up', 'up', 'down'],
+                       ['up', 'up', 'down']],
+            "node03": [['up', 'up', 'up'],
+                       ['up', 'up', 'up'],
+                       ['up', 'up', 'up']],
+        })
 
         self.host_monitor.last_host_health = {
             'node02': ['up', 'up', None],
@@ -181,3 +182,96 @@ class TestConsulCheck(testtools.TestCase):
         self.host_monitor.poll_hosts()
         mock_send_notification.assert_called_once_with(
             CONF.host.api_retry_max, CONF.host.api_retry_interval, test_event)
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(manager.ConsulCheck, '_event')
+    def test_poll_hosts_designated_notifier(self, mock_event,
+                                            mock_send_notification):
+        CONF.set_override('designated_notifier', True, group='host')
+        self.addCleanup(CONF.clear_override, 'designated_notifier',
+                        group='host')
+        self.host_monitor.notifier_lock = mock.Mock()
+        self.host_monitor.notifier_lock.acquire.return_value = False
+        self.host_monitor.monitoring_data = _make_history(1, {
+            "node02": [['up', 'up', 'down']],
+        })
+        self.host_monitor.last_host_health = {
+            'node02': ['up', 'up', 'up'],
+        }
+        test_event = {'notification': 'test'}
+        mock_event.return_value = test_event
+
+        self.host_monitor.poll_hosts()
+        mock_send_notification.assert_not_called()
+        self.assertEqual(['up', 'up', 'up'],
+                         self.host_monitor.last_host_health['node02'])
+
+        # This hostmonitor takes over and notifies the pending change.
+        self.host_monitor.notifier_lock.acquire.return_value = True
+        self.host_monitor.poll_hosts()
+        mock_send_notification.assert_called_once_with(
+            CONF.host.api_retry_max, CONF.host.api_retry_interval, test_event)
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(manager.ConsulCheck, '_event')
+    def test_poll_hosts_storm_guard(self, mock_event,
+                                    mock_send_notification):
+        CONF.set_override('storm_guard_threshold', 0.5, group='host')
+        self.addCleanup(CONF.clear_override, 'storm_guard_threshold',
+                        group='host')
+        self.host_monitor.monitoring_data = _make_history(1, {
+            "node01": [['up', 'up', 'down']],
+            "node02": [['up', 'up', 'down']],
+            "node03": [['up', 'up', 'up']],
+        })
+        self.host_monitor.last_host_health = {
+            'node01': ['up', 'up', 'up'],
+            'node02': ['up', 'up', 'up'],
+            'node03': ['up', 'up', 'up'],
+        }
+        test_event = {'notification': 'test'}
+        mock_event.return_value = test_event
+
+        self.host_monitor.poll_hosts()
+
+        mock_send_notification.assert_not_called()
+        # The changes are held to be notified after the storm.
+        self.assertEqual(['up', 'up', 'up'],
+                         self.host_monitor.last_host_health['node01'])
+        self.assertEqual(['up', 'up', 'up'],
+                         self.host_monitor.last_host_health['node02'])
+
+    def test_is_designated_notifier_lock_failure(self):
+        CONF.set_override('designated_notifier', True, group='host')
+        self.addCleanup(CONF.clear_override, 'designated_notifier',
+                        group='host')
+        self.host_monitor.notifier_lock = mock.Mock()
+        self.host_monitor.notifier_lock.acquire.side_effect = \
+            consul_helper.ConsulLockException(
+                key='masakari/hostmonitor/notifier', cluster='manage',
+                err='error')
+
+        self.assertFalse(self.host_monitor._is_designated_notifier())
+
+    def test_stop_releases_lock(self):
+        notifier_lock = mock.Mock()
+        self.host_monitor.notifier_lock = notifier_lock
+
+        self.host_monitor.stop()
+
+        notifier_lock.release.assert_called_once_with()
+        self.assertIsNone(self.host_monitor.notifier_lock)
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(manager.ConsulCheck, 'poll_hosts')
+    @mock.patch.object(manager.ConsulCheck, 'update_monitoring_data')
+    def test_monitor_hosts(self, mock_update_monitoring_data,
+                           mock_poll_hosts, mock_sleep):
+        mock_update_monitoring_data.side_effect = \
+            [None, Exception("Test exception."), KeyboardInterrupt()]
+
+        self.assertRaises(KeyboardInterrupt, self.host_monitor.monitor_hosts)
+
+        self.assertEqual(1, mock_poll_hosts.call_count)
+        self.assertEqual(2, self.host_monitor.scheduler.cycles)
+        self.assertEqual(2, mock_sleep.call_count)
@@ -0,0 +1,143 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import grp
+import os
+import shutil
+import tempfile
+import testtools
+from unittest import mock
+
+import eventlet
+
+from masakarimonitors.cmd import hostmonitor_alert
+from masakarimonitors.hostmonitor.host_handler import cib_events
+
+eventlet.monkey_patch(os=False)
+
+NODE_ALERT = {
+    'CRM_alert_kind': 'node',
+    'CRM_alert_node': 'node2',
+    'CRM_alert_desc': 'lost',
+}
+
+
+class TestCibEventListener(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCibEventListener, self).setUp()
+        # UNIX socket paths are limited to about 100 characters.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'run', 'hostmonitor-cib.sock')
+        self.obj = cib_events.CibEventListener(self.path)
+        self.addCleanup(self.obj.stop)
+
+    def test_send_alert(self):
+        self.obj.start()
+
+        self.assertTrue(cib_events.send_alert(self.path, NODE_ALERT))
+        events = self.obj.wait(5)
+
+        self.assertEqual(
+            [{'kind': 'node', 'node': 'node2', 'desc': 'lost', 'rsc': None,
+              'task': None}],
+            events)
+        self.assertEqual(0o660, os.stat(self.path).st_mode & 0o777)
+
+    def test_start_group(self):
+        group = grp.getgrgid(os.getgid()).gr_name
+        obj = cib_events.CibEventListener(self.path, group)
+        self.addCleanup(obj.stop)
+        obj.start()
+
+        self.assertEqual(os.getgid(), os.stat(self.path).st_gid)
+        self.assertEqual(0o660, os.stat(self.path).st_mode & 0o777)
+
+    @mock.patch.object(grp, 'getgrnam')
+    def test_start_unknown_group(self, mock_getgrnam):
+        mock_getgrnam.side_effect = KeyError('haclient')
+        obj = cib_events.CibEventListener(self.path, 'haclient')
+        self.addCleanup(obj.stop)
+
+        self.assertRaises(KeyError, obj.start)
+        self.assertFalse(obj.running)
+
+    def test_send_alert_burst(self):
+        self.obj.start()
+
+        cib_events.send_alert(self.path, NODE_ALERT)
+        cib_events.send_alert(self.path, dict(NODE_ALERT,
+                                              CRM_alert_kind='fencing'))
+        # Let the listener receive both datagrams.
+        eventlet.greenthread.sleep(0.1)
+
+        self.assertEqual(['node', 'fencing'],
+                         [event['kind'] for event in self.obj.wait(5)])
+
+    def test_send_alert_ignored_kind(self):
+        self.obj.start()
+
+        self.assertFalse(cib_events.send_alert(
+            self.path, dict(NODE_ALERT, CRM_alert_kind='attribute')))
+        self.assertEqual([], self.obj.wait(0.1))
+
+    def test_send_alert_not_listening(self):
+        self.assertFalse(cib_events.send_alert(self.path, NODE_ALERT))
+
+    def test_start_stale_socket(self):
+        self.obj.start()
+        self.obj.stop()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        open(self.path, 'w').close()
+
+        obj = cib_events.CibEventListener(self.path)
+        self.addCleanup(obj.stop)
+        obj.start()
+
+        self.assertTrue(cib_events.send_alert(self.path, NODE_ALERT))
+        self.assertEqual(1, len(obj.wait(5)))
+
+    def test_wait_timeout(self):
+        self.obj.start()
+
+        self.assertEqual([], self.obj.wait(0.1))
+
+    def test_stop_wakes_up_waiter(self):
+        self.obj.start()
+        waiter = eventlet.spawn(self.obj.wait, 30)
+        eventlet.greenthread.sleep(0)
+
+        self.obj.stop()
+
+        self.assertEqual([], waiter.wait())
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestHostmonitorAlert(testtools.TestCase):
+
+    @mock.patch.object(cib_events, 'send_alert')
+    def test_main(self, mock_send_alert):
+        environ = dict(NODE_ALERT, CRM_alert_recipient='/tmp/test.sock')
+        with mock.patch.dict(os.environ, environ):
+            self.assertEqual(0, hostmonitor_alert.main())
+
+        mock_send_alert.assert_called_once_with('/tmp/test.sock', os.environ)
+
+    @mock.patch.object(cib_events, 'send_alert')
+    def test_main_no_recipient(self, mock_send_alert):
+        with mock.patch.dict(os.environ, NODE_ALERT):
+            os.environ.pop('CRM_alert_recipient', None)
+            hostmonitor_alert.main()
+
+        mock_send_alert.assert_called_once_with(
+            cib_events.DEFAULT_SOCKET_PATH, os.environ)
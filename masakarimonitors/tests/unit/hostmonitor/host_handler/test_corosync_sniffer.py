@@ -0,0 +1,124 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import testtools
+from unittest import mock
+
+import eventlet
+
+from masakarimonitors.hostmonitor.host_handler import corosync_sniffer
+
+eventlet.monkey_patch(os=False)
+
+
+class TestCorosyncSniffer(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCorosyncSniffer, self).setUp()
+
+    def test_bpf_udp_port(self):
+        program = corosync_sniffer._bpf_udp_port(5405)
+
+        self.assertEqual(20, len(program))
+        # Every port comparison uses the requested port.
+        port_checks = [insn for insn in program
+                       if insn[0] == 0x15 and insn[3] == 5405]
+        self.assertEqual(4, len(port_checks))
+        # All jumps stay within the program.
+        for pc, (code, jt, jf, k) in enumerate(program):
+            if code & 0x07 != 0x05:
+                continue
+            self.assertLessEqual(pc + 1 + jt, len(program) - 1)
+            self.assertLessEqual(pc + 1 + jf, len(program) - 1)
+        self.assertEqual((0x06, 0, 0, 0), program[-1])
+
+    @mock.patch.object(eventlet, 'spawn')
+    @mock.patch.object(corosync_sniffer.socket, 'socket')
+    def test_start(self, mock_socket, mock_spawn):
+        mock_sock = mock.Mock()
+        mock_sock.recv.side_effect = OSError(errno.EAGAIN, 'again')
+        mock_socket.return_value = mock_sock
+
+        obj = corosync_sniffer.CorosyncSniffer(['enp0s3', 'enp0s8'],
+                                               [5405, 5406])
+        obj.start()
+
+        self.assertTrue(obj.running)
+        self.assertEqual(2, mock_socket.call_count)
+        mock_sock.bind.assert_any_call(('enp0s3', 0))
+        mock_sock.bind.assert_any_call(('enp0s8', 0))
+        self.assertEqual(2, mock_sock.setsockopt.call_count)
+        mock_spawn.assert_any_call(obj._listen, 'enp0s3', 5405)
+        mock_spawn.assert_any_call(obj._listen, 'enp0s8', 5406)
+        for age in obj.get_heartbeat_ages().values():
+            self.assertIsNotNone(age)
+
+    @mock.patch.object(eventlet, 'spawn')
+    @mock.patch.object(corosync_sniffer.socket, 'socket')
+    def test_start_permission_denied(self, mock_socket, mock_spawn):
+        mock_socket.side_effect = PermissionError(errno.EPERM, 'denied')
+
+        obj = corosync_sniffer.CorosyncSniffer(['enp0s3'], [5405])
+
+        self.assertRaises(PermissionError, obj.start)
+        self.assertFalse(obj.running)
+        mock_spawn.assert_not_called()
+
+    def test_get_heartbeat_ages_not_started(self):
+        obj = corosync_sniffer.CorosyncSniffer(['enp0s3'], [5405])
+
+        self.assertEqual({('enp0s3', 5405): None}, obj.get_heartbeat_ages())
+        self.assertFalse(obj.is_alive('enp0s3', 5405, 5))
+
+    @mock.patch('time.monotonic')
+    def test_is_alive(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        obj = corosync_sniffer.CorosyncSniffer(['enp0s3', 'enp0s8'],
+                                               [5405, 5406])
+        obj.last_seen[('enp0s3', 5405)] = 98.0
+        obj.last_seen[('enp0s8', 5406)] = 90.0
+
+        self.assertTrue(obj.is_alive('enp0s3', 5405, 5))
+        self.assertFalse(obj.is_alive('enp0s8', 5406, 5))
+
+    def test_listen(self):
+        obj = corosync_sniffer.CorosyncSniffer(['enp0s3'], [5405])
+        mock_sock = mock.Mock()
+
+        def _recv(size):
+            if mock_sock.recv.call_count == 2:
+                obj.running = False
+            return b'frame'
+
+        mock_sock.recv.side_effect = _recv
+        obj._sockets[('enp0s3', 5405)] = mock_sock
+        obj.running = True
+        obj._listen('enp0s3', 5405)
+
+        self.assertEqual(2, mock_sock.recv.call_count)
+        self.assertIn(('enp0s3', 5405), obj.last_seen)
+
+    def test_stop(self):
+        obj = corosync_sniffer.CorosyncSniffer(['enp0s3'], [5405])
+        mock_sock = mock.Mock()
+        mock_thread = mock.Mock()
+        obj._sockets[('enp0s3', 5405)] = mock_sock
+        obj._threads.append(mock_thread)
+        obj.running = True
+
+        obj.stop()
+
+        self.assertFalse(obj.running)
+        mock_thread.kill.assert_called_once_with()
+        mock_sock.close.assert_called_once_with()
+        self.assertEqual({}, obj._sockets)
@@ -12,17 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 import socket
 import testtools
+import time
 from unittest import mock
 from xml.etree import ElementTree
 
-from collections import deque
 import eventlet
 from oslo_utils import timeutils
 
 import masakarimonitors.conf
 from masakarimonitors.ha import masakari
+from masakarimonitors.hostmonitor.host_handler import cib_events
+from masakarimonitors.hostmonitor.host_handler import corosync_sniffer
 from masakarimonitors.hostmonitor.host_handler import handle_host
 from masakarimonitors.hostmonitor.host_handler import hold_host_status
 from masakarimonitors.hostmonitor.host_handler import parse_cib_xml
@@ -79,6 +82,24 @@ CRMMON_NODES_TAG_XML = """
 </nodes>
 """
 
+CRMMON_SINGLE_PASS_XML = """<?xml version="1.0"?>
+<pacemaker-result api-version="2.2" request="crm_mon --output-as=xml">
+  <summary>
+    <current_dc present="true" name="member2" with_quorum="true"/>
+    <last_change time="Thu Oct 15 09:58:41 2026" user="root"
+                 client="cibadmin" origin="member2"/>
+  </summary>
+  <nodes>
+    <node name="member1" id="1002" online="true" pending="false"
+          unclean="false" type="member"/>
+    <node name="member2" id="1001" online="true" pending="false"
+          unclean="false" type="member"/>
+    <node name="remote1" id="remotehostname1" online="false"
+          pending="false" unclean="false" type="remote"/>
+  </nodes>
+</pacemaker-result>
+"""
+
 
 class TestCibSchemaCompliantTag(testtools.TestCase):
 
@@ -284,6 +305,87 @@ class TestHandleHost(testtools.TestCase):
         command = cmd_str.split()
         mock_execute.assert_called_once_with(*command, run_as_root=True)
 
+    @mock.patch.object(utils, 'execute')
+    @mock.patch.object(corosync_sniffer, 'CorosyncSniffer')
+    @mock.patch.object(handle_host.HandleHost, '_check_pacemaker_services')
+    def test_check_hb_line_sniffer(
+        self, mock_check_pacemaker_services, mock_sniffer, mock_execute):
+
+        mock_check_pacemaker_services.side_effect = [True, True, False]
+        CONF.set_override("corosync_multicast_interfaces", "enp0s3,enp0s8",
+                          "host")
+        CONF.set_override("corosync_multicast_ports", "5405,5406", "host")
+        CONF.set_override("corosync_heartbeat_check", "sniffer", "host")
+        self.addCleanup(CONF.clear_override, "corosync_heartbeat_check",
+                        "host")
+        mock_sniffer.return_value.is_alive.side_effect = [False, True]
+
+        obj = handle_host.HandleHost()
+        ret = obj._check_hb_line()
+
+        self.assertEqual(0, ret)
+        mock_sniffer.assert_called_once_with(['enp0s3', 'enp0s8'],
+                                             [5405, 5406])
+        mock_sniffer.return_value.start.assert_called_once_with()
+        mock_sniffer.return_value.is_alive.assert_has_calls([
+            mock.call('enp0s3', 5405, CONF.host.corosync_heartbeat_staleness),
+            mock.call('enp0s8', 5406, CONF.host.corosync_heartbeat_staleness)])
+        mock_execute.assert_not_called()
+
+    @mock.patch.object(utils, 'execute')
+    @mock.patch.object(corosync_sniffer, 'CorosyncSniffer')
+    @mock.patch.object(handle_host.HandleHost, '_check_pacemaker_services')
+    def test_check_hb_line_sniffer_stale(
+        self, mock_check_pacemaker_services, mock_sniffer, mock_execute):
+
+        mock_check_pacemaker_services.side_effect = [True, True, False]
+        CONF.set_override("corosync_multicast_interfaces", "enp0s8", "host")
+        CONF.set_override("corosync_multicast_ports", "5405", "host")
+        CONF.set_override("corosync_heartbeat_check", "sniffer", "host")
+        self.addCleanup(CONF.clear_override, "corosync_heartbeat_check",
+                        "host")
+        mock_sniffer.return_value.is_alive.return_value = False
+
+        obj = handle_host.HandleHost()
+        ret = obj._check_hb_line()
+
+        self.assertEqual(1, ret)
+        mock_execute.assert_not_called()
+
+    @mock.patch.object(utils, 'execute')
+    @mock.patch.object(corosync_sniffer, 'CorosyncSniffer')
+    @mock.patch.object(handle_host.HandleHost, '_check_pacemaker_services')
+    def test_check_hb_line_sniffer_start_fail(
+        self, mock_check_pacemaker_services, mock_sniffer, mock_execute):
+
+        mock_check_pacemaker_services.side_effect = [True, True, False] * 2
+        interfaces = "enp0s8"
+        ports = "5405"
+        CONF.set_override("corosync_multicast_interfaces", interfaces, "host")
+        CONF.set_override("corosync_multicast_ports", ports, "host")
+        CONF.set_override("corosync_heartbeat_check", "sniffer", "host")
+        self.addCleanup(CONF.clear_override, "corosync_heartbeat_check",
+                        "host")
+        mock_sniffer.return_value.start.side_effect = PermissionError()
+        mock_execute.return_value = ('', '')
+
+        obj = handle_host.HandleHost()
+        ret = obj._check_hb_line()
+
+        self.assertEqual(0, ret)
+        self.assertIsNone(obj.corosync_sniffer)
+        cmd_str = ("timeout %s tcpdump -n -c 1 -p -i %s port %s") \
+            % (CONF.host.tcpdump_timeout, interfaces, ports)
+        command = cmd_str.split()
+        mock_execute.assert_called_once_with(*command, run_as_root=True)
+
+        # The sniffer isn't started again after a failure.
+        ret = obj._check_hb_line()
+
+        self.assertEqual(0, ret)
+        mock_sniffer.assert_called_once_with([interfaces], [int(ports)])
+        self.assertEqual(2, mock_execute.call_count)
+
     @mock.patch.object(utils, 'execute')
     def test_check_host_status_by_crmadmin_idle(self, mock_execute):
         my_hostname = socket.gethostname()
@@ -346,6 +448,19 @@ class TestHandleHost(testtools.TestCase):
         mock_execute.assert_called_once_with(
             'cibadmin', '--query', run_as_root=True)
 
+    @mock.patch.object(utils, 'execute')
+    def test_get_cib_xml_with_options(self, mock_execute):
+        mock_execute.return_value = ('test_stdout', '')
+
+        obj = handle_host.HandleHost()
+        ret = obj._get_cib_xml('--scope', 'status')
+
+        self.assertEqual('test_stdout', ret)
+        mock_execute.assert_called_once_with(
+            'cibadmin', '--query', '--scope', 'status', run_as_root=True)
+        self.assertEqual({'queries': 1, 'bytes': 11, 'parse_time': 0.0},
+                         obj.query_stats)
+
     @mock.patch.object(utils, 'execute')
     def test_get_cib_xml_output_stderr(self, mock_execute):
         mock_execute.return_value = ('test_stdout', 'test_stderr')
@@ -368,6 +483,20 @@ class TestHandleHost(testtools.TestCase):
         mock_execute.assert_called_once_with(
             'crm_mon', '-X', run_as_root=True)
 
+    @mock.patch.object(utils, 'execute')
+    def test_get_crmmon_xml_minimal_scope(self, mock_execute):
+        mock_execute.return_value = ('test_stdout', '')
+        CONF.set_override('cluster_query_scope', 'minimal', 'host')
+        self.addCleanup(CONF.clear_override, 'cluster_query_scope', 'host')
+
+        obj = handle_host.HandleHost()
+        ret = obj._get_crmmon_xml()
+
+        self.assertEqual('test_stdout', ret)
+        mock_execute.assert_called_once_with(
+            'crm_mon', '--output-as=xml', '--exclude=all',
+            '--include=dc,nodes,times', run_as_root=True)
+
     @mock.patch.object(utils, 'execute')
     def test_get_crmmon_xml_stderr(self, mock_execute):
         mock_execute.return_value = ('test_stdout', 'test_stderr')
@@ -597,6 +726,73 @@ class TestHandleHost(testtools.TestCase):
         }
         self.assertEqual(event, ret)
 
+    @mock.patch.object(handle_host.HandleHost, '_is_poweroff')
+    def test_check_poweroff_cache(self, mock_is_poweroff):
+        mock_is_poweroff.return_value = True
+        CONF.set_override('ipmi_check_cache_ttl', 60, 'host')
+        self.addCleanup(CONF.clear_override, 'ipmi_check_cache_ttl', 'host')
+
+        obj = handle_host.HandleHost()
+
+        self.assertTrue(obj._check_poweroff('node2'))
+        self.assertTrue(obj._check_poweroff('node2'))
+        mock_is_poweroff.assert_called_once_with('node2')
+
+    @mock.patch.object(handle_host.HandleHost, '_is_poweroff')
+    def test_check_poweroff_cache_power_on(self, mock_is_poweroff):
+        mock_is_poweroff.side_effect = [False, True]
+        CONF.set_override('ipmi_check_cache_ttl', 60, 'host')
+        self.addCleanup(CONF.clear_override, 'ipmi_check_cache_ttl', 'host')
+
+        obj = handle_host.HandleHost()
+
+        # A host which isn't confirmed to be powered off is checked again.
+        self.assertFalse(obj._check_poweroff('node2'))
+        self.assertTrue(obj._check_poweroff('node2'))
+        self.assertEqual(2, mock_is_poweroff.call_count)
+
+    @mock.patch.object(handle_host.HandleHost, '_is_poweroff')
+    def test_check_poweroff_deadline_not_cached(self, mock_is_poweroff):
+        def _is_poweroff(hostname):
+            eventlet.greenthread.sleep(5)
+            return True
+
+        mock_is_poweroff.side_effect = _is_poweroff
+        CONF.set_override('ipmi_check_deadline', 1, 'host')
+        self.addCleanup(CONF.clear_override, 'ipmi_check_deadline', 'host')
+        CONF.set_override('ipmi_check_cache_ttl', 60, 'host')
+        self.addCleanup(CONF.clear_override, 'ipmi_check_cache_ttl', 'host')
+
+        obj = handle_host.HandleHost()
+
+        self.assertFalse(obj._check_poweroff('node2'))
+        self.assertEqual({}, obj.poweroff_cache)
+
+    @mock.patch.object(handle_host.HandleHost, '_is_poweroff')
+    def test_check_poweroff_cache_disabled(self, mock_is_poweroff):
+        mock_is_poweroff.return_value = True
+
+        obj = handle_host.HandleHost()
+        obj._check_poweroff('node2')
+        obj._check_poweroff('node2')
+
+        self.assertEqual(2, mock_is_poweroff.call_count)
+        self.assertEqual({}, obj.poweroff_cache)
+
+    @mock.patch.object(handle_host.HandleHost, '_is_poweroff')
+    def test_check_poweroff_deadline(self, mock_is_poweroff):
+        def _is_poweroff(hostname):
+            eventlet.greenthread.sleep(5)
+            return True
+
+        mock_is_poweroff.side_effect = _is_poweroff
+        CONF.set_override('ipmi_check_deadline', 1, 'host')
+        self.addCleanup(CONF.clear_override, 'ipmi_check_deadline', 'host')
+
+        obj = handle_host.HandleHost()
+
+        self.assertFalse(obj._check_poweroff('node2'))
+
     def test_normalize_host_status_pre_pacemaker_pre_2_1_7(self):
         status_xml = ElementTree.fromstring("""
             <status>
@@ -660,7 +856,9 @@ class TestHandleHost(testtools.TestCase):
         calls_set_host_status = [mock.call(node_state_node4),
                                  mock.call(node_state_node5)]
         mock_get_host_status.assert_has_calls(calls_get_host_status)
-        mock_set_host_status.assert_has_calls(calls_set_host_status)
+        # The hosts which went offline are recorded after the others.
+        mock_set_host_status.assert_has_calls(calls_set_host_status,
+                                              any_order=True)
         mock_make_event.assert_called_once_with(node4, 'offline')
         mock_send_notification.assert_called_once_with(
             CONF.host.api_retry_max, CONF.host.api_retry_interval, test_event)
@@ -685,36 +883,37 @@ class TestHandleHost(testtools.TestCase):
         CONF.host.monitoring_samples = 3
 
         obj = handle_host.HandleHost()
-        obj.monitoring_data = {
-            "node1": deque(['online', 'online', 'online'], maxlen=3),
-            "node2": deque(['offline', 'online', 'online'], maxlen=3),
-            "node3": deque(['offline'], maxlen=3),
-            "node4": deque(['online', 'offline', 'offline'], maxlen=3),
-            "node5": deque(['online', 'online', 'online'], maxlen=3),
-        }
+        for hostname, history in {
+                "node1": ['online', 'online', 'online'],
+                "node2": ['offline', 'online', 'online'],
+                "node3": ['offline'],
+                "node4": ['online', 'offline', 'offline'],
+                "node5": ['online', 'online', 'online']}.items():
+            for status in history:
+                obj.monitoring_data.append(hostname, status)
         obj._check_if_status_changed(node_state_tag_list)
 
-        self.assertEqual(deque(['online', 'online', 'online'], maxlen=3),
-                         obj.monitoring_data.get('node2'))
+        self.assertEqual(['online', 'online', 'online'],
+                         obj.monitoring_data.get_history('node2'))
         self.assertEqual('online', obj.get_stabilised_host_status('node2'))
         self.assertIn(mock.call(node_state_tag_list[1]),
                       mock_set_host_status.mock_calls)
 
-        self.assertEqual(deque(['offline', 'online'], maxlen=3),
-                         obj.monitoring_data.get('node3'))
+        self.assertEqual(['offline', 'online'],
+                         obj.monitoring_data.get_history('node3'))
         self.assertEqual('_being_collected',
                          obj.get_stabilised_host_status('node3'))
         self.assertNotIn(mock.call(node_state_tag_list[2]),
                          mock_set_host_status.mock_calls)
 
-        self.assertEqual(deque(['offline', 'offline', 'offline'], maxlen=3),
-                         obj.monitoring_data.get('node4'))
+        self.assertEqual(['offline', 'offline', 'offline'],
+                         obj.monitoring_data.get_history('node4'))
         self.assertEqual('offline', obj.get_stabilised_host_status('node4'))
         self.assertIn(mock.call(node_state_tag_list[3]),
                       mock_set_host_status.mock_calls)
 
-        self.assertEqual(deque(['online', 'online', 'other'], maxlen=3),
-                         obj.monitoring_data.get('node5'))
+        self.assertEqual(['online', 'online', 'other'],
+                         obj.monitoring_data.get_history('node5'))
         self.assertEqual('_uncertain', obj.get_stabilised_host_status('node5'))
         self.assertNotIn(mock.call(node_state_tag_list[4]),
                          mock_set_host_status.mock_calls)
@@ -887,6 +1086,344 @@ class TestHandleHost(testtools.TestCase):
         mock_have_quorum.assert_called_once_with()
         mock_get_node_state_tag_list.assert_called_once_with()
 
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(parse_cib_xml.ParseCibXml, 'set_cib_xml')
+    @mock.patch.object(handle_host.HandleHost, '_get_cib_xml')
+    def test_check_host_status_by_cibadmin_unchanged(
+        self, mock_get_cib_xml, mock_set_cib_xml,
+        mock_check_if_status_changed):
+
+        cib_xml = ('<cib admin_epoch="0" epoch="10" num_updates="5"'
+                   ' have-quorum="1">' + STATUS_TAG_XML + '</cib>')
+        mock_get_cib_xml.return_value = cib_xml
+
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'node1'
+        obj.cib_version = (0, 10, 5)
+        obj.cib_node_states = [
+            {'uname': 'node1', 'crmd': 'online'},
+            {'uname': 'node2', 'crmd': 'online'},
+            {'uname': 'node3', 'crmd': 'offline'}]
+        obj.unsettled_hosts = {'node3'}
+        ret = obj._check_host_status_by_cibadmin()
+
+        self.assertEqual(0, ret)
+        mock_set_cib_xml.assert_not_called()
+        mock_check_if_status_changed.assert_called_once_with(
+            [{'uname': 'node3', 'crmd': 'offline'}])
+        self.assertEqual(['online'],
+                         obj.monitoring_data.get_history('node2'))
+        self.assertNotIn('node1', obj.monitoring_data)
+
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(handle_host.HandleHost, '_get_cib_xml')
+    def test_check_host_status_by_cibadmin_changed(
+        self, mock_get_cib_xml, mock_check_if_status_changed):
+
+        cib_xml = ('<cib admin_epoch="0" epoch="10" num_updates="6"'
+                   ' have-quorum="1">' + STATUS_TAG_XML + '</cib>')
+        mock_get_cib_xml.return_value = cib_xml
+
+        obj = handle_host.HandleHost()
+        obj.cib_version = (0, 10, 5)
+        ret = obj._check_host_status_by_cibadmin()
+
+        self.assertEqual(0, ret)
+        self.assertEqual(1, mock_check_if_status_changed.call_count)
+        self.assertEqual((0, 10, 6), obj.cib_version)
+        self.assertEqual(5, len(obj.cib_node_states))
+        self.assertEqual({'uname': 'node4', 'crmd': 'offline'},
+                         obj.cib_node_states[3])
+
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(handle_host.HandleHost, '_get_cib_xml')
+    def test_check_host_status_by_cibadmin_minimal_scope(
+        self, mock_get_cib_xml, mock_check_if_status_changed):
+
+        CONF.set_override('cluster_query_scope', 'minimal', 'host')
+        self.addCleanup(CONF.clear_override, 'cluster_query_scope', 'host')
+        cib_xml = ('<cib admin_epoch="0" epoch="10" num_updates="6"'
+                   ' have-quorum="1"/>')
+        mock_get_cib_xml.side_effect = [cib_xml, STATUS_TAG_XML,
+                                        cib_xml]
+
+        obj = handle_host.HandleHost()
+        ret = obj._check_host_status_by_cibadmin()
+
+        self.assertEqual(0, ret)
+        mock_get_cib_xml.assert_has_calls(
+            [mock.call('--no-children'), mock.call('--scope', 'status')])
+        self.assertEqual(1, mock_check_if_status_changed.call_count)
+        self.assertEqual(5, len(obj.cib_node_states))
+        self.assertEqual((0, 10), obj.cib_config_version)
+
+        # The status section is not queried if the cib is unchanged.
+        ret = obj._check_host_status_by_cibadmin()
+
+        self.assertEqual(0, ret)
+        self.assertEqual(3, mock_get_cib_xml.call_count)
+        mock_get_cib_xml.assert_called_with('--no-children')
+
+    @mock.patch.object(parse_cib_xml.ParseCibXml, 'get_stonith_ipmi_params')
+    @mock.patch.object(parse_cib_xml.ParseCibXml, 'set_resources_xml')
+    @mock.patch.object(handle_host.HandleHost, '_get_cib_xml')
+    def test_get_stonith_ipmi_params_minimal_scope(
+        self, mock_get_cib_xml, mock_set_resources_xml,
+        mock_get_stonith_ipmi_params):
+
+        CONF.set_override('cluster_query_scope', 'minimal', 'host')
+        self.addCleanup(CONF.clear_override, 'cluster_query_scope', 'host')
+        mock_get_cib_xml.return_value = '<resources/>'
+        mock_get_stonith_ipmi_params.return_value = {'ipaddr': 'test'}
+
+        obj = handle_host.HandleHost()
+        obj.cib_config_version = (0, 10)
+        obj._get_stonith_ipmi_params('node2')
+        obj._get_stonith_ipmi_params('node3')
+
+        # The resources section is cached until the configuration changes.
+        mock_get_cib_xml.assert_called_once_with('--scope', 'resources')
+        mock_set_resources_xml.assert_called_once_with('<resources/>')
+
+        obj.cib_config_version = (0, 11)
+        ret = obj._get_stonith_ipmi_params('node2')
+
+        self.assertEqual({'ipaddr': 'test'}, ret)
+        self.assertEqual(2, mock_get_cib_xml.call_count)
+        self.assertEqual(3, mock_get_stonith_ipmi_params.call_count)
+
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(utils, 'execute')
+    def test_get_stonith_ipmi_params_crm_mon(
+        self, mock_execute, mock_check_if_status_changed):
+
+        CONF.set_override('cluster_query_scope', 'minimal', 'host')
+        self.addCleanup(CONF.clear_override, 'cluster_query_scope', 'host')
+        CONF.set_override('restrict_to_remotes', True, 'host')
+        self.addCleanup(CONF.clear_override, 'restrict_to_remotes', 'host')
+
+        def _execute(*cmd, **kwargs):
+            if cmd[0] == 'cibadmin':
+                return '<resources/>', ''
+            if 'times' in cmd[-1]:
+                return CRMMON_SINGLE_PASS_XML, ''
+            # crm_mon only has the last_change with the times section.
+            return re.sub(r'<last_change[^>]*/>', '',
+                          CRMMON_SINGLE_PASS_XML), ''
+        mock_execute.side_effect = _execute
+
+        obj = handle_host.HandleHost()
+        self.assertEqual(0, obj._check_host_status_by_crm_mon())
+        for i in range(3):
+            obj._get_stonith_ipmi_params('remote1')
+
+        # The last_change of crm_mon keeps the resources section cached.
+        self.assertIsNotNone(obj.cib_config_version)
+        cibadmin_calls = [c for c in mock_execute.call_args_list
+                          if c[0][0] == 'cibadmin']
+        self.assertEqual(
+            [mock.call('cibadmin', '--query', '--scope', 'resources',
+                       run_as_root=True)],
+            cibadmin_calls)
+
+    @mock.patch.object(handle_host.LOG, 'info')
+    def test_log_query_stats(self, mock_log_info):
+        CONF.set_override('log_cluster_query_stats', True, 'host')
+        self.addCleanup(CONF.clear_override, 'log_cluster_query_stats',
+                        'host')
+
+        obj = handle_host.HandleHost()
+        obj._record_query('x' * 100)
+        with obj._measure_parse():
+            pass
+        obj._log_query_stats()
+
+        self.assertEqual(1, mock_log_info.call_count)
+        stats = mock_log_info.call_args[0][1]
+        self.assertEqual(100, stats['bytes'])
+        self.assertEqual(1, stats['queries'])
+
+        obj._reset_query_stats()
+        self.assertEqual({'queries': 0, 'bytes': 0, 'parse_time': 0.0},
+                         obj.query_stats)
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(handle_host.HandleHost, '_make_event')
+    @mock.patch.object(socket, 'gethostname')
+    def test_check_if_status_changed_unsettled_hosts(
+        self, mock_gethostname, mock_make_event, mock_send_notification):
+        mock_gethostname.return_value = 'node1'
+        CONF.set_override('monitoring_samples', 2, 'host')
+        self.addCleanup(CONF.clear_override, 'monitoring_samples', 'host')
+
+        obj = handle_host.HandleHost()
+        online = {'uname': 'node2', 'crmd': 'online'}
+        offline = {'uname': 'node2', 'crmd': 'offline'}
+
+        obj._check_if_status_changed([online])
+        self.assertIn('node2', obj.unsettled_hosts)
+        obj._check_if_status_changed([online])
+        self.assertNotIn('node2', obj.unsettled_hosts)
+        obj._check_if_status_changed([offline])
+        self.assertIn('node2', obj.unsettled_hosts)
+        obj._check_if_status_changed([offline])
+        self.assertNotIn('node2', obj.unsettled_hosts)
+        mock_make_event.assert_called_once_with('node2', 'offline')
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(handle_host.HandleHost, '_make_event')
+    @mock.patch.object(socket, 'gethostname')
+    def test_check_if_status_changed_designated_notifier(
+        self, mock_gethostname, mock_make_event, mock_send_notification):
+        mock_gethostname.return_value = 'node1'
+        CONF.set_override('designated_notifier', True, 'host')
+        self.addCleanup(CONF.clear_override, 'designated_notifier', 'host')
+        CONF.set_override('disable_ipmi_check', True, 'host')
+        self.addCleanup(CONF.clear_override, 'disable_ipmi_check', 'host')
+
+        obj = handle_host.HandleHost()
+        obj.dc_name = 'node3'
+        online = {'uname': 'node2', 'crmd': 'online'}
+        offline = {'uname': 'node2', 'crmd': 'offline'}
+
+        obj._check_if_status_changed([online])
+        obj._check_if_status_changed([offline])
+        mock_make_event.assert_not_called()
+        self.assertEqual('online',
+                         obj.status_holder.get_host_status('node2'))
+
+        # The DC changed to this host, which notifies the pending change.
+        obj.dc_name = 'node1'
+        obj._check_if_status_changed([offline])
+        mock_make_event.assert_called_once_with('node2', 'offline')
+        mock_send_notification.assert_called_once()
+        self.assertEqual('offline',
+                         obj.status_holder.get_host_status('node2'))
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(handle_host.HandleHost, '_make_event')
+    @mock.patch.object(socket, 'gethostname')
+    def test_check_if_status_changed_storm_guard(
+        self, mock_gethostname, mock_make_event, mock_send_notification):
+        mock_gethostname.return_value = 'node1'
+        CONF.set_override('storm_guard_threshold', 0.5, 'host')
+        self.addCleanup(CONF.clear_override, 'storm_guard_threshold', 'host')
+        CONF.set_override('disable_ipmi_check', True, 'host')
+        self.addCleanup(CONF.clear_override, 'disable_ipmi_check', 'host')
+
+        obj = handle_host.HandleHost()
+        hostnames = ['node2', 'node3', 'node4', 'node5']
+        obj._check_if_status_changed(
+            [{'uname': hostname, 'crmd': 'online'} for hostname in hostnames])
+
+        # 3 of the 4 hosts went offline at once, the notifications are held.
+        went_offline = [{'uname': hostname, 'crmd': 'offline'}
+                        for hostname in hostnames[:3]]
+        obj._check_if_status_changed(
+            went_offline + [{'uname': 'node5', 'crmd': 'online'}])
+        mock_make_event.assert_not_called()
+        self.assertEqual(set(hostnames[:3]), obj.unsettled_hosts)
+        for hostname in hostnames[:3]:
+            self.assertEqual('online',
+                             obj.status_holder.get_host_status(hostname))
+
+        # Once 2 of them came back, the last one is notified.
+        obj._check_if_status_changed(
+            [{'uname': 'node2', 'crmd': 'offline'}] +
+            [{'uname': hostname, 'crmd': 'online'}
+             for hostname in hostnames[1:]])
+        mock_make_event.assert_called_once_with('node2', 'offline')
+        self.assertEqual('offline',
+                         obj.status_holder.get_host_status('node2'))
+
+    def test_xml_parser_backend_lxml(self):
+        CONF.set_override('xml_parser_backend', 'lxml', 'host')
+        self.addCleanup(CONF.clear_override, 'xml_parser_backend', 'host')
+
+        obj = handle_host.HandleHost()
+
+        self.assertIsInstance(obj.xml_parser,
+                              parse_cib_xml.StreamParseCibXml)
+        self.assertIsInstance(obj.crmmon_xml_parser,
+                              parse_crmmon_xml.StreamParseCrmMonXml)
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(handle_host.HandleHost, '_is_poweroff')
+    @mock.patch.object(hold_host_status.HostHoldStatus, 'get_host_status')
+    @mock.patch.object(socket, 'gethostname')
+    def test_check_if_status_changed_concurrent_ipmi_checks(
+        self, mock_gethostname, mock_get_host_status, mock_is_poweroff,
+        mock_send_notification):
+
+        def _is_poweroff(hostname):
+            eventlet.greenthread.sleep(0.2)
+            return True
+
+        mock_gethostname.return_value = 'node1'
+        mock_get_host_status.return_value = 'online'
+        mock_is_poweroff.side_effect = _is_poweroff
+        CONF.set_override('disable_ipmi_check', False, 'host')
+        self.addCleanup(CONF.clear_override, 'disable_ipmi_check', 'host')
+        CONF.set_override('monitoring_samples', 1, 'host')
+        self.addCleanup(CONF.clear_override, 'monitoring_samples', 'host')
+        node_state_tag_list = [{'uname': 'node%d' % i, 'crmd': 'offline'}
+                               for i in range(2, 6)]
+
+        obj = handle_host.HandleHost()
+        started = time.monotonic()
+        obj._check_if_status_changed(node_state_tag_list)
+
+        # The 4 checks run concurrently and all notifications are sent
+        # before returning.
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(4, mock_send_notification.call_count)
+        for call in mock_send_notification.call_args_list:
+            self.assertEqual(
+                ec.EventConstants.HOST_STATUS_NORMAL,
+                call[0][2]['notification']['payload']['host_status'])
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(handle_host.HandleHost, '_make_event')
+    @mock.patch.object(hold_host_status.HostHoldStatus, 'get_host_status')
+    @mock.patch.object(socket, 'gethostname')
+    def test_check_if_status_changed_ipmi_check_failure(
+        self, mock_gethostname, mock_get_host_status, mock_make_event,
+        mock_send_notification):
+        mock_gethostname.return_value = 'node1'
+        mock_get_host_status.return_value = 'online'
+        mock_make_event.side_effect = [Exception('test'),
+                                       {'notification': 'test'}]
+        CONF.set_override('disable_ipmi_check', False, 'host')
+        self.addCleanup(CONF.clear_override, 'disable_ipmi_check', 'host')
+        CONF.set_override('monitoring_samples', 1, 'host')
+        self.addCleanup(CONF.clear_override, 'monitoring_samples', 'host')
+        node_state_tag_list = [{'uname': 'node2', 'crmd': 'offline'},
+                               {'uname': 'node3', 'crmd': 'offline'}]
+
+        obj = handle_host.HandleHost()
+        obj._check_if_status_changed(node_state_tag_list)
+
+        # A failure for a host doesn't prevent the notification of others.
+        mock_send_notification.assert_called_once_with(
+            CONF.host.api_retry_max, CONF.host.api_retry_interval,
+            {'notification': 'test'})
+
+    @mock.patch.object(hold_host_status.HostHoldStatus, 'get_host_status')
+    @mock.patch.object(socket, 'gethostname')
+    def test_check_if_status_changed_invalidates_poweroff_cache(
+        self, mock_gethostname, mock_get_host_status):
+        mock_gethostname.return_value = 'node1'
+        mock_get_host_status.side_effect = ['online', 'offline']
+
+        obj = handle_host.HandleHost()
+        obj.poweroff_cache = {'node2': time.monotonic() + 60,
+                              'node3': time.monotonic() + 60}
+        obj._check_if_status_changed([{'uname': 'node2', 'crmd': 'online'},
+                                      {'uname': 'node3', 'crmd': 'offline'}])
+
+        self.assertNotIn('node2', obj.poweroff_cache)
+        self.assertIn('node3', obj.poweroff_cache)
+
     def test_stop(self):
 
         obj = handle_host.HandleHost()
@@ -894,6 +1431,17 @@ class TestHandleHost(testtools.TestCase):
 
         self.assertFalse(obj.running)
 
+    def test_stop_sniffer(self):
+
+        obj = handle_host.HandleHost()
+        mock_sniffer = mock.Mock()
+        obj.corosync_sniffer = mock_sniffer
+        obj.stop()
+
+        self.assertFalse(obj.running)
+        mock_sniffer.stop.assert_called_once_with()
+        self.assertIsNone(obj.corosync_sniffer)
+
     @mock.patch.object(eventlet.greenthread, 'sleep')
     @mock.patch.object(handle_host.HandleHost,
                        '_check_host_status_by_cibadmin')
@@ -949,3 +1497,265 @@ class TestHandleHost(testtools.TestCase):
         self.assertEqual(2, mock_check_pacemaker_services.call_count)
         mock_check_pacemaker_services.assert_called_with('pacemaker_remote')
         self.assertEqual(2, mock_check_host_status_by_crm_mon.call_count)
+
+    @mock.patch.object(handle_host.HandleHost, '_check_pacemaker_services')
+    def test_get_cached_pacemaker_services_status(
+        self, mock_check_pacemaker_services):
+        mock_check_pacemaker_services.side_effect = [True, True, False] * 2
+
+        obj = handle_host.HandleHost()
+
+        self.assertEqual((True, True, False),
+                         obj._get_cached_pacemaker_services_status())
+        self.assertEqual((True, True, False),
+                         obj._get_cached_pacemaker_services_status())
+        self.assertEqual(3, mock_check_pacemaker_services.call_count)
+
+        # The services are detected again once expired.
+        obj.services_status_expiry = 0
+        obj._get_cached_pacemaker_services_status()
+        self.assertEqual(6, mock_check_pacemaker_services.call_count)
+
+    def test_check_own_host_status_by_crm_mon(self):
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'member1'
+        obj.crmmon_xml_parser.set_crmmon_xml(CRMMON_SINGLE_PASS_XML)
+        node_state_tag_list = \
+            obj.crmmon_xml_parser.get_node_state_tag_list()
+
+        self.assertEqual(
+            0, obj._check_own_host_status_by_crm_mon(node_state_tag_list))
+
+        obj.my_hostname = 'remote1'
+        self.assertEqual(
+            1, obj._check_own_host_status_by_crm_mon(node_state_tag_list))
+
+        obj.my_hostname = 'unknown'
+        self.assertEqual(
+            1, obj._check_own_host_status_by_crm_mon(node_state_tag_list))
+
+    def test_check_own_host_status_by_crm_mon_pending(self):
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'member1'
+        obj.crmmon_xml_parser.set_crmmon_xml(
+            CRMMON_SINGLE_PASS_XML.replace(
+                'id="1002" online="true" pending="false"',
+                'id="1002" online="true" pending="true"'))
+
+        self.assertEqual(1, obj._check_own_host_status_by_crm_mon(
+            obj.crmmon_xml_parser.get_node_state_tag_list()))
+
+    def test_check_own_host_status_by_crm_mon_no_dc(self):
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'member1'
+        obj.crmmon_xml_parser.set_crmmon_xml(
+            CRMMON_SINGLE_PASS_XML.replace('present="true"',
+                                           'present="false"'))
+
+        self.assertEqual(1, obj._check_own_host_status_by_crm_mon(
+            obj.crmmon_xml_parser.get_node_state_tag_list()))
+
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    def test_check_host_status_by_crmmon_xml_all_nodes(
+        self, mock_check_if_status_changed):
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'member1'
+
+        ret = obj._check_host_status_by_crmmon_xml(
+            CRMMON_SINGLE_PASS_XML, check_own_host=True, remotes_only=False)
+
+        self.assertEqual(0, ret)
+        self.assertEqual(
+            ('Thu Oct 15 09:58:41 2026', 'root', 'cibadmin', 'member2'),
+            obj.cib_config_version)
+        mock_check_if_status_changed.assert_called_once_with(
+            [{'uname': 'member1', 'crmd': 'online'},
+             {'uname': 'member2', 'crmd': 'online'},
+             {'uname': 'remote1', 'crmd': 'offline'}])
+
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    def test_check_host_status_by_crmmon_xml_own_host_unstable(
+        self, mock_check_if_status_changed):
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'unknown'
+
+        ret = obj._check_host_status_by_crmmon_xml(
+            CRMMON_SINGLE_PASS_XML, check_own_host=True)
+
+        self.assertEqual(1, ret)
+        mock_check_if_status_changed.assert_not_called()
+
+    @mock.patch.object(utils, 'execute')
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(handle_host.HandleHost, '_get_crmmon_xml')
+    @mock.patch.object(handle_host.HandleHost, '_check_hb_line')
+    @mock.patch.object(handle_host.HandleHost, '_check_pacemaker_services')
+    def test_monitor_cycle_single_pass(
+        self, mock_check_pacemaker_services, mock_check_hb_line,
+        mock_get_crmmon_xml, mock_check_if_status_changed, mock_execute):
+        mock_check_pacemaker_services.side_effect = [True, True, False]
+        mock_check_hb_line.return_value = 0
+        mock_get_crmmon_xml.return_value = CRMMON_SINGLE_PASS_XML
+
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'member1'
+        obj._monitor_cycle_single_pass()
+        obj._monitor_cycle_single_pass()
+
+        # The services are detected once, and only crm_mon is queried.
+        self.assertEqual(3, mock_check_pacemaker_services.call_count)
+        mock_check_hb_line.assert_called_with((True, True, False))
+        self.assertEqual(2, mock_check_hb_line.call_count)
+        mock_get_crmmon_xml.assert_called_with()
+        self.assertEqual(2, mock_get_crmmon_xml.call_count)
+        mock_execute.assert_not_called()
+        self.assertEqual(2, mock_check_if_status_changed.call_count)
+        self.assertEqual(
+            ['cluster_query', 'hb_line', 'host_status', 'services'],
+            sorted(obj.probe_timings))
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(handle_host.HandleHost, '_get_crmmon_xml')
+    @mock.patch.object(handle_host.HandleHost, '_check_hb_line')
+    def test_monitor_cycle_single_pass_hb_line_failure(
+        self, mock_check_hb_line, mock_get_crmmon_xml,
+        mock_check_if_status_changed, mock_sleep):
+        CONF.set_override('pacemaker_node_type', 'cluster', 'host')
+        self.addCleanup(CONF.clear_override, 'pacemaker_node_type', 'host')
+        mock_check_hb_line.return_value = 1
+        mock_get_crmmon_xml.return_value = CRMMON_SINGLE_PASS_XML
+
+        obj = handle_host.HandleHost()
+        obj.my_hostname = 'member1'
+        obj._monitor_cycle_single_pass()
+
+        # The cluster state is queried again after the stonith wait.
+        mock_sleep.assert_called_with(CONF.host.stonith_wait)
+        self.assertEqual(2, mock_get_crmmon_xml.call_count)
+        mock_check_if_status_changed.assert_called_once_with(mock.ANY)
+
+    @mock.patch.object(handle_host.HandleHost, '_check_if_status_changed')
+    @mock.patch.object(handle_host.HandleHost, '_get_crmmon_xml')
+    @mock.patch.object(handle_host.HandleHost, '_check_hb_line')
+    @mock.patch.object(handle_host.HandleHost, '_check_pacemaker_services')
+    def test_monitor_cycle_single_pass_skip(
+        self, mock_check_pacemaker_services, mock_check_hb_line,
+        mock_get_crmmon_xml, mock_check_if_status_changed):
+        mock_check_pacemaker_services.side_effect = [False, False, False]
+        mock_check_hb_line.return_value = 2
+        mock_get_crmmon_xml.return_value = None
+
+        obj = handle_host.HandleHost()
+        obj._monitor_cycle_single_pass()
+
+        # The services are detected again in the next cycle.
+        self.assertIsNone(obj.services_status)
+        mock_check_if_status_changed.assert_not_called()
+
+    @mock.patch.object(handle_host.LOG, 'info')
+    def test_log_probe_timings(self, mock_log_info):
+        CONF.set_override('log_cluster_query_stats', True, 'host')
+        self.addCleanup(CONF.clear_override, 'log_cluster_query_stats',
+                        'host')
+
+        obj = handle_host.HandleHost()
+        obj.probe_timings = {'services': 0.001, 'cluster_query': 0.05,
+                             'hb_line': 1.2, 'host_status': 0.01}
+        obj._log_probe_timings(1.25)
+
+        stats = mock_log_info.call_args[0][1]
+        self.assertEqual(1.25, stats['cycle'])
+        self.assertEqual('services: 0.001, hb_line: 1.200, '
+                         'cluster_query: 0.050, host_status: 0.010',
+                         stats['probes'])
+        self.assertEqual('services -> hb_line -> host_status',
+                         stats['path'])
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(handle_host.HandleHost, '_monitor_cycle')
+    @mock.patch.object(handle_host.HandleHost, '_monitor_cycle_single_pass')
+    def test_monitor_hosts_single_pass(self, mock_monitor_cycle_single_pass,
+                                       mock_monitor_cycle, mock_sleep):
+        CONF.set_override('probe_mode', 'single_pass', 'host')
+        self.addCleanup(CONF.clear_override, 'probe_mode', 'host')
+        mock_monitor_cycle_single_pass.side_effect = \
+            [None, Exception("Test exception."), KeyboardInterrupt()]
+
+        obj = handle_host.HandleHost()
+        self.assertRaises(KeyboardInterrupt, obj.monitor_hosts)
+
+        self.assertEqual(3, mock_monitor_cycle_single_pass.call_count)
+        mock_monitor_cycle.assert_not_called()
+        self.assertEqual(2, mock_sleep.call_count)
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    def test_wait_next_cycle_poll(self, mock_sleep):
+        obj = handle_host.HandleHost()
+        obj._wait_next_cycle(True)
+
+        mock_sleep.assert_called_once_with(CONF.host.monitoring_interval)
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    def test_wait_next_cycle_event(self, mock_sleep):
+        obj = handle_host.HandleHost()
+        obj.cib_event_listener = mock.Mock()
+        obj.cib_event_listener.wait.return_value = [{'kind': 'node'}]
+
+        obj._wait_next_cycle(True)
+
+        obj.cib_event_listener.wait.assert_called_once_with(
+            CONF.host.cib_event_poll_interval)
+        mock_sleep.assert_not_called()
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    def test_wait_next_cycle_event_unsettled(self, mock_sleep):
+        obj = handle_host.HandleHost()
+        obj.cib_event_listener = mock.Mock()
+
+        # Hosts whose status is not stabilised are sampled every interval.
+        obj.unsettled_hosts.add('node2')
+        obj._wait_next_cycle(True)
+        # So is the cluster state after a failed check.
+        obj.unsettled_hosts.clear()
+        obj._wait_next_cycle(False)
+
+        obj.cib_event_listener.wait.assert_not_called()
+        self.assertEqual(2, mock_sleep.call_count)
+
+    @mock.patch.object(cib_events.CibEventListener, 'start')
+    def test_start_cib_event_listener_fail(self, mock_start):
+        mock_start.side_effect = PermissionError()
+
+        obj = handle_host.HandleHost()
+        obj._start_cib_event_listener()
+
+        self.assertIsNone(obj.cib_event_listener)
+
+    @mock.patch.object(handle_host.HandleHost, '_wait_next_cycle')
+    @mock.patch.object(handle_host.HandleHost, '_monitor_cycle')
+    @mock.patch.object(cib_events.CibEventListener, 'start')
+    def test_monitor_hosts_event_mode(self, mock_start, mock_monitor_cycle,
+                                      mock_wait_next_cycle):
+        CONF.set_override('monitoring_mode', 'event', 'host')
+        self.addCleanup(CONF.clear_override, 'monitoring_mode', 'host')
+        mock_monitor_cycle.side_effect = \
+            [True, Exception("Test exception."), KeyboardInterrupt()]
+
+        obj = handle_host.HandleHost()
+        self.assertRaises(KeyboardInterrupt, obj.monitor_hosts)
+
+        mock_start.assert_called_once_with()
+        self.assertIsInstance(obj.cib_event_listener,
+                              cib_events.CibEventListener)
+        mock_wait_next_cycle.assert_has_calls([mock.call(True),
+                                               mock.call(False)])
+
+    def test_stop_cib_event_listener(self):
+        obj = handle_host.HandleHost()
+        mock_listener = mock.Mock()
+        obj.cib_event_listener = mock_listener
+        obj.stop()
+
+        mock_listener.stop.assert_called_once_with()
+        self.assertIsNone(obj.cib_event_listener)
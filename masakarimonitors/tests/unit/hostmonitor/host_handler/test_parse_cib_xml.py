@@ -102,6 +102,13 @@ CIB_XML = '<cib have-quorum="1">' \
           '</cib>'
 CIB_TAG = ElementTree.fromstring(CIB_XML)
 
+DC_CIB_XML = '<cib have-quorum="1" dc-uuid="2">' \
+             '  <status>' \
+             '    <node_state id="1" uname="node1" crmd="online"/>' \
+             '    <node_state id="2" uname="node2" crmd="online"/>' \
+             '  </status>' \
+             '</cib>'
+
 
 class TestParseCibXml(testtools.TestCase):
 
@@ -122,6 +129,15 @@ class TestParseCibXml(testtools.TestCase):
         obj.set_cib_xml(CIB_XML)
         self.assertEqual(1, obj.have_quorum())
 
+    def test_get_dc_name(self):
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml(DC_CIB_XML)
+        self.assertEqual('node2', obj.get_dc_name())
+
+        obj.set_cib_xml(CIB_XML)
+        self.assertIsNone(obj.get_dc_name())
+
     def test_get_node_state_tag_list(self):
 
         obj = parse_cib_xml.ParseCibXml()
@@ -143,3 +159,254 @@ class TestParseCibXml(testtools.TestCase):
         self.assertEqual('admin', ipmi_values['userid'])
         self.assertEqual('password', ipmi_values['passwd'])
         self.assertEqual('lanplus', ipmi_values['interface'])
+
+    def test_get_cib_version(self):
+        cib_xml = ('<?xml version="1.0"?>'
+                   '<cib crm_feature_set="3.0.14" admin_epoch="0"'
+                   " epoch='103' num_updates=\"27\" have-quorum=\"1\">"
+                   '<configuration/><status/></cib>')
+
+        self.assertEqual((0, 103, 27),
+                         parse_cib_xml.get_cib_version(cib_xml))
+
+    def test_get_cib_version_without_version(self):
+
+        self.assertIsNone(parse_cib_xml.get_cib_version(CIB_XML))
+        self.assertIsNone(parse_cib_xml.get_cib_version('<status/>'))
+
+    def test_set_cib_xml_with_status_xml(self):
+        cib_xml = '<cib have-quorum="1" admin_epoch="0" epoch="1"/>'
+        status_xml = ('<status>'
+                      '  <node_state uname="node1" crmd="online"/>'
+                      '  <node_state uname="node2" crmd="offline"/>'
+                      '</status>')
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml(cib_xml, status_xml=status_xml)
+
+        self.assertEqual(1, obj.have_quorum())
+        node_state_tag_list = obj.get_node_state_tag_list()
+        self.assertEqual(['node1', 'node2'],
+                         [tag.get('uname') for tag in node_state_tag_list])
+
+    def test_get_stonith_ipmi_params_from_resources_xml(self):
+        resources_tag = CIB_TAG.find('configuration/resources')
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml('<cib have-quorum="1"><status/></cib>')
+        obj.set_resources_xml(ElementTree.tostring(resources_tag))
+
+        ipmi_values = obj.get_stonith_ipmi_params('masakari-node')
+
+        self.assertEqual('192.168.10.20', ipmi_values['ipaddr'])
+
+    def test_get_stonith_ipmi_params_without_configuration(self):
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml('<cib have-quorum="1"><status/></cib>')
+
+        self.assertIsNone(obj.get_stonith_ipmi_params('masakari-node'))
+
+    def test_get_stonith_ipmi_params_not_found(self):
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml(CIB_XML)
+
+        self.assertIsNone(obj.get_stonith_ipmi_params('unknown-node'))
+
+    def test_get_stonith_ipmi_params_ungrouped_fence_ipmilan(self):
+        cib_xml = ('<cib have-quorum="1" admin_epoch="0" epoch="1">'
+                   '  <configuration>'
+                   '    <resources>'
+                   '      <primitive id="fence1" class="stonith"'
+                   '                 type="fence_ipmilan">'
+                   '        <instance_attributes id="fence1-ia">'
+                   '          <nvpair name="pcmk_host_list"'
+                   '                  value="node1,node2"/>'
+                   '          <nvpair name="ip" value="192.168.10.30"/>'
+                   '          <nvpair name="username" value="admin"/>'
+                   '          <nvpair name="password" value="password"/>'
+                   '          <nvpair name="lanplus" value="1"/>'
+                   '        </instance_attributes>'
+                   '      </primitive>'
+                   '      <primitive id="fence2" class="stonith"'
+                   '                 type="fence_ipmilan">'
+                   '        <instance_attributes id="fence2-ia">'
+                   '          <nvpair name="pcmk_host_list" value="node2"/>'
+                   '          <nvpair name="ipaddr" value="192.168.10.31"/>'
+                   '          <nvpair name="login" value="root"/>'
+                   '          <nvpair name="passwd" value="secret"/>'
+                   '        </instance_attributes>'
+                   '      </primitive>'
+                   '      <primitive id="ipmi3" class="stonith"'
+                   '                 type="external/ipmi">'
+                   '        <instance_attributes id="ipmi3-ia">'
+                   '          <nvpair name="hostname" value="node3"/>'
+                   '          <nvpair name="ipaddr" value="192.168.10.32"/>'
+                   '          <nvpair name="userid" value="admin"/>'
+                   '          <nvpair name="passwd" value="password"/>'
+                   '          <nvpair name="interface" value="lan"/>'
+                   '        </instance_attributes>'
+                   '      </primitive>'
+                   '    </resources>'
+                   '  </configuration>'
+                   '</cib>')
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml(cib_xml)
+
+        expected = {'ipaddr': '192.168.10.30', 'userid': 'admin',
+                    'passwd': 'password', 'interface': 'lanplus'}
+        self.assertEqual(expected, obj.get_stonith_ipmi_params('node1'))
+        # The first RA of a host wins.
+        self.assertEqual(expected, obj.get_stonith_ipmi_params('node2'))
+        self.assertEqual({'ipaddr': '192.168.10.32', 'userid': 'admin',
+                          'passwd': 'password', 'interface': 'lan'},
+                         obj.get_stonith_ipmi_params('node3'))
+
+    @mock.patch.object(parse_cib_xml.ParseCibXml, '_build_ipmi_params_index')
+    def test_get_stonith_ipmi_params_index_per_config_version(
+            self, mock_build_ipmi_params_index):
+        mock_build_ipmi_params_index.return_value = {
+            'node1': {'ipaddr': '192.168.10.30'}}
+        cib_xml = '<cib admin_epoch="0" epoch="%d" num_updates="%d">' \
+                  '  <configuration><resources/></configuration>' \
+                  '</cib>'
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml(cib_xml % (1, 1))
+        obj.get_stonith_ipmi_params('node1')
+        obj.get_stonith_ipmi_params('node2')
+        # Only the status changed.
+        obj.set_cib_xml(cib_xml % (1, 2))
+        ret = obj.get_stonith_ipmi_params('node1')
+
+        self.assertEqual({'ipaddr': '192.168.10.30'}, ret)
+        self.assertEqual(1, mock_build_ipmi_params_index.call_count)
+
+        # The configuration changed.
+        obj.set_cib_xml(cib_xml % (2, 0))
+        obj.get_stonith_ipmi_params('node1')
+
+        self.assertEqual(2, mock_build_ipmi_params_index.call_count)
+
+    @mock.patch.object(parse_cib_xml.ParseCibXml, '_build_ipmi_params_index')
+    def test_get_stonith_ipmi_params_index_reset_by_resources_xml(
+            self, mock_build_ipmi_params_index):
+        mock_build_ipmi_params_index.return_value = {}
+
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_cib_xml('<cib admin_epoch="0" epoch="1"/>')
+        obj.set_resources_xml('<resources/>')
+        obj.get_stonith_ipmi_params('node1')
+        obj.set_resources_xml('<resources/>')
+        obj.get_stonith_ipmi_params('node1')
+
+        self.assertEqual(2, mock_build_ipmi_params_index.call_count)
+
+    @mock.patch.object(parse_cib_xml.ParseCibXml, '_build_ipmi_params_index')
+    def test_get_stonith_ipmi_params_index_without_config_version(
+            self, mock_build_ipmi_params_index):
+        mock_build_ipmi_params_index.return_value = {}
+
+        # Only the resources section is set with the crm_mon queries.
+        obj = parse_cib_xml.ParseCibXml()
+        obj.set_resources_xml('<resources/>')
+        for i in range(3):
+            obj.get_stonith_ipmi_params('node1')
+
+        self.assertEqual(1, mock_build_ipmi_params_index.call_count)
+
+        obj.set_resources_xml('<resources/>')
+        obj.get_stonith_ipmi_params('node1')
+
+        self.assertEqual(2, mock_build_ipmi_params_index.call_count)
+
+
+class TestStreamParseCibXml(testtools.TestCase):
+
+    def setUp(self):
+        super(TestStreamParseCibXml, self).setUp()
+
+    def test_have_quorum(self):
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_cib_xml(CIB_XML)
+        self.assertEqual(1, obj.have_quorum())
+
+    def test_get_dc_name(self):
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_cib_xml(DC_CIB_XML)
+        self.assertEqual('node2', obj.get_dc_name())
+
+        obj.set_cib_xml(CIB_XML)
+        self.assertIsNone(obj.get_dc_name())
+
+    def test_get_node_state_tag_list(self):
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_cib_xml(CIB_XML)
+
+        node_state_tag_list = obj.get_node_state_tag_list()
+
+        self.assertEqual([{'uname': 'masakari-node', 'crmd': 'online'},
+                          {'uname': 'compute-node', 'crmd': 'online'}],
+                         node_state_tag_list)
+
+    def test_get_node_state_tag_list_same_as_etree(self):
+        etree_obj = parse_cib_xml.ParseCibXml()
+        etree_obj.set_cib_xml(CIB_XML)
+        stream_obj = parse_cib_xml.StreamParseCibXml()
+        stream_obj.set_cib_xml(CIB_XML)
+
+        self.assertEqual(
+            [dict(tag.attrib)
+             for tag in etree_obj.get_node_state_tag_list()],
+            stream_obj.get_node_state_tag_list())
+
+    def test_get_node_state_tag_list_without_status(self):
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_cib_xml('<cib have-quorum="1"/>')
+
+        self.assertEqual([], obj.get_node_state_tag_list())
+
+    def test_get_node_state_tag_list_unset(self):
+        obj = parse_cib_xml.StreamParseCibXml()
+        self.assertEqual([], obj.get_node_state_tag_list())
+
+    def test_set_cib_xml_with_status_xml(self):
+        status_xml = ('<status>'
+                      '  <node_state uname="node1" crmd="offline"/>'
+                      '</status>')
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_cib_xml('<cib have-quorum="0"/>', status_xml=status_xml)
+
+        self.assertEqual(0, obj.have_quorum())
+        self.assertEqual([{'uname': 'node1', 'crmd': 'offline'}],
+                         obj.get_node_state_tag_list())
+
+    def test_get_stonith_ipmi_params(self):
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_cib_xml(CIB_XML)
+
+        ipmi_values = obj.get_stonith_ipmi_params('compute-node')
+
+        self.assertEqual('192.168.10.21', ipmi_values['ipaddr'])
+        self.assertEqual('admin', ipmi_values['userid'])
+        self.assertEqual('password', ipmi_values['passwd'])
+        self.assertEqual('lanplus', ipmi_values['interface'])
+
+    def test_get_stonith_ipmi_params_from_resources_xml(self):
+        resources_tag = CIB_TAG.find('configuration/resources')
+
+        obj = parse_cib_xml.StreamParseCibXml()
+        obj.set_resources_xml(ElementTree.tostring(resources_tag))
+        obj.set_cib_xml('<cib have-quorum="1"><status/></cib>')
+
+        ipmi_values = obj.get_stonith_ipmi_params('masakari-node')
+
+        self.assertEqual('192.168.10.20', ipmi_values['ipaddr'])
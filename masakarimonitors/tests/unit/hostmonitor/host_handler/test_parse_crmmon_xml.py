@@ -40,6 +40,46 @@ CRMMON_XML_NO_QUORUM = \
     '    </summary>' \
     '</crm_mon>'
 
+PACEMAKER_RESULT_XML = \
+    '<?xml version="1.0"?>' \
+    '<pacemaker-result api-version="2.2" request="crm_mon' \
+    ' --output-as=xml --exclude=all --include=dc,nodes">' \
+    '    <summary>' \
+    '        <current_dc present="true" with_quorum="true" />' \
+    '    </summary>' \
+    '    <nodes>' \
+    '        <node name="remote-1" id="remote-1" online="true"' \
+    '              type="remote" />' \
+    '    </nodes>' \
+    '    <status code="0" message="OK"/>' \
+    '</pacemaker-result>'
+
+PACEMAKER_RESULT_DC_XML = \
+    '<?xml version="1.0"?>' \
+    '<pacemaker-result api-version="2.2" request="crm_mon' \
+    ' --output-as=xml --exclude=all --include=dc,nodes">' \
+    '    <summary>' \
+    '        <current_dc present="true" version="2.1.2" name="node-1"' \
+    '                    id="1" with_quorum="true" />' \
+    '    </summary>' \
+    '    <nodes>' \
+    '    </nodes>' \
+    '</pacemaker-result>'
+
+PACEMAKER_RESULT_TIMES_XML = \
+    '<?xml version="1.0"?>' \
+    '<pacemaker-result api-version="2.2" request="crm_mon' \
+    ' --output-as=xml --exclude=all --include=dc,nodes,times">' \
+    '    <summary>' \
+    '        <current_dc present="false" with_quorum="true" />' \
+    '        <last_update time="Thu Oct 15 10:00:05 2026" />' \
+    '        <last_change time="Thu Oct 15 09:58:41 2026" user="root"' \
+    '                     client="cibadmin" origin="node-1" />' \
+    '    </summary>' \
+    '    <nodes>' \
+    '    </nodes>' \
+    '</pacemaker-result>'
+
 CRMMON_NONODES_XML = '<?xml version="1.0"?>' \
                      '<crm_mon version="1.1.18">' \
                      '    <nodes>' \
@@ -70,6 +110,32 @@ class TestParseCrmMonXml(testtools.TestCase):
         obj.set_crmmon_xml(CRMMON_XML_NO_QUORUM)
         self.assertEqual(False, obj.has_quorum())
 
+    def test_has_dc(self):
+        obj = parse_crmmon_xml.ParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_XML)
+        self.assertTrue(obj.has_dc())
+
+        obj.set_crmmon_xml(PACEMAKER_RESULT_TIMES_XML)
+        self.assertFalse(obj.has_dc())
+
+    def test_get_last_change(self):
+        obj = parse_crmmon_xml.ParseCrmMonXml()
+        obj.set_crmmon_xml(PACEMAKER_RESULT_TIMES_XML)
+        self.assertEqual(
+            ('Thu Oct 15 09:58:41 2026', 'root', 'cibadmin', 'node-1'),
+            obj.get_last_change())
+
+        obj.set_crmmon_xml(CRMMON_XML)
+        self.assertIsNone(obj.get_last_change())
+
+    def test_get_dc_name(self):
+        obj = parse_crmmon_xml.ParseCrmMonXml()
+        obj.set_crmmon_xml(PACEMAKER_RESULT_DC_XML)
+        self.assertEqual('node-1', obj.get_dc_name())
+
+        obj.set_crmmon_xml(PACEMAKER_RESULT_TIMES_XML)
+        self.assertIsNone(obj.get_dc_name())
+
     def test_get_node_state_tag_list(self):
         obj = parse_crmmon_xml.ParseCrmMonXml()
         obj.set_crmmon_xml(CRMMON_XML)
@@ -99,3 +165,87 @@ class TestParseCrmMonXml(testtools.TestCase):
         obj = parse_crmmon_xml.ParseCrmMonXml()
         obj.set_crmmon_xml(CRMMON_NONODES_TAG_XML)
         self.assertEqual(obj.get_node_state_tag_list(), [])
+
+
+class TestStreamParseCrmMonXml(testtools.TestCase):
+
+    def setUp(self):
+        super(TestStreamParseCrmMonXml, self).setUp()
+
+    def test_has_quorum(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_XML)
+        self.assertEqual(True, obj.has_quorum())
+
+    def test_has_quorum_no_quorum(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_XML_NO_QUORUM)
+        self.assertEqual(False, obj.has_quorum())
+
+    def test_has_dc(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_XML)
+        self.assertTrue(obj.has_dc())
+
+        obj.set_crmmon_xml(PACEMAKER_RESULT_TIMES_XML)
+        self.assertFalse(obj.has_dc())
+
+    def test_get_last_change(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(PACEMAKER_RESULT_TIMES_XML)
+        self.assertEqual(
+            ('Thu Oct 15 09:58:41 2026', 'root', 'cibadmin', 'node-1'),
+            obj.get_last_change())
+
+        obj.set_crmmon_xml(CRMMON_XML)
+        self.assertIsNone(obj.get_last_change())
+
+    def test_get_dc_name(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(PACEMAKER_RESULT_DC_XML)
+        self.assertEqual('node-1', obj.get_dc_name())
+
+        obj.set_crmmon_xml(PACEMAKER_RESULT_TIMES_XML)
+        self.assertIsNone(obj.get_dc_name())
+
+    def test_get_node_state_tag_list(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_XML)
+
+        node_state_tag_list = obj.get_node_state_tag_list()
+
+        self.assertEqual(
+            [{'name': 'node-1', 'id': '1001', 'online': 'true'},
+             {'name': 'node-2', 'id': '1002', 'online': 'false'},
+             {'name': 'node-3', 'id': '1003', 'online': 'true'}],
+            node_state_tag_list)
+
+    def test_get_node_state_tag_list_unset(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        self.assertEqual(obj.get_node_state_tag_list(), [])
+
+    def test_get_node_state_tag_list_nonodes(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_NONODES_XML)
+        self.assertEqual(obj.get_node_state_tag_list(), [])
+
+    def test_get_node_state_tag_list_nonodes_tag(self):
+        obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        obj.set_crmmon_xml(CRMMON_NONODES_TAG_XML)
+        self.assertEqual(obj.get_node_state_tag_list(), [])
+
+    def test_get_node_state_tag_list_pacemaker_result(self):
+        etree_obj = parse_crmmon_xml.ParseCrmMonXml()
+        etree_obj.set_crmmon_xml(PACEMAKER_RESULT_XML)
+        stream_obj = parse_crmmon_xml.StreamParseCrmMonXml()
+        stream_obj.set_crmmon_xml(PACEMAKER_RESULT_XML)
+
+        self.assertTrue(stream_obj.has_quorum())
+        self.assertEqual(
+            [{'name': 'remote-1', 'id': 'remote-1', 'online': 'true',
+              'type': 'remote'}],
+            stream_obj.get_node_state_tag_list())
+        self.assertEqual(
+            [dict(tag.attrib)
+             for tag in etree_obj.get_node_state_tag_list()],
+            stream_obj.get_node_state_tag_list())
@@ -0,0 +1,276 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import server
+import json
+import multiprocessing
+import testtools
+from unittest import mock
+
+import requests
+
+import masakarimonitors.conf
+from masakarimonitors.hostmonitor.host_handler import power_check
+from masakarimonitors import utils
+
+CONF = masakarimonitors.conf.CONF
+
+IPMI_VALUES = {
+    'userid': 'admin',
+    'passwd': 'password',
+    'interface': 'lanplus',
+    'ipaddr': '0.0.0.0'
+}
+
+
+def _initial_bmc_state():
+    return {
+        'session_service': True,
+        'power_state': 'Off',
+        'token': None,
+        'logins': 0,
+        'requests': [],
+        'connections': [],
+    }
+
+
+class FakeBMCHandler(server.BaseHTTPRequestHandler):
+    """Stand-in of the Redfish API of a BMC.
+
+    The /_state path gets and updates the state of the BMC.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])))
+
+    def _authorized(self):
+        bmc = self.server.bmc
+        if bmc['session_service']:
+            return self.headers.get('X-Auth-Token') == bmc['token']
+        return self.headers.get('Authorization') is not None
+
+    def do_PUT(self):
+        # Update the state of the BMC.
+        if self.path == '/_state':
+            self.server.bmc.update(self._read_body())
+            self._reply(204)
+        else:
+            self._reply(405)
+
+    def do_POST(self):
+        bmc = self.server.bmc
+        bmc['requests'].append(('POST', self.path))
+        body = self._read_body()
+        if not bmc['session_service']:
+            self._reply(404)
+        elif body == {'UserName': 'admin', 'Password': 'password'}:
+            bmc['logins'] += 1
+            bmc['token'] = 'token%d' % bmc['logins']
+            self._reply(201, {}, {
+                'X-Auth-Token': bmc['token'],
+                'Location': '/redfish/v1/SessionService/Sessions/1'})
+        else:
+            self._reply(401)
+
+    def do_GET(self):
+        bmc = self.server.bmc
+        if self.path == '/_state':
+            self._reply(200, bmc)
+            return
+
+        bmc['requests'].append(('GET', self.path))
+        if list(self.client_address) not in bmc['connections']:
+            bmc['connections'].append(list(self.client_address))
+        if not self._authorized():
+            self._reply(401)
+        elif self.path == '/redfish/v1/Systems':
+            self._reply(200, {'Members': [
+                {'@odata.id': '/redfish/v1/Systems/1'}]})
+        elif self.path == '/redfish/v1/Systems/1':
+            self._reply(200, {'PowerState': bmc['power_state']})
+        else:
+            self._reply(404)
+
+    def do_DELETE(self):
+        bmc = self.server.bmc
+        bmc['requests'].append(('DELETE', self.path))
+        self._reply(204)
+
+
+def _serve_fake_bmc(port_queue):
+    httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), FakeBMCHandler)
+    httpd.daemon_threads = True
+    httpd.bmc = _initial_bmc_state()
+    port_queue.put(httpd.server_port)
+    httpd.serve_forever()
+
+
+class TestIpmitoolPowerCheck(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIpmitoolPowerCheck, self).setUp()
+
+    @mock.patch.object(utils, 'execute')
+    def test_get_power_state(self, mock_execute):
+        mock_execute.return_value = ('Chassis Power is off', '')
+
+        obj = power_check.IpmitoolPowerCheck()
+        ret = obj.get_power_state(IPMI_VALUES)
+
+        self.assertEqual(power_check.POWER_OFF, ret)
+        mock_execute.assert_called_once_with(
+            'timeout', str(CONF.host.ipmi_timeout), 'ipmitool',
+            '-U', 'admin', '-P', 'password', '-I', 'lanplus',
+            '-H', '0.0.0.0', 'power', 'status', run_as_root=False)
+
+    @mock.patch.object(utils, 'execute')
+    def test_get_power_state_on(self, mock_execute):
+        mock_execute.return_value = ('Chassis Power is on', '')
+
+        obj = power_check.IpmitoolPowerCheck()
+
+        self.assertEqual(power_check.POWER_ON,
+                         obj.get_power_state(IPMI_VALUES))
+
+    @mock.patch.object(utils, 'execute')
+    def test_get_power_state_stderr(self, mock_execute):
+        mock_execute.return_value = ('', 'test_stderr')
+
+        obj = power_check.IpmitoolPowerCheck()
+
+        self.assertRaises(power_check.PowerCheckError, obj.get_power_state,
+                          IPMI_VALUES)
+
+
+class TestRedfishPowerCheck(testtools.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestRedfishPowerCheck, cls).setUpClass()
+        # The stand-in BMC runs in a fresh interpreter, so that it works
+        # whether or not eventlet monkey patched this process.
+        context = multiprocessing.get_context('spawn')
+        port_queue = context.Queue()
+        cls.bmc_process = context.Process(target=_serve_fake_bmc,
+                                          args=(port_queue,), daemon=True)
+        cls.bmc_process.start()
+        cls.bmc_url = 'http://127.0.0.1:%d' % port_queue.get(timeout=30)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bmc_process.terminate()
+        cls.bmc_process.join()
+        super(TestRedfishPowerCheck, cls).tearDownClass()
+
+    def setUp(self):
+        super(TestRedfishPowerCheck, self).setUp()
+        self._update_bmc(**_initial_bmc_state())
+
+        self.ipmi_values = dict(IPMI_VALUES, ipaddr=self.bmc_url)
+        self.obj = power_check.RedfishPowerCheck()
+        self.addCleanup(self.obj.close)
+
+    def _update_bmc(self, **state):
+        requests.put(self.bmc_url + '/_state', json=state,
+                     timeout=10).raise_for_status()
+
+    def _get_bmc(self):
+        resp = requests.get(self.bmc_url + '/_state', timeout=10)
+        resp.raise_for_status()
+        bmc = resp.json()
+        bmc['requests'] = [tuple(request) for request in bmc['requests']]
+        return bmc
+
+    def test_get_power_state(self):
+        ret = self.obj.get_power_state(self.ipmi_values)
+
+        self.assertEqual(power_check.POWER_OFF, ret)
+        self.assertEqual(
+            [('POST', '/redfish/v1/SessionService/Sessions'),
+             ('GET', '/redfish/v1/Systems'),
+             ('GET', '/redfish/v1/Systems/1')],
+            self._get_bmc()['requests'])
+
+    def test_get_power_state_reuses_session(self):
+        self.obj.get_power_state(self.ipmi_values)
+        self._update_bmc(power_state='On')
+        ret = self.obj.get_power_state(self.ipmi_values)
+
+        self.assertEqual(power_check.POWER_ON, ret)
+        # The token, the system and the connection are reused.
+        bmc = self._get_bmc()
+        self.assertEqual(1, bmc['logins'])
+        self.assertEqual(('GET', '/redfish/v1/Systems/1'),
+                         bmc['requests'][-1])
+        self.assertEqual(4, len(bmc['requests']))
+        self.assertEqual(1, len(bmc['connections']))
+
+    def test_get_power_state_token_expired(self):
+        self.obj.get_power_state(self.ipmi_values)
+        self._update_bmc(token='expired')
+        ret = self.obj.get_power_state(self.ipmi_values)
+
+        self.assertEqual(power_check.POWER_OFF, ret)
+        self.assertEqual(2, self._get_bmc()['logins'])
+
+    def test_get_power_state_basic_auth(self):
+        self._update_bmc(session_service=False)
+
+        ret = self.obj.get_power_state(self.ipmi_values)
+
+        self.assertEqual(power_check.POWER_OFF, ret)
+        self.assertEqual(0, self._get_bmc()['logins'])
+
+    def test_get_power_state_login_failure(self):
+        ipmi_values = dict(self.ipmi_values, passwd='wrong')
+
+        self.assertRaises(power_check.PowerCheckError,
+                          self.obj.get_power_state, ipmi_values)
+
+    def test_get_power_state_unknown(self):
+        self._update_bmc(power_state=None)
+
+        self.assertRaises(power_check.PowerCheckError,
+                          self.obj.get_power_state, self.ipmi_values)
+
+    def test_close(self):
+        self.obj.get_power_state(self.ipmi_values)
+        self.obj.close()
+
+        self.assertEqual(('DELETE', '/redfish/v1/SessionService/Sessions/1'),
+                         self._get_bmc()['requests'][-1])
+        self.assertEqual({}, self.obj.bmcs)
+
+
+class TestGetPowerCheck(testtools.TestCase):
+
+    def test_get_power_check(self):
+        self.assertIsInstance(power_check.get_power_check('ipmitool'),
+                              power_check.IpmitoolPowerCheck)
+        self.assertIsInstance(power_check.get_power_check('redfish'),
+                              power_check.RedfishPowerCheck)
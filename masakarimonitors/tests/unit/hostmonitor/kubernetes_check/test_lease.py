@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import time
+from unittest import mock
+
+from kubernetes.client.rest import ApiException
+from kubernetes.client import V1Lease
+from kubernetes.client import V1LeaseSpec
+from kubernetes.client import V1ObjectMeta
+import testtools
+
+from masakarimonitors.hostmonitor.kubernetes_check import lease
+
+RENEW_TIME = datetime.datetime(2026, 10, 1, tzinfo=datetime.timezone.utc)
+
+
+def _make_lease(holder, renew_time=RENEW_TIME):
+    return V1Lease(
+        metadata=V1ObjectMeta(name='masakari-hostmonitor',
+                              namespace='default', resource_version='1'),
+        spec=V1LeaseSpec(holder_identity=holder, lease_duration_seconds=60,
+                         renew_time=renew_time, lease_transitions=1))
+
+
+@mock.patch.object(time, 'monotonic')
+class TestLeaseLock(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLeaseLock, self).setUp()
+        self.api = mock.Mock()
+        self.lock = lease.LeaseLock(self.api, 'masakari-hostmonitor',
+                                    'default', 'node01', 60)
+
+    def test_acquire_create(self, mock_monotonic):
+        self.api.read_namespaced_lease.side_effect = ApiException(status=404)
+
+        self.assertTrue(self.lock.acquire())
+
+        body = self.api.create_namespaced_lease.call_args[0][1]
+        self.assertEqual('node01', body.spec.holder_identity)
+        self.assertEqual(60, body.spec.lease_duration_seconds)
+
+    def test_acquire_create_conflict(self, mock_monotonic):
+        self.api.read_namespaced_lease.side_effect = ApiException(status=404)
+        self.api.create_namespaced_lease.side_effect = \
+            ApiException(status=409)
+
+        self.assertFalse(self.lock.acquire())
+
+    def test_acquire_renew(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.api.read_namespaced_lease.return_value = _make_lease('node01')
+
+        self.assertTrue(self.lock.acquire())
+
+        body = self.api.replace_namespaced_lease.call_args[0][2]
+        self.assertEqual('node01', body.spec.holder_identity)
+        self.assertEqual(1, body.spec.lease_transitions)
+        self.assertNotEqual(RENEW_TIME, body.spec.renew_time)
+
+    def test_acquire_held_by_other(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.api.read_namespaced_lease.return_value = _make_lease('node02')
+        self.assertFalse(self.lock.acquire())
+
+        # The Lease wasn't renewed for its duration on the local clock.
+        mock_monotonic.return_value = 161
+        self.assertTrue(self.lock.acquire())
+
+        body = self.api.replace_namespaced_lease.call_args[0][2]
+        self.assertEqual('node01', body.spec.holder_identity)
+        self.assertEqual(2, body.spec.lease_transitions)
+
+    def test_acquire_held_by_other_renewed(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.api.read_namespaced_lease.return_value = _make_lease('node02')
+        self.assertFalse(self.lock.acquire())
+
+        mock_monotonic.return_value = 161
+        self.api.read_namespaced_lease.return_value = _make_lease(
+            'node02', RENEW_TIME + datetime.timedelta(seconds=60))
+        self.assertFalse(self.lock.acquire())
+        self.api.replace_namespaced_lease.assert_not_called()
+
+    def test_acquire_replace_conflict(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.api.read_namespaced_lease.return_value = _make_lease(None)
+        self.api.replace_namespaced_lease.side_effect = \
+            ApiException(status=409)
+
+        self.assertFalse(self.lock.acquire())
+
+    def test_acquire_error(self, mock_monotonic):
+        self.api.read_namespaced_lease.side_effect = ApiException(status=403)
+
+        self.assertRaises(ApiException, self.lock.acquire)
+
+    def test_release(self, mock_monotonic):
+        self.api.read_namespaced_lease.return_value = _make_lease('node01')
+
+        self.lock.release()
+
+        body = self.api.replace_namespaced_lease.call_args[0][2]
+        self.assertIsNone(body.spec.holder_identity)
+
+    def test_release_held_by_other(self, mock_monotonic):
+        self.api.read_namespaced_lease.return_value = _make_lease('node02')
+
+        self.lock.release()
+
+        self.api.replace_namespaced_lease.assert_not_called()
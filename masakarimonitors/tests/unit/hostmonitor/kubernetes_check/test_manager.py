@@ -11,7 +11,6 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from collections import deque
 from unittest import mock
 
 from kubernetes import client
@@ -22,17 +21,28 @@ from kubernetes.client import V1NodeStatus
 from kubernetes.client import V1ObjectMeta
 from kubernetes import config
 
+import eventlet
 from oslo_config import fixture as fixture_config
 
 import testtools
 
 import masakarimonitors.conf
 from masakarimonitors.ha import masakari
+from masakarimonitors.hostmonitor import health_history
 from masakarimonitors.hostmonitor.kubernetes_check import manager
 
 CONF = masakarimonitors.conf.CONF
 
 
+def _make_history(samples, histories):
+    # The Ready condition statuses are given from the oldest to the latest.
+    history = health_history.HealthHistory(samples)
+    for host, statuses in histories.items():
+        for status in statuses:
+            history.append(host, status == 'True')
+    return history
+
+
 class TestKubernetesCheck(testtools.TestCase):
 
     @mock.patch.object(config, 'load_incluster_config')
@@ -44,7 +54,7 @@ class TestKubernetesCheck(testtools.TestCase):
             'openstack-compute-node=enabled'
         self.host_monitor = manager.KubernetesCheck()
         self.host_monitor.monitoring_samples = 1
-        self.host_monitor.monitoring_data = {}
+        self.host_monitor.monitoring_data = health_history.HealthHistory(1)
         self.last_status = {}
 
     def test_update_monitoring_data(self):
@@ -72,15 +82,14 @@ class TestKubernetesCheck(testtools.TestCase):
                                return_value=mock_list_node):
             self.host_monitor.update_monitoring_data()
             excepted_monitoring_data = {
-                "node01": deque(['True'],
-                                maxlen=self.host_monitor.monitoring_samples),
-                "node02": deque(['True'],
-                                maxlen=self.host_monitor.monitoring_samples),
-                "node03": deque(['True'],
-                                maxlen=self.host_monitor.monitoring_samples)
+                "node01": [True],
+                "node02": [True],
+                "node03": [True],
             }
-        self.assertEqual(excepted_monitoring_data,
-                         self.host_monitor.monitoring_data)
+        self.assertEqual(3, len(self.host_monitor.monitoring_data))
+        for host, history in excepted_monitoring_data.items():
+            self.assertEqual(
+                history, self.host_monitor.monitoring_data.get_history(host))
 
     def test_update_monitoring_data_exclude_node(self):
 
@@ -105,6 +114,7 @@ class TestKubernetesCheck(testtools.TestCase):
             ]
         )
 
+        self.host_monitor.monitoring_data = health_history.HealthHistory(2)
         with mock.patch.object(self.host_monitor.kube_client, 'list_node',
                                return_value=mock_list_node):
             self.host_monitor.update_monitoring_data()
@@ -113,26 +123,24 @@ class TestKubernetesCheck(testtools.TestCase):
 
             self.host_monitor.update_monitoring_data()
             excepted_monitoring_data = {
-                "node01": deque(['True', 'True'],
-                                maxlen=self.host_monitor.monitoring_samples),
-                "node02": deque(['True', 'True'],
-                                maxlen=self.host_monitor.monitoring_samples)
+                "node01": [True, True],
+                "node02": [True, True],
             }
 
         self.assertEqual(2, len(self.host_monitor.monitoring_data))
-        self.assertEqual(excepted_monitoring_data,
-                         self.host_monitor.monitoring_data)
+        self.assertNotIn("node03", self.host_monitor.monitoring_data)
+        for host, history in excepted_monitoring_data.items():
+            self.assertEqual(
+                history, self.host_monitor.monitoring_data.get_history(host))
 
     @mock.patch.object(masakari.SendNotification, 'send_notification')
     def test_poll_hosts_with_healthy_nodes(self, mock_send_notification):
-        self.host_monitor.monitoring_data = {
-            "node01": deque(['True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node02": deque(['True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node03": deque(['True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-        }
+        self.host_monitor.monitoring_data = _make_history(
+            self.host_monitor.monitoring_samples, {
+                "node01": ['True'],
+                "node02": ['True'],
+                "node03": ['True'],
+            })
 
         self.host_monitor.poll_hosts()
         mock_send_notification.assert_not_called()
@@ -141,14 +149,12 @@ class TestKubernetesCheck(testtools.TestCase):
     def test_poll_hosts_with_healthy_nodes_3samples(
             self, mock_send_notification):
         self.host_monitor.monitoring_samples = 3
-        self.host_monitor.monitoring_data = {
-            "node01": deque(['True', 'True', 'True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node02": deque(['Unknown', 'True', 'True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node03": deque(['True', 'Unknown', 'Unknown'],
-                            maxlen=self.host_monitor.monitoring_samples),
-        }
+        self.host_monitor.monitoring_data = _make_history(
+            self.host_monitor.monitoring_samples, {
+                "node01": ['True', 'True', 'True'],
+                "node02": ['Unknown', 'True', 'True'],
+                "node03": ['True', 'Unknown', 'Unknown'],
+            })
 
         self.host_monitor.poll_hosts()
         mock_send_notification.assert_not_called()
@@ -163,14 +169,12 @@ class TestKubernetesCheck(testtools.TestCase):
             "node03": True
         }
         self.host_monitor.monitoring_samples = 3
-        self.host_monitor.monitoring_data = {
-            "node01": deque(['True', 'True', 'True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node02": deque(['Unknown', 'Unknown', 'Unknown'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node03": deque(['Unknown', 'True', 'Unknown'],
-                            maxlen=self.host_monitor.monitoring_samples),
-        }
+        self.host_monitor.monitoring_data = _make_history(
+            self.host_monitor.monitoring_samples, {
+                "node01": ['True', 'True', 'True'],
+                "node02": ['Unknown', 'Unknown', 'Unknown'],
+                "node03": ['Unknown', 'True', 'Unknown'],
+            })
 
         test_event = {'notification': 'test'}
         mock_event.return_value = test_event
@@ -183,14 +187,91 @@ class TestKubernetesCheck(testtools.TestCase):
     def test_poll_hosts_with_having_less_healthy_history_than_samples(
             self, mock_send_notification):
         self.host_monitor.monitoring_samples = 3
-        self.host_monitor.monitoring_data = {
-            "node01": deque(['True', 'True'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node02": deque(['True', 'Unknown'],
-                            maxlen=self.host_monitor.monitoring_samples),
-            "node03": deque(['Unknown', 'Unknown'],
-                            maxlen=self.host_monitor.monitoring_samples),
+        self.host_monitor.monitoring_data = _make_history(
+            self.host_monitor.monitoring_samples, {
+                "node01": ['True', 'True'],
+                "node02": ['True', 'Unknown'],
+                "node03": ['Unknown', 'Unknown'],
+            })
+
+        self.host_monitor.poll_hosts()
+        mock_send_notification.assert_not_called()
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    @mock.patch.object(manager.KubernetesCheck, '_event')
+    def test_poll_hosts_designated_notifier(self, mock_event,
+                                            mock_send_notification):
+        self.CONF.set_override('designated_notifier', True, group='host')
+        self.host_monitor.notifier_lease = mock.Mock()
+        self.host_monitor.notifier_lease.acquire.return_value = False
+        self.host_monitor.last_status = {"node01": True}
+        self.host_monitor.monitoring_data = _make_history(1, {
+            "node01": ['Unknown'],
+        })
+        test_event = {'notification': 'test'}
+        mock_event.return_value = test_event
+
+        self.host_monitor.poll_hosts()
+        mock_send_notification.assert_not_called()
+        self.assertTrue(self.host_monitor.last_status["node01"])
+
+        # This hostmonitor takes over and notifies the pending change.
+        self.host_monitor.notifier_lease.acquire.return_value = True
+        self.host_monitor.poll_hosts()
+        mock_send_notification.assert_called_once_with(
+            CONF.host.api_retry_max, CONF.host.api_retry_interval, test_event)
+        self.assertFalse(self.host_monitor.last_status["node01"])
+
+    @mock.patch.object(masakari.SendNotification, 'send_notification')
+    def test_poll_hosts_storm_guard_suppress(self, mock_send_notification):
+        self.CONF.set_override('storm_guard_threshold', 0.5, group='host')
+        self.CONF.set_override('storm_guard_action', 'suppress',
+                               group='host')
+        self.host_monitor.last_status = {
+            "node01": True,
+            "node02": True,
+            "node03": True
         }
+        self.host_monitor.monitoring_data = _make_history(1, {
+            "node01": ['Unknown'],
+            "node02": ['Unknown'],
+            "node03": ['True'],
+        })
 
         self.host_monitor.poll_hosts()
+
         mock_send_notification.assert_not_called()
+        # The changes are recorded and never notified.
+        self.assertFalse(self.host_monitor.last_status["node01"])
+        self.assertFalse(self.host_monitor.last_status["node02"])
+
+    def test_is_designated_notifier_lease_failure(self):
+        self.CONF.set_override('designated_notifier', True, group='host')
+        self.host_monitor.notifier_lease = mock.Mock()
+        self.host_monitor.notifier_lease.acquire.side_effect = \
+            Exception('error')
+
+        self.assertFalse(self.host_monitor._is_designated_notifier())
+
+    def test_stop_releases_lease(self):
+        notifier_lease = mock.Mock()
+        self.host_monitor.notifier_lease = notifier_lease
+
+        self.host_monitor.stop()
+
+        notifier_lease.release.assert_called_once_with()
+        self.assertIsNone(self.host_monitor.notifier_lease)
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(manager.KubernetesCheck, 'poll_hosts')
+    @mock.patch.object(manager.KubernetesCheck, 'update_monitoring_data')
+    def test_monitor_hosts(self, mock_update_monitoring_data,
+                           mock_poll_hosts, mock_sleep):
+        mock_update_monitoring_data.side_effect = \
+            [None, Exception("Test exception."), KeyboardInterrupt()]
+
+        self.assertRaises(KeyboardInterrupt, self.host_monitor.monitor_hosts)
+
+        self.assertEqual(1, mock_poll_hosts.call_count)
+        self.assertEqual(2, self.host_monitor.scheduler.cycles)
+        self.assertEqual(2, mock_sleep.call_count)
@@ -0,0 +1,139 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import testtools
+
+from masakarimonitors.hostmonitor import health_history
+
+
+class TestHealthHistory(testtools.TestCase):
+
+    def setUp(self):
+        super(TestHealthHistory, self).setUp()
+
+    def test_append(self):
+        obj = health_history.HealthHistory(3)
+
+        obj.append('node01', 'online')
+        obj.append('node01', 'offline')
+
+        self.assertEqual(['online', 'offline'], obj.get_history('node01'))
+        self.assertEqual('offline', obj.get_latest('node01'))
+        self.assertIn('node01', obj)
+        self.assertEqual(1, len(obj))
+
+    def test_append_ring_wrap(self):
+        obj = health_history.HealthHistory(3)
+
+        for value in ('a', 'b', 'c', 'd', 'e'):
+            obj.append('node01', value)
+
+        self.assertEqual(['c', 'd', 'e'], obj.get_history('node01'))
+        self.assertEqual('e', obj.get_latest('node01'))
+
+    def test_append_list(self):
+        obj = health_history.HealthHistory(2)
+
+        obj.append('node01', ['up', 'down'])
+        obj.append('node01', ['up', 'down'])
+
+        self.assertEqual([('up', 'down'), ('up', 'down')],
+                         obj.get_history('node01'))
+        self.assertEqual(('up', 'down'), obj.get_stabilised('node01'))
+
+    def test_get_history_unknown_host(self):
+        obj = health_history.HealthHistory(3)
+
+        self.assertEqual([], obj.get_history('node01'))
+        self.assertIsNone(obj.get_latest('node01'))
+
+    def test_get_stabilised(self):
+        obj = health_history.HealthHistory(3)
+
+        self.assertEqual(health_history.COLLECTING,
+                         obj.get_stabilised('node01'))
+        obj.append('node01', 'online')
+        obj.append('node01', 'online')
+        self.assertEqual(health_history.COLLECTING,
+                         obj.get_stabilised('node01'))
+        obj.append('node01', 'online')
+        self.assertEqual('online', obj.get_stabilised('node01'))
+
+        obj.append('node01', 'offline')
+        self.assertEqual(health_history.UNCERTAIN,
+                         obj.get_stabilised('node01'))
+        obj.append('node01', 'offline')
+        obj.append('node01', 'offline')
+        self.assertEqual('offline', obj.get_stabilised('node01'))
+
+    def test_get_stabilised_falsy_values(self):
+        obj = health_history.HealthHistory(2)
+
+        obj.append('node01', False)
+        obj.append('node01', False)
+
+        self.assertIs(False, obj.get_stabilised('node01'))
+
+    def test_stabilised_all(self):
+        obj = health_history.HealthHistory(2)
+        for host, values in (('node01', [True, True]),
+                             ('node02', [True, False]),
+                             ('node03', [False])):
+            for value in values:
+                obj.append(host, value)
+
+        self.assertEqual({'node01': True,
+                          'node02': health_history.UNCERTAIN,
+                          'node03': health_history.COLLECTING},
+                         obj.stabilised_all())
+
+    def test_remove(self):
+        obj = health_history.HealthHistory(2)
+        obj.append('node01', 'online')
+        obj.append('node01', 'online')
+
+        obj.remove('node01')
+        obj.remove('node01')
+
+        self.assertNotIn('node01', obj)
+        self.assertEqual(0, len(obj))
+        self.assertEqual(health_history.COLLECTING,
+                         obj.get_stabilised('node01'))
+
+        # The row is reused without the samples of the removed host.
+        obj.append('node02', 'offline')
+        self.assertEqual(['offline'], obj.get_history('node02'))
+        self.assertEqual(health_history.COLLECTING,
+                         obj.get_stabilised('node02'))
+
+    def test_iter_while_removing(self):
+        obj = health_history.HealthHistory(1)
+        obj.append('node01', 'online')
+        obj.append('node02', 'online')
+
+        for hostname in obj:
+            obj.remove(hostname)
+
+        self.assertEqual(0, len(obj))
+
+    def test_grow(self):
+        obj = health_history.HealthHistory(2)
+        hosts = ['node%03d' % i for i in range(100)]
+
+        for i, host in enumerate(hosts):
+            obj.append(host, i % 3)
+            obj.append(host, i % 3)
+
+        self.assertEqual(100, len(obj))
+        for i, host in enumerate(hosts):
+            self.assertEqual([i % 3, i % 3], obj.get_history(host))
+            self.assertEqual(i % 3, obj.get_stabilised(host))
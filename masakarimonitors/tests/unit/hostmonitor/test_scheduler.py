@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import testtools
+import time
+from unittest import mock
+
+import eventlet
+
+import masakarimonitors.conf
+from masakarimonitors.hostmonitor import scheduler
+
+CONF = masakarimonitors.conf.CONF
+
+
+@mock.patch.object(time, 'monotonic')
+class TestFixedRateScheduler(testtools.TestCase):
+
+    def setUp(self):
+        super(TestFixedRateScheduler, self).setUp()
+
+    def _run_cycle(self, obj, mock_monotonic, started, finished):
+        mock_monotonic.return_value = started
+        obj.start_cycle()
+        mock_monotonic.return_value = finished
+        obj.finish_cycle()
+
+    def test_fixed_rate(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+
+        self._run_cycle(obj, mock_monotonic, 100, 103)
+        self.assertEqual(160, obj.next_tick)
+        self.assertEqual(57, obj.time_to_next_tick())
+
+        # The work time and a late wake up don't shift the ticks.
+        self._run_cycle(obj, mock_monotonic, 161, 170)
+        self.assertEqual(220, obj.next_tick)
+        self.assertEqual(0, obj.overruns)
+        self.assertEqual(2, obj.cycles)
+
+    def test_overrun(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+
+        self._run_cycle(obj, mock_monotonic, 100, 230)
+
+        self.assertEqual(1, obj.overruns)
+        self.assertEqual(2, obj.skipped_ticks)
+        self.assertEqual(280, obj.next_tick)
+        self.assertEqual(50, obj.time_to_next_tick())
+
+    def test_cycle_before_tick(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+        self._run_cycle(obj, mock_monotonic, 100, 101)
+
+        # e.g. a cycle run on an event starts a new schedule.
+        self._run_cycle(obj, mock_monotonic, 130, 131)
+
+        self.assertEqual(190, obj.next_tick)
+
+    def test_finish_cycle_not_started(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+        obj.finish_cycle()
+
+        self.assertEqual(0, obj.cycles)
+        self.assertEqual(60, obj.time_to_next_tick())
+
+    def test_get_stats(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+        for i in range(1, 101):
+            self._run_cycle(obj, mock_monotonic, i * 60, i * 60 + i / 10.0)
+
+        stats = obj.get_stats()
+
+        self.assertEqual(100, stats['cycles'])
+        self.assertEqual(0, stats['overruns'])
+        self.assertEqual(0, stats['skipped_ticks'])
+        self.assertAlmostEqual(5.0, stats['p50'])
+        self.assertAlmostEqual(9.0, stats['p90'])
+        self.assertAlmostEqual(9.9, stats['p99'])
+
+    def test_get_stats_no_cycle(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+
+        self.assertEqual({'cycles': 0, 'overruns': 0, 'skipped_ticks': 0,
+                          'p50': 0.0, 'p90': 0.0, 'p99': 0.0},
+                         obj.get_stats())
+
+    @mock.patch.object(scheduler.LOG, 'info')
+    def test_log_stats(self, mock_log_info, mock_monotonic):
+        CONF.set_override('cycle_stats_interval', 3600, 'host')
+        self.addCleanup(CONF.clear_override, 'cycle_stats_interval', 'host')
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+
+        self._run_cycle(obj, mock_monotonic, 60, 61)
+        mock_log_info.assert_not_called()
+        self._run_cycle(obj, mock_monotonic, 3600, 3601)
+        self.assertEqual(1, mock_log_info.call_count)
+        self.assertEqual(2, mock_log_info.call_args[0][1]['cycles'])
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    def test_wait(self, mock_sleep, mock_monotonic):
+        mock_monotonic.return_value = 0
+        obj = scheduler.FixedRateScheduler('test', 60)
+        self._run_cycle(obj, mock_monotonic, 100, 230)
+
+        obj.wait()
+        mock_monotonic.return_value = 300
+        obj.wait()
+
+        mock_sleep.assert_has_calls([mock.call(50), mock.call(0)])
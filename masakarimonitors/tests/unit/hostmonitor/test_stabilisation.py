@@ -0,0 +1,119 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import testtools
+
+import masakarimonitors.conf
+from masakarimonitors.hostmonitor import health_history
+from masakarimonitors.hostmonitor import stabilisation
+
+CONF = masakarimonitors.conf.CONF
+
+
+class TestPhiAccrualPolicy(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPhiAccrualPolicy, self).setUp()
+
+    def _make_history(self, samples, statuses, interval=60):
+        policy = stabilisation.PhiAccrualPolicy(8.0, 100)
+        history = health_history.HealthHistory(samples, policy=policy)
+        now = 0
+        for status in statuses:
+            now += interval
+            history.append('node01', status, now=now)
+        return history, now
+
+    def test_quiet_host_declared_after_two_samples(self):
+        history, now = self._make_history(5, ['online'] * 10)
+        self.assertEqual('online', history.get_stabilised('node01'))
+
+        # One differing sample is not enough evidence.
+        history.append('node01', 'offline', now=now + 60)
+        self.assertEqual(health_history.UNCERTAIN,
+                         history.get_stabilised('node01'))
+
+        history.append('node01', 'offline', now=now + 120)
+        self.assertEqual('offline', history.get_stabilised('node01'))
+
+    def test_noisy_host_needs_more_evidence(self):
+        history, now = self._make_history(
+            5, ['online'] * 5 + ['offline', 'online'] * 5)
+        self.assertEqual('online', history.get_stabilised('node01'))
+
+        history.append('node01', 'offline', now=now + 60)
+        history.append('node01', 'offline', now=now + 120)
+        self.assertEqual(health_history.UNCERTAIN,
+                         history.get_stabilised('node01'))
+
+    def test_consecutive_rule_still_applies(self):
+        history, now = self._make_history(
+            3, ['online'] * 3 + ['offline', 'online'] * 5)
+
+        for i in range(1, 4):
+            history.append('node01', 'offline', now=now + 60 * i)
+
+        self.assertEqual('offline', history.get_stabilised('node01'))
+
+    def test_collecting_until_consecutive_rule(self):
+        history, now = self._make_history(3, ['online', 'online'])
+
+        self.assertEqual(health_history.COLLECTING,
+                         history.get_stabilised('node01'))
+
+    def test_not_trusted_before_min_intervals(self):
+        history, now = self._make_history(5, ['online'] * 6)
+
+        history.append('node01', 'offline', now=now + 60)
+        history.append('node01', 'offline', now=now + 120)
+
+        self.assertEqual(health_history.UNCERTAIN,
+                         history.get_stabilised('node01'))
+
+    def test_sample_back_to_stabilised_status(self):
+        history, now = self._make_history(3, ['online'] * 5)
+
+        history.append('node01', 'offline', now=now + 60)
+        history.append('node01', 'online', now=now + 120)
+
+        self.assertEqual('online', history.get_stabilised('node01'))
+
+    def test_remove(self):
+        history, now = self._make_history(2, ['online'] * 5)
+
+        history.remove('node01')
+
+        self.assertNotIn('node01', history.policy.hosts)
+
+    def test_phi(self):
+        policy = stabilisation.PhiAccrualPolicy(8.0, 100)
+
+        self.assertAlmostEqual(0.30103, policy.phi([60, 60, 60], 60), 4)
+        self.assertEqual(float('inf'), policy.phi([60, 60, 60], 600))
+        self.assertGreater(policy.phi([60, 60, 60], 120),
+                           policy.phi([60, 120, 180], 120))
+
+    def test_get_policy(self):
+        self.assertIsNone(stabilisation.get_policy())
+
+        CONF.set_override('stabilisation_policy', 'phi_accrual',
+                          group='host')
+        self.addCleanup(CONF.clear_override, 'stabilisation_policy',
+                        group='host')
+        CONF.set_override('phi_threshold', 5.0, group='host')
+        self.addCleanup(CONF.clear_override, 'phi_threshold', group='host')
+
+        policy = stabilisation.get_policy()
+
+        self.assertIsInstance(policy, stabilisation.PhiAccrualPolicy)
+        self.assertEqual(5.0, policy.threshold)
+        self.assertEqual(100, policy.window)
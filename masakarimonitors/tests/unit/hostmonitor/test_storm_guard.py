@@ -0,0 +1,97 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import testtools
+from unittest import mock
+
+import masakarimonitors.conf
+from masakarimonitors.hostmonitor import storm_guard
+
+CONF = masakarimonitors.conf.CONF
+
+
+class TestStormGuard(testtools.TestCase):
+
+    def setUp(self):
+        super(TestStormGuard, self).setUp()
+        CONF.set_override('storm_guard_threshold', 0.25, group='host')
+        self.addCleanup(CONF.clear_override, 'storm_guard_threshold',
+                        group='host')
+        CONF.set_override('storm_guard_window', 300, group='host')
+        self.addCleanup(CONF.clear_override, 'storm_guard_window',
+                        group='host')
+
+    def test_filter_disabled(self):
+        CONF.set_override('storm_guard_threshold', 0.0, group='host')
+
+        obj = storm_guard.StormGuard('test')
+
+        self.assertEqual(['node1', 'node2'],
+                         obj.filter(['node1', 'node2'], 2, now=0))
+        self.assertEqual({}, obj.notified)
+
+    def test_filter_below_threshold(self):
+        obj = storm_guard.StormGuard('test')
+
+        self.assertEqual(['node1', 'node2'],
+                         obj.filter(['node1', 'node2'], 10, now=0))
+        self.assertEqual({'node1': 0, 'node2': 0}, obj.notified)
+        self.assertFalse(obj.storm)
+
+    @mock.patch.object(storm_guard, 'LOG')
+    def test_filter_storm(self, mock_log):
+        obj = storm_guard.StormGuard('test')
+        self.assertEqual(['node1', 'node2'],
+                         obj.filter(['node1', 'node2'], 10, now=0))
+
+        # The hosts notified within the window count as failing.
+        self.assertEqual([], obj.filter(['node3'], 10, now=100))
+        self.assertTrue(obj.storm)
+        mock_log.error.assert_called_once()
+
+        # The storm lasts while the failing hosts are above the threshold,
+        # with a single error logged.
+        self.assertEqual([], obj.filter(['node3', 'node4'], 10, now=200))
+        mock_log.error.assert_called_once()
+
+        # The notified hosts left the window.
+        self.assertEqual(['node3', 'node4'],
+                         obj.filter(['node3', 'node4'], 10, now=400))
+        self.assertFalse(obj.storm)
+
+    def test_filter_min_hosts(self):
+        CONF.set_override('storm_guard_min_hosts', 3, group='host')
+        self.addCleanup(CONF.clear_override, 'storm_guard_min_hosts',
+                        group='host')
+
+        obj = storm_guard.StormGuard('test')
+
+        self.assertEqual(['node1', 'node2'],
+                         obj.filter(['node1', 'node2'], 4, now=0))
+        self.assertEqual([], obj.filter(['node3'], 4, now=0))
+
+    def test_filter_storm_ends_without_hosts(self):
+        obj = storm_guard.StormGuard('test')
+        self.assertEqual([], obj.filter(['node1', 'node2'], 4, now=0))
+        self.assertTrue(obj.storm)
+
+        self.assertEqual([], obj.filter([], 4, now=60))
+        self.assertFalse(obj.storm)
+
+    def test_hold(self):
+        obj = storm_guard.StormGuard('test')
+        self.assertTrue(obj.hold)
+
+        CONF.set_override('storm_guard_action', 'suppress', group='host')
+        self.addCleanup(CONF.clear_override, 'storm_guard_action',
+                        group='host')
+        self.assertFalse(obj.hold)
@@ -0,0 +1,77 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import testtools
+from unittest import mock
+import uuid
+
+from masakarimonitors.instancemonitor.libvirt_handler import callback_pool
+
+
+class TestCallbackPool(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCallbackPool, self).setUp()
+        self.pool = callback_pool.CallbackPool(4, 10)
+
+    def test_submit(self):
+        func = mock.Mock()
+        domain_uuid = uuid.uuid4()
+
+        self.assertTrue(self.pool.submit(domain_uuid, func, 'a', 'b'))
+        self.pool.join()
+
+        func.assert_called_once_with('a', 'b')
+        stats = self.pool.get_stats()
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual(1, stats['processed'])
+        self.assertEqual(4, len(self.pool.threads))
+
+    def test_submit_in_order_per_domain(self):
+        calls = []
+        domain_uuids = [uuid.uuid4() for i in range(8)]
+
+        for i in range(5):
+            for domain_uuid in domain_uuids:
+                self.pool.submit(domain_uuid,
+                                 lambda d, i: calls.append((d, i)),
+                                 domain_uuid, i)
+        self.pool.join()
+
+        self.assertEqual(40, len(calls))
+        for domain_uuid in domain_uuids:
+            self.assertEqual(list(range(5)),
+                             [i for d, i in calls if d == domain_uuid])
+
+    def test_submit_queue_full(self):
+        pool = callback_pool.CallbackPool(1, 2)
+        func = mock.Mock()
+
+        with mock.patch.object(pool, '_start'):
+            for i in range(3):
+                pool.submit(uuid.uuid4(), func)
+
+        stats = pool.get_stats()
+        self.assertEqual(2, stats['depth'])
+        self.assertEqual(1, stats['dropped'])
+
+    @mock.patch.object(callback_pool, 'LOG')
+    def test_callback_error(self, mock_log):
+        func = mock.Mock(side_effect=Exception('error'))
+
+        self.pool.submit(uuid.uuid4(), func)
+        self.pool.submit(uuid.uuid4(), func)
+        self.pool.join()
+
+        # The workers survive the errors of the callbacks.
+        self.assertEqual(2, mock_log.exception.call_count)
+        self.assertEqual(2, self.pool.get_stats()['processed'])
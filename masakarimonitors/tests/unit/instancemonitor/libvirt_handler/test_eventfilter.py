@@ -12,16 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import socket
+import tempfile
 import testtools
 import threading
 from unittest import mock
 import uuid
 
 import eventlet
+import libvirt
 from oslo_utils import excutils
 from oslo_utils import timeutils
 
+import masakarimonitors.conf
 from masakarimonitors.instancemonitor.libvirt_handler import callback
 from masakarimonitors.instancemonitor.libvirt_handler import eventfilter
 from masakarimonitors.instancemonitor.libvirt_handler \
@@ -30,6 +34,8 @@ from masakarimonitors.objects import event_constants as ec
 
 eventlet.monkey_patch(os=False)
 
+CONF = masakarimonitors.conf.CONF
+
 
 class TestEventFilter(testtools.TestCase):
 
@@ -53,6 +59,7 @@ class TestEventFilter(testtools.TestCase):
         detail = 5
         uuID = uuid.uuid4()
         obj.vir_event_filter(eventID, eventType, detail, uuID)
+        obj.pool.join()
 
         mock_libvirt_event_callback.assert_called_once_with(
             evft.eventID_dic[eventID],
@@ -156,3 +163,107 @@ class TestEventFilter(testtools.TestCase):
             detail, uuID)
 
         mock_libvirt_event_callback.assert_not_called()
+
+    @mock.patch.object(callback.Callback, 'libvirt_event_callback')
+    def test_vir_event_filter_queue_full(self, mock_libvirt_event_callback):
+        CONF.set_override('workers', 1, group='callback')
+        self.addCleanup(CONF.clear_override, 'workers', group='callback')
+        CONF.set_override('queue_size', 1, group='callback')
+        self.addCleanup(CONF.clear_override, 'queue_size', group='callback')
+
+        obj = eventfilter.EventFilter()
+        with mock.patch.object(obj.pool, '_start'):
+            obj.vir_event_filter(0, 5, 5, uuid.uuid4())
+            obj.vir_event_filter(0, 5, 5, uuid.uuid4())
+
+        self.assertEqual(1, obj.pool.get_stats()['depth'])
+        self.assertEqual(1, obj.pool.get_stats()['dropped'])
+        mock_libvirt_event_callback.assert_not_called()
+
+    def _write_filter_file(self, content):
+        fd, path = tempfile.mkstemp(suffix='.yaml')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        CONF.set_override('event_filter_file', path, group='libvirt')
+        self.addCleanup(CONF.clear_override, 'event_filter_file',
+                        group='libvirt')
+        return path
+
+    def test_default_filter(self):
+        obj = eventfilter.EventFilter()
+
+        self.assertEqual(set(evft.event_filter_dic), obj.event_ids)
+        for (eventID, eventType, detail), names in obj.filter.items():
+            self.assertIn(detail, evft.event_filter_dic[eventID][eventType])
+            self.assertEqual(
+                (evft.eventID_dic[eventID],
+                 evft.detail_dic[eventID][eventType][detail]), names)
+
+    def test_filter_file(self):
+        self._write_filter_file(
+            "LIFECYCLE:\n"
+            "    STOPPED: [FAILED]\n"
+            "WATCHDOG: [RESET]\n"
+            "CONTROL_ERROR:\n")
+
+        obj = eventfilter.EventFilter()
+
+        self.assertEqual({
+            (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+             libvirt.VIR_DOMAIN_EVENT_STOPPED,
+             libvirt.VIR_DOMAIN_EVENT_STOPPED_FAILED):
+            ('LIFECYCLE', 'STOPPED_FAILED'),
+            (libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG,
+             libvirt.VIR_DOMAIN_EVENT_WATCHDOG_RESET, evft.DUMMY):
+            ('WATCHDOG', 'WATCHDOG_RESET'),
+            (libvirt.VIR_DOMAIN_EVENT_ID_CONTROL_ERROR, evft.DUMMY,
+             evft.DUMMY):
+            ('CONTROL_ERROR', 'UNKNOWN')}, obj.filter)
+        self.assertEqual(set([libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                              libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG,
+                              libvirt.VIR_DOMAIN_EVENT_ID_CONTROL_ERROR]),
+                         obj.event_ids)
+
+    @mock.patch.object(callback.Callback, 'libvirt_event_callback')
+    def test_vir_event_filter_filter_file(self, mock_libvirt_event_callback):
+        self._write_filter_file("LIFECYCLE:\n    STOPPED: [FAILED]\n")
+
+        obj = eventfilter.EventFilter()
+        uuID = uuid.uuid4()
+        obj.vir_event_filter(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                             libvirt.VIR_DOMAIN_EVENT_STOPPED,
+                             libvirt.VIR_DOMAIN_EVENT_STOPPED_DESTROYED,
+                             uuID)
+        obj.vir_event_filter(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                             libvirt.VIR_DOMAIN_EVENT_STOPPED,
+                             libvirt.VIR_DOMAIN_EVENT_STOPPED_FAILED,
+                             uuID)
+        obj.pool.join()
+
+        mock_libvirt_event_callback.assert_called_once_with(
+            'LIFECYCLE', 'STOPPED_FAILED', uuID, ec.EventConstants.TYPE_VM,
+            socket.gethostname(), mock.ANY)
+
+    @mock.patch.object(eventfilter, 'LOG')
+    def test_filter_file_not_found(self, mock_log):
+        CONF.set_override('event_filter_file', '/nonexistent.yaml',
+                          group='libvirt')
+        self.addCleanup(CONF.clear_override, 'event_filter_file',
+                        group='libvirt')
+
+        obj = eventfilter.EventFilter()
+
+        self.assertEqual(evft.compile_filter(), obj.filter)
+        mock_log.exception.assert_called_once()
+
+    @mock.patch.object(eventfilter, 'LOG')
+    def test_filter_file_unknown_event(self, mock_log):
+        path = self._write_filter_file("LIFECYCLE:\n    STOPPED: [FOO]\n")
+
+        with mock.patch.object(evft, 'libvirt', spec=[]):
+            self.assertRaises(ValueError, evft.load_filter_file, path)
+            obj = eventfilter.EventFilter()
+
+        self.assertEqual(evft.compile_filter(), obj.filter)
+        mock_log.exception.assert_called_once()
@@ -0,0 +1,74 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import libvirt
+import testtools
+from unittest import mock
+import uuid
+
+import eventlet
+
+from masakarimonitors.common import libvirt_event_bus
+from masakarimonitors.instancemonitor import combined
+from masakarimonitors.instancemonitor.libvirt_handler import eventfilter
+from masakarimonitors.introspectiveinstancemonitor import qemu_utils
+
+eventlet.monkey_patch(os=False)
+
+
+class TestCombinedInstanceMonitorManager(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCombinedInstanceMonitorManager, self).setUp()
+
+    def test_init(self):
+        obj = combined.CombinedInstanceMonitorManager()
+
+        self.assertIs(obj.bus, obj.instancemonitor.bus)
+        self.assertIs(obj.bus, obj.introspectiveinstancemonitor.bus)
+        self.assertEqual(
+            [obj.instancemonitor._my_domain_event_callback,
+             obj.introspectiveinstancemonitor._my_domain_event_callback],
+            obj.bus.handlers[libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE])
+        self.assertFalse(obj.bus.read_only)
+
+    @mock.patch.object(qemu_utils, 'resetJournal')
+    @mock.patch.object(eventfilter.EventFilter, 'vir_event_filter')
+    def test_fan_out(self, mock_vir_event_filter, mock_resetJournal):
+        obj = combined.CombinedInstanceMonitorManager()
+        mock_dom = mock.Mock()
+        test_uuid = uuid.uuid4()
+        mock_dom.UUIDString.return_value = test_uuid
+
+        obj.bus._fan_out(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE)(
+            mock.Mock(), mock_dom, libvirt.VIR_DOMAIN_EVENT_STARTED, 0, None)
+
+        mock_vir_event_filter.assert_called_once_with(
+            libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+            libvirt.VIR_DOMAIN_EVENT_STARTED, 0, test_uuid)
+        mock_resetJournal.assert_called_once_with(test_uuid)
+
+    @mock.patch.object(libvirt, 'registerErrorHandler')
+    @mock.patch.object(libvirt_event_bus.LibvirtEventBus, 'run')
+    def test_main(self, mock_run, mock_registerErrorHandler):
+        obj = combined.CombinedInstanceMonitorManager()
+        obj.main()
+
+        mock_registerErrorHandler.assert_called_once_with(
+            obj.instancemonitor._err_handler, '_virt_event')
+        # A single connection for both monitors.
+        mock_run.assert_called_once_with("qemu:///system")
+
+    def test_stop(self):
+        obj = combined.CombinedInstanceMonitorManager()
+        obj.stop()
+        self.assertFalse(obj.bus.running)
@@ -12,20 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import libvirt
 import testtools
 import threading
-import time
 from unittest import mock
 import uuid
 
 import eventlet
 
+from masakarimonitors.common import libvirt_event_bus
+from masakarimonitors.common import libvirt_event_loop
+import masakarimonitors.conf
 from masakarimonitors.instancemonitor import instance
 from masakarimonitors.instancemonitor.libvirt_handler import eventfilter
 
 eventlet.monkey_patch(os=False)
 
+CONF = masakarimonitors.conf.CONF
+
+
+class StopLoop(Exception):
+    pass
+
 
 class TestInstancemonitorManager(testtools.TestCase):
 
@@ -48,7 +57,7 @@ class TestInstancemonitorManager(testtools.TestCase):
         obj = instance.InstancemonitorManager()
         exception_flag = False
         try:
-            obj._vir_event_loop_native_run()
+            obj.bus._vir_event_loop_native_run()
         except Exception:
             exception_flag = True
 
@@ -200,9 +209,9 @@ class TestInstancemonitorManager(testtools.TestCase):
     def test_stop(self):
         obj = instance.InstancemonitorManager()
         obj.stop()
-        self.assertFalse(obj.running)
+        self.assertFalse(obj.bus.running)
 
-    @mock.patch.object(time, 'sleep')
+    @mock.patch.object(libvirt_event_bus.LibvirtEventBus, '_wait_closed')
     @mock.patch.object(eventlet.greenthread, 'sleep')
     @mock.patch.object(libvirt, 'openAuth')
     @mock.patch.object(threading, 'Thread')
@@ -212,23 +221,23 @@ class TestInstancemonitorManager(testtools.TestCase):
                   mock_Thread,
                   mock_openAuth,
                   mock_greenthread_sleep,
-                  mock_time_sleep):
+                  mock_wait_closed):
 
         mock_virEventRegisterDefaultImpl.return_value = None
         mock_event_loop_thread = mock.Mock(return_value=None)
         mock_Thread.return_value = mock_event_loop_thread
         mock_vc = mock.Mock()
         mock_openAuth.return_value = mock_vc
-        mock_vc.domainEventRegisterAny.side_effect = \
-            [0, 0, 0, 0, 0, 0, 0, 0, 0]
+        mock_vc.domainEventRegisterAny.side_effect = [0, 0, 0, 0, 0, 0]
         mock_vc.setKeepAlive.return_value = None
         mock_vc.isAlive.side_effect = [1, 0]
         mock_vc.domainEventDeregisterAny.side_effect = \
-            [None, None, None, None, None, None, None, None,
-             Exception("Test exception.")]
+            [None, None, None, None, None, Exception("Test exception.")]
         mock_vc.close.return_value = None
-        mock_greenthread_sleep.return_value = None
-        mock_time_sleep.side_effect = Exception("Test exception.")
+        mock_vc.listAllDomains.return_value = []
+        mock_wait_closed.return_value = False
+        # The reconnect wait ends the test.
+        mock_greenthread_sleep.side_effect = Exception("Test exception.")
 
         obj = instance.InstancemonitorManager()
         exception_flag = False
@@ -237,7 +246,8 @@ class TestInstancemonitorManager(testtools.TestCase):
         except Exception:
             exception_flag = True
 
-        handlers_count = 9
+        # Only the events of the filter table are registered.
+        handlers_count = 6
         self.assertTrue(exception_flag)
         mock_virEventRegisterDefaultImpl.assert_called_once()
         self.assertEqual(True, mock_event_loop_thread.daemon)
@@ -245,7 +255,7 @@ class TestInstancemonitorManager(testtools.TestCase):
         mock_openAuth.assert_called_once_with(
             "qemu:///system",
             [[2, 6, 8, 5, 7, 9],
-             instance.InstancemonitorManager._connect_auth_cb,
+             libvirt_event_bus._connect_auth_cb,
              None], 1)
         self.assertEqual(
             handlers_count, mock_vc.domainEventRegisterAny.call_count)
@@ -253,4 +263,143 @@ class TestInstancemonitorManager(testtools.TestCase):
         self.assertEqual(2, mock_vc.isAlive.call_count)
         self.assertEqual(
             handlers_count, mock_vc.domainEventDeregisterAny.call_count)
+        mock_vc.registerCloseCallback.assert_called_once_with(
+            obj.bus._close_callback, None)
+        mock_vc.unregisterCloseCallback.assert_called_once()
+        mock_vc.close.assert_called_once()
+        mock_greenthread_sleep.assert_called_with(
+            libvirt_event_bus.RECONNECT_INTERVAL)
+
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(libvirt, 'openAuth')
+    @mock.patch.object(threading, 'Thread')
+    @mock.patch.object(libvirt, 'virEventRegisterDefaultImpl')
+    def test_main_connect_backoff(self,
+                                  mock_virEventRegisterDefaultImpl,
+                                  mock_Thread,
+                                  mock_openAuth,
+                                  mock_greenthread_sleep):
+        mock_openAuth.side_effect = libvirt.libvirtError("Test error.")
+        mock_greenthread_sleep.side_effect = [None] * 7 + [StopLoop()]
+
+        obj = instance.InstancemonitorManager()
+        self.assertRaises(StopLoop, obj.main)
+
+        self.assertEqual([1, 2, 4, 8, 16, 32, 60, 60],
+                         [c[0][0] for c in
+                          mock_greenthread_sleep.call_args_list])
+
+    @mock.patch.object(libvirt_event_bus.LibvirtEventBus, '_wait_closed')
+    @mock.patch.object(eventlet.greenthread, 'sleep')
+    @mock.patch.object(libvirt, 'openAuth')
+    @mock.patch.object(threading, 'Thread')
+    @mock.patch.object(libvirt, 'virEventRegisterDefaultImpl')
+    def test_main_close_callback(self,
+                                 mock_virEventRegisterDefaultImpl,
+                                 mock_Thread,
+                                 mock_openAuth,
+                                 mock_greenthread_sleep,
+                                 mock_wait_closed):
+        mock_vc = mock.Mock()
+        mock_openAuth.return_value = mock_vc
+        mock_vc.listAllDomains.return_value = []
+        mock_vc.isAlive.return_value = 1
+        obj = instance.InstancemonitorManager()
+
+        def _wait_closed(timeout):
+            obj.bus._close_callback(mock_vc, 0, None)
+            return obj.bus.connection_closed.is_set()
+
+        mock_wait_closed.side_effect = _wait_closed
+        # The reconnect wait ends the test.
+        mock_greenthread_sleep.side_effect = StopLoop()
+
+        self.assertRaises(StopLoop, obj.main)
+
+        # The connection is closed as soon as libvirt reports it.
+        mock_vc.isAlive.assert_called_once_with()
+        mock_wait_closed.assert_called_once()
         mock_vc.close.assert_called_once()
+
+    @mock.patch.object(libvirt_event_loop, 'AsyncioEventLoop')
+    @mock.patch.object(libvirt_event_bus.LibvirtEventBus,
+                       '_vir_event_loop_native_start')
+    def test_main_asyncio(self, mock_native_start, mock_AsyncioEventLoop):
+        CONF.set_override('event_loop', 'asyncio', group='libvirt')
+        self.addCleanup(CONF.clear_override, 'event_loop', group='libvirt')
+        mock_event_loop = mock_AsyncioEventLoop.return_value
+
+        obj = instance.InstancemonitorManager()
+        obj.main()
+
+        mock_native_start.assert_not_called()
+        mock_event_loop.start.assert_called_once_with()
+        mock_event_loop.run.assert_called_once()
+        coro = mock_event_loop.run.call_args[0][0]
+        self.assertTrue(asyncio.iscoroutine(coro))
+        coro.close()
+
+    def test_shared_bus(self):
+        bus = libvirt_event_bus.LibvirtEventBus()
+
+        obj = instance.InstancemonitorManager(bus=bus)
+
+        self.assertIs(bus, obj.bus)
+        self.assertEqual(
+            [obj._my_domain_event_callback],
+            bus.handlers[libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE])
+        self.assertEqual([obj._reconcile_domains], bus.connect_hooks)
+        self.assertTrue(bus.read_only)
+
+    def _make_domain(self, domain_uuid, state, reason):
+        dom = mock.Mock()
+        dom.UUIDString.return_value = domain_uuid
+        dom.state.return_value = [state, reason]
+        return dom
+
+    @mock.patch.object(eventfilter.EventFilter, 'vir_event_filter')
+    def test_reconcile_domains(self, mock_vir_event_filter):
+        mock_vc = mock.Mock()
+        mock_vc.listAllDomains.return_value = [
+            self._make_domain('uuid1', libvirt.VIR_DOMAIN_RUNNING, 1),
+            self._make_domain('uuid2', libvirt.VIR_DOMAIN_RUNNING, 1),
+            self._make_domain('uuid3', libvirt.VIR_DOMAIN_SHUTOFF,
+                              libvirt.VIR_DOMAIN_SHUTOFF_SHUTDOWN),
+            self._make_domain('uuid4', libvirt.VIR_DOMAIN_RUNNING, 1)]
+
+        obj = instance.InstancemonitorManager()
+        # The first snapshot is only recorded.
+        obj._reconcile_domains(mock_vc)
+        mock_vir_event_filter.assert_not_called()
+
+        # uuid4 was started after the first snapshot.
+        mock_conn, mock_dom, mock_opaque, test_uuid = \
+            self._make_callback_params()
+        obj._my_domain_event_callback(
+            mock_conn, mock_dom, libvirt.VIR_DOMAIN_EVENT_STARTED, 0,
+            mock_opaque)
+        mock_vir_event_filter.reset_mock()
+
+        mock_vc.listAllDomains.return_value = [
+            self._make_domain('uuid1', libvirt.VIR_DOMAIN_SHUTOFF,
+                              libvirt.VIR_DOMAIN_SHUTOFF_CRASHED),
+            self._make_domain('uuid2', libvirt.VIR_DOMAIN_PAUSED,
+                              libvirt.VIR_DOMAIN_PAUSED_IOERROR),
+            self._make_domain('uuid3', libvirt.VIR_DOMAIN_SHUTOFF,
+                              libvirt.VIR_DOMAIN_SHUTOFF_SHUTDOWN),
+            self._make_domain(test_uuid, libvirt.VIR_DOMAIN_SHUTOFF,
+                              libvirt.VIR_DOMAIN_SHUTOFF_DESTROYED)]
+        obj._reconcile_domains(mock_vc)
+
+        self.assertEqual(
+            [mock.call(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                       libvirt.VIR_DOMAIN_EVENT_STOPPED,
+                       libvirt.VIR_DOMAIN_EVENT_STOPPED_FAILED, 'uuid1'),
+             mock.call(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                       libvirt.VIR_DOMAIN_EVENT_SUSPENDED,
+                       libvirt.VIR_DOMAIN_EVENT_SUSPENDED_IOERROR, 'uuid2'),
+             mock.call(libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                       libvirt.VIR_DOMAIN_EVENT_STOPPED,
+                       libvirt.VIR_DOMAIN_EVENT_STOPPED_DESTROYED,
+                       test_uuid)],
+            mock_vir_event_filter.call_args_list)
@@ -17,6 +17,7 @@ import libvirt
 import testtools
 from unittest import mock
 
+from masakarimonitors.common import libvirt_event_bus
 from masakarimonitors.introspectiveinstancemonitor import instance
 
 eventlet.monkey_patch(os=False)
@@ -34,9 +35,29 @@ class TestMonitorManager(testtools.TestCase):
         obj = instance.IntrospectiveInstanceMonitorManager()
         exception_flag = False
         try:
-            obj._vir_event_loop_native_run()
+            obj.bus._vir_event_loop_native_run()
         except Exception:
             exception_flag = True
 
         self.assertTrue(exception_flag)
         mock_virEventRunDefaultImpl.assert_called_once()
+
+    def test_shared_bus(self):
+        bus = libvirt_event_bus.LibvirtEventBus()
+
+        obj = instance.IntrospectiveInstanceMonitorManager(bus=bus)
+
+        self.assertIs(bus, obj.bus)
+        self.assertIs(bus, obj.TG.qemuGA.bus)
+        self.assertEqual(
+            [obj._my_domain_event_reboot_callback],
+            bus.handlers[libvirt.VIR_DOMAIN_EVENT_ID_REBOOT])
+        # The guest agent commands need a read-write connection.
+        self.assertFalse(bus.read_only)
+
+    @mock.patch.object(libvirt_event_bus.LibvirtEventBus, 'run')
+    def test_main(self, mock_run):
+        obj = instance.IntrospectiveInstanceMonitorManager()
+        obj.main()
+
+        mock_run.assert_called_once_with("qemu:///system")
@@ -112,3 +112,21 @@ class TestQemuUtils(testtools.TestCase):
         obj._reset_journal(event_id, event_type, detail, domain_uuid)
 
         mock_resetJournal.assert_called_once_with(domain_uuid)
+
+    @mock.patch.object(libvirt, 'open')
+    def test_checkGuests_bus(self, mock_open):
+        mock_bus = mock.Mock()
+        mock_conn = mock_bus.get_connection.return_value
+        mock_conn.listDomainsID.return_value = []
+
+        obj = qemu_utils.QemuGuestAgent(mock_bus)
+        obj.checkGuests()
+
+        # The connection of the bus is used.
+        mock_open.assert_not_called()
+        mock_conn.listDomainsID.assert_called_once_with()
+
+        mock_bus.get_connection.return_value = None
+        obj.checkGuests()
+
+        mock_open.assert_not_called()
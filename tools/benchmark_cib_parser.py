@@ -0,0 +1,161 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the hostmonitor cib and crm_mon xml parser backends.
+
+Synthetic cib and crm_mon xml documents, in both the legacy 'crm_mon -X'
+and the 'crm_mon --output-as=xml' formats, are generated for clusters of
+various sizes and parsed with the etree and lxml backends. Every
+measurement runs in a fresh subprocess so that the peak resident memory
+(ru_maxrss) of one parse is not hidden by an earlier one.
+
+Usage::
+
+    python tools/benchmark_cib_parser.py [--nodes 10,100,1000,5000]
+                                         [--repeat 5]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+from masakarimonitors.hostmonitor.host_handler import parse_cib_xml
+from masakarimonitors.hostmonitor.host_handler import parse_crmmon_xml
+
+PARSERS = {
+    ('cib', 'etree'): parse_cib_xml.ParseCibXml,
+    ('cib', 'lxml'): parse_cib_xml.StreamParseCibXml,
+    ('crm_mon', 'etree'): parse_crmmon_xml.ParseCrmMonXml,
+    ('crm_mon', 'lxml'): parse_crmmon_xml.StreamParseCrmMonXml,
+    ('pacemaker-result', 'etree'): parse_crmmon_xml.ParseCrmMonXml,
+    ('pacemaker-result', 'lxml'): parse_crmmon_xml.StreamParseCrmMonXml,
+}
+
+# Number of resource operation history entries per node, as recorded in
+# the lrm section of a node_state by pacemaker.
+LRM_RESOURCES = 5
+
+
+def make_cib_xml(nodes):
+    parts = ['<cib admin_epoch="0" epoch="10" num_updates="6"'
+             ' have-quorum="1"><configuration><crm_config/><nodes>']
+    for i in range(nodes):
+        parts.append('<node id="%d" uname="node%d"/>' % (i, i))
+    parts.append('</nodes><resources>')
+    for i in range(nodes):
+        parts.append(
+            '<primitive id="stonith-node%d" class="stonith"'
+            ' type="external/ipmi">'
+            '<instance_attributes id="stonith-node%d-ia">'
+            '<nvpair name="hostname" value="node%d"/>'
+            '<nvpair name="ipaddr" value="10.0.%d.%d"/>'
+            '<nvpair name="userid" value="admin"/>'
+            '<nvpair name="passwd" value="password"/>'
+            '<nvpair name="interface" value="lanplus"/>'
+            '</instance_attributes></primitive>'
+            % (i, i, i, i // 256, i % 256))
+    parts.append('</resources><constraints/></configuration><status>')
+    for i in range(nodes):
+        parts.append('<node_state id="%d" uname="node%d" crmd="online"'
+                     ' in_ccm="true" join="member" expected="member">'
+                     '<lrm id="%d"><lrm_resources>' % (i, i, i))
+        for j in range(LRM_RESOURCES):
+            parts.append('<lrm_resource id="rsc%d" type="Dummy">'
+                         '<lrm_rsc_op id="rsc%d_monitor_0"'
+                         ' operation="monitor" rc-code="7"'
+                         ' transition-key="%d:%d:7:0"/>'
+                         '</lrm_resource>' % (j, j, i, j))
+        parts.append('</lrm_resources></lrm>'
+                     '<transient_attributes id="%d"/></node_state>' % i)
+    parts.append('</status></cib>')
+    return ''.join(parts)
+
+
+def make_crmmon_xml(nodes, root='crm_mon'):
+    # 'crm_mon -X' emits a crm_mon root, 'crm_mon --output-as=xml' a
+    # pacemaker-result root.
+    parts = ['<?xml version="1.0"?><%s version="2.0.3"><summary>'
+             '<stack type="corosync"/>'
+             '<current_dc present="true" name="node0" id="0"'
+             ' with_quorum="true"/>'
+             '<nodes_configured number="%d"/></summary><nodes>'
+             % (root, nodes)]
+    for i in range(nodes):
+        parts.append('<node name="node%d" id="%d" online="true"'
+                     ' standby="false" maintenance="false" pending="false"'
+                     ' unclean="false" shutdown="false" expected_up="true"'
+                     ' is_dc="false" resources_running="0"'
+                     ' type="remote"/>' % (i, i))
+    parts.append('</nodes></%s>' % root)
+    return ''.join(parts)
+
+
+def _run(kind, backend, nodes, repeat, queue):
+    if kind == 'cib':
+        xml = make_cib_xml(nodes)
+    else:
+        xml = make_crmmon_xml(nodes, root=kind)
+    parser = PARSERS[(kind, backend)]()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if kind == 'cib':
+            parser.set_cib_xml(xml)
+            parser.have_quorum()
+        else:
+            parser.set_crmmon_xml(xml)
+            parser.has_quorum()
+        states = parser.get_node_state_tag_list()
+        latencies.append(time.perf_counter() - start)
+        assert len(states) == nodes
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((len(xml), min(latencies), peak - baseline))
+
+
+def measure(kind, backend, nodes, repeat):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_run, args=(kind, backend, nodes, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', default='10,100,1000,5000',
+                        help='Comma separated cluster sizes.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of parses per measurement. The best'
+                             ' latency is reported.')
+    args = parser.parse_args()
+
+    print('%-16s %-6s %6s %10s %12s %14s' % (
+        'xml', 'parser', 'nodes', 'size(KiB)', 'latency(ms)',
+        'peak rss(KiB)'))
+    for nodes in [int(n) for n in args.nodes.split(',')]:
+        for kind in ('cib', 'crm_mon', 'pacemaker-result'):
+            for backend in ('etree', 'lxml'):
+                size, latency, rss = measure(kind, backend, nodes,
+                                             args.repeat)
+                print('%-16s %-6s %6d %10d %12.2f %14d' % (
+                    kind, backend, nodes, size // 1024, latency * 1000,
+                    rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the instancemonitor libvirt event filter.
+
+Matched and unmatched libvirt events are passed through the compiled
+lookup of EventFilter.vir_event_filter and through the nested table
+lookup with an eagerly formatted debug message it replaced, with the
+callback pool stubbed out. The number of events filtered per second is
+reported.
+
+Usage::
+
+    python tools/benchmark_event_filter.py [--events 200000] [--debug]
+"""
+
+import argparse
+import logging
+import socket
+import time
+import uuid
+
+import libvirt
+from oslo_utils import timeutils
+
+from masakarimonitors.instancemonitor.libvirt_handler import eventfilter
+from masakarimonitors.instancemonitor.libvirt_handler \
+    import eventfilter_table as evft
+
+LOG = logging.getLogger(eventfilter.__name__)
+
+EVENTS = {
+    'matched': (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                libvirt.VIR_DOMAIN_EVENT_STOPPED,
+                libvirt.VIR_DOMAIN_EVENT_STOPPED_FAILED),
+    'unmatched': (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                  libvirt.VIR_DOMAIN_EVENT_STARTED,
+                  libvirt.VIR_DOMAIN_EVENT_STARTED_BOOTED),
+}
+
+
+def submit(domain_uuid, func, *args):
+    pass
+
+
+def legacy_filter(evf, eventID, eventType, detail, uuID):
+    noticeType = 'VM'
+    hostname = socket.gethostname()
+    currentTime = timeutils.utcnow()
+    msg = "libvirt Event Received.type = %s \
+        hostname = %s uuid = %s time = %s eventID = %d eventType = %d \
+        detail = %d" % (
+        noticeType,
+        hostname, uuID, currentTime, eventID,
+        eventType, detail)
+    LOG.debug(msg)
+    try:
+        if detail in evft.event_filter_dic[eventID][eventType]:
+            LOG.debug("Event Filter Matched.")
+            eventID_val = evft.eventID_dic[eventID]
+            detail_val = evft.detail_dic[eventID][eventType][detail]
+            evf.pool.submit(uuID, None, eventID_val, detail_val, uuID,
+                            noticeType, hostname, currentTime)
+        else:
+            LOG.debug("Event Filter Unmatched.")
+    except KeyError:
+        LOG.debug("virEventFilter KeyError")
+
+
+def compiled_filter(evf, eventID, eventType, detail, uuID):
+    evf.vir_event_filter(eventID, eventType, detail, uuID)
+
+
+def measure(func, evf, event, events):
+    uuID = str(uuid.uuid4())
+    start = time.perf_counter()
+    for _ in range(events):
+        func(evf, event[0], event[1], event[2], uuID)
+    return events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000,
+                        help='Number of events per measurement.')
+    parser.add_argument('--debug', action='store_true',
+                        help='Enable the debug logs, written to nowhere.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        handlers=[logging.NullHandler()])
+    evf = eventfilter.EventFilter()
+
+    print('%-10s %-9s %14s' % ('filter', 'event', 'events/s'))
+    evf.pool.submit = submit
+    for name, func in (('legacy', legacy_filter),
+                       ('compiled', compiled_filter)):
+        for kind, event in EVENTS.items():
+            print('%-10s %-9s %14.0f' % (
+                name, kind, measure(func, evf, event, args.events)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the notification spool.
+
+Host down notifications are appended to a spool in a temporary directory
+and acknowledged, as during a notification storm, for various fsync
+intervals. The throughput of append and ack, and the time to load a spool
+left with unacknowledged notifications, are reported.
+
+Usage::
+
+    python tools/benchmark_notification_spool.py [--events 10000]
+                                                 [--fsync-intervals 0,0.1]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import eventlet
+from oslo_utils import timeutils
+
+from masakarimonitors.ha import spool
+
+SEGMENT_SIZE = 1048576
+
+
+def make_event(i):
+    return {
+        'notification': {
+            'type': 'COMPUTE_HOST',
+            'hostname': 'compute-node%d' % i,
+            'generated_time': timeutils.utcnow(),
+            'payload': {
+                'event': 'STOPPED',
+                'cluster_status': 'OFFLINE',
+                'host_status': 'NORMAL'
+            }
+        }
+    }
+
+
+def measure(events, fsync_interval):
+    path = tempfile.mkdtemp()
+    try:
+        obj = spool.NotificationSpool(path, SEGMENT_SIZE, fsync_interval)
+        obj.load()
+        start = time.perf_counter()
+        entries = []
+        for i in range(events):
+            entries.append(obj.append(12, 10, make_event(i)))
+            # Let the fsync timer run as the monitors would.
+            eventlet.sleep(0)
+        append = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # Half of the notifications are left to replay.
+        for entry in entries[::2]:
+            obj.ack(entry)
+            eventlet.sleep(0)
+        obj.sync()
+        ack = time.perf_counter() - start
+        obj.close()
+
+        start = time.perf_counter()
+        obj = spool.NotificationSpool(path, SEGMENT_SIZE, fsync_interval)
+        pending = obj.load()
+        load = time.perf_counter() - start
+        obj.close()
+        assert len(pending) == events // 2
+    finally:
+        shutil.rmtree(path)
+    return events / append, (events - events // 2) / ack, load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=10000,
+                        help='Number of notifications appended.')
+    parser.add_argument('--fsync-intervals', default='0,0.01,0.1',
+                        help='Comma separated fsync intervals in seconds.')
+    args = parser.parse_args()
+
+    print('%-14s %8s %14s %14s %12s' % (
+        'fsync interval', 'events', 'append(ev/s)', 'ack(ev/s)',
+        'load(ms)'))
+    for interval in [float(i) for i in args.fsync_intervals.split(',')]:
+        append, ack, load = measure(args.events, interval)
+        print('%-14s %8d %14d %14d %12.2f' % (
+            interval, args.events, append, ack, load * 1000))
+
+
+if __name__ == '__main__':
+    main()